@@ -2,17 +2,279 @@ from flask import request, jsonify
 from Crypto.PublicKey import ECC
 from Crypto.Signature import DSS
 from Crypto.Hash import SHA256
+from Crypto.Protocol.DH import key_agreement
+from Crypto.Protocol.KDF import HKDF
+from collections import OrderedDict
+from urllib.parse import urlsplit
+import hashlib
+import hmac
+import json
+import os
 import random
 import string
+import threading
+import time
+import requests
 from peers import known_peers, node_info
 
-challenges = {}
+# --- Challenge table (bounded, expiring) ---
+MAX_PENDING_CHALLENGES = 1024
+CHALLENGE_TTL = 30  # seconds
+
+# --- Session layer ---
+SESSION_TTL = 600  # seconds
+SESSION_REFRESH_MARGIN = 60  # re-authenticate this long before a session expires
+MAX_SESSIONS = 4096
+MAC_CLOCK_SKEW = 30  # seconds a MAC timestamp may deviate from our clock
+
+SESSION_HEADER = 'X-DSEF-Session'
+TIMESTAMP_HEADER = 'X-DSEF-Timestamp'
+NONCE_HEADER = 'X-DSEF-Nonce'
+MAC_HEADER = 'X-DSEF-MAC'
+
+# identifier -> (peer_key, challenge, created_at), oldest first
+challenges = OrderedDict()
+challenges_lock = threading.Lock()
+
+# Server side: session_id -> {'peer': identifier, 'key': bytes, 'expires_at': float}
+sessions = OrderedDict()
+sessions_lock = threading.Lock()
+
+# (session_id, nonce) -> time after which its timestamp is stale anyway, oldest first. A MAC'd request is
+# accepted once: a replay within the MAC_CLOCK_SKEW window carries a nonce already seen.
+seen_nonces = OrderedDict()
+seen_nonces_lock = threading.Lock()
+
+# Client side: peer identifier -> {'session_id': str, 'key': bytes, 'expires_at': float}
+peer_sessions = {}
+peer_sessions_lock = threading.Lock()
+
+# identifier -> PEM of the public key the peer first authenticated with. Later registrations under the same
+# ip:port must present that key, so nobody can take over another peer's identity (and its sessions).
+pinned_keys = {}
+pinned_keys_lock = threading.Lock()
 
 
 def generate_challenge():
     return ''.join(random.choices(string.ascii_letters + string.digits, k=16))
 
 
+def _expire_challenges(now):
+    while challenges:
+        identifier, (_, _, created_at) = next(iter(challenges.items()))
+        if now - created_at <= CHALLENGE_TTL:
+            break
+        challenges.popitem(last=False)
+
+
+def store_challenge(identifier, peer_key, challenge):
+    now = time.time()
+    with challenges_lock:
+        _expire_challenges(now)
+        challenges.pop(identifier, None)
+        while len(challenges) >= MAX_PENDING_CHALLENGES:
+            challenges.popitem(last=False)
+        challenges[identifier] = (peer_key, challenge, now)
+
+
+def pop_challenge(identifier):
+    """Remove and return (peer_key, challenge) for a peer, or (None, None) if absent or expired."""
+    with challenges_lock:
+        _expire_challenges(time.time())
+        entry = challenges.pop(identifier, None)
+    if not entry:
+        return None, None
+    return entry[0], entry[1]
+
+
+def pin_peer_key(identifier, peer_key):
+    """Pin a peer's key on first authentication; False if a different key is already pinned."""
+    pem = peer_key.export_key(format='PEM')
+    with pinned_keys_lock:
+        return pinned_keys.setdefault(identifier, pem) == pem
+
+
+def peer_public_key(identifier):
+    """The key a peer authenticated with (ECC), falling back to its peer table entry; None if unknown."""
+    with pinned_keys_lock:
+        pem = pinned_keys.get(identifier)
+    pem = pem or (known_peers.get(identifier) or {}).get('public_key')
+    return ECC.import_key(pem) if pem else None
+
+
+def _derive_session_key(session_id, **keys):
+    """ECDH between the peer's static key and a per-session ephemeral key, stretched with HKDF."""
+    kdf = lambda z: HKDF(z, 32, session_id.encode('utf-8'), SHA256)
+    return key_agreement(kdf=kdf, **keys)
+
+
+def create_session(identifier, peer_key):
+    """
+    Issue a session for an authenticated peer.
+    Returns (session_id, ephemeral public key PEM); the symmetric key itself never leaves either node.
+    """
+    session_id = os.urandom(16).hex()
+    eph_key = ECC.generate(curve='P-256')
+    session_key = _derive_session_key(session_id, static_pub=peer_key, eph_priv=eph_key)
+    now = time.time()
+    with sessions_lock:
+        while sessions:
+            oldest_id, oldest = next(iter(sessions.items()))
+            if oldest['expires_at'] > now and len(sessions) < MAX_SESSIONS:
+                break
+            sessions.popitem(last=False)
+        sessions[session_id] = {'peer': identifier, 'key': session_key, 'expires_at': now + SESSION_TTL}
+    return session_id, eph_key.public_key().export_key(format='PEM')
+
+
+def compute_mac(key, timestamp, nonce, method, path, body):
+    """MAC over a request; path includes the query string, if any (e.g. /chord/lookup_metadata?key=1)."""
+    msg = f"{timestamp}\n{nonce}\n{method.upper()}\n{path}\n".encode('utf-8') + body
+    return hmac.new(key, msg, hashlib.sha256).hexdigest()
+
+
+def _first_use(session_id, nonce, stale_at):
+    """Record a request nonce; False if this session already used it (a replayed request)."""
+    now = time.time()
+    with seen_nonces_lock:
+        while seen_nonces:
+            oldest, oldest_stale_at = next(iter(seen_nonces.items()))
+            if oldest_stale_at > now:
+                break
+            seen_nonces.popitem(last=False)
+        if (session_id, nonce) in seen_nonces:
+            return False
+        seen_nonces[(session_id, nonce)] = stale_at
+        return True
+
+
+def verify_session_request(expected_peer=None):
+    """
+    Check the session MAC headers of the current Flask request.
+    Returns the authenticated peer identifier ("ip:port"), or None if the MAC is missing, stale, invalid or
+    replayed, or if the session belongs to a different peer than expected_peer.
+    """
+    session_id = request.headers.get(SESSION_HEADER)
+    timestamp = request.headers.get(TIMESTAMP_HEADER)
+    nonce = request.headers.get(NONCE_HEADER)
+    mac = request.headers.get(MAC_HEADER)
+    if not session_id or not timestamp or not nonce or not mac:
+        return None
+    try:
+        sent_at = float(timestamp)
+    except ValueError:
+        return None
+    if not abs(time.time() - sent_at) <= MAC_CLOCK_SKEW:
+        return None
+    with sessions_lock:
+        session = sessions.get(session_id)
+    if not session or session['expires_at'] < time.time():
+        return None
+    path = request.path
+    if request.query_string:
+        path += '?' + request.query_string.decode('latin-1')
+    expected = compute_mac(session['key'], timestamp, nonce, request.method, path, request.get_data())
+    if not hmac.compare_digest(expected, mac):
+        return None
+    if expected_peer is not None and session['peer'] != expected_peer:
+        return None
+    # Only a genuine MAC claims its nonce, so forged requests cannot fill the cache
+    if not _first_use(session_id, nonce, sent_at + MAC_CLOCK_SKEW):
+        return None
+    return session['peer']
+
+
+def establish_session(base_url, **kwargs):
+    """Run /register + /authenticate against a peer and cache the resulting session."""
+    import peers
+    peers.ensure_key_pair()
+    key_pair = peers.key_pair
+    payload = {
+        "ip": node_info["ip"],
+        "port": node_info["port"],
+        "promised_capacity": node_info.get("promised_capacity"),
+        "public_key": key_pair.public_key().export_key(format='PEM')
+    }
+    kwargs.setdefault('timeout', 5)
+    response = requests.post(base_url + "/register", json=payload, **kwargs)
+    if response.status_code != 200:
+        return None
+    challenge = response.json().get('challenge')
+    h = SHA256.new(challenge.encode('utf-8'))
+    signature = DSS.new(key_pair, 'fips-186-3').sign(h)
+    auth_payload = {
+        "ip": node_info["ip"],
+        "port": node_info["port"],
+        "promised_capacity": node_info.get("promised_capacity"),
+        "signature": signature.hex()
+    }
+    response = requests.post(base_url + "/authenticate", json=auth_payload, **kwargs)
+    if response.status_code != 200:
+        return None
+    data = response.json()
+    if 'session_id' not in data:
+        return None
+    eph_pub = ECC.import_key(data['ephemeral_public_key'])
+    session = {
+        'session_id': data['session_id'],
+        'key': _derive_session_key(data['session_id'], static_priv=key_pair, eph_pub=eph_pub),
+        'expires_at': time.time() + data.get('expires_in', SESSION_TTL),
+    }
+    with peer_sessions_lock:
+        peer_sessions[urlsplit(base_url).netloc] = session
+    return session
+
+
+def get_session(base_url, **kwargs):
+    """Return a cached, unexpired session with the peer at base_url, authenticating if needed."""
+    peer_id = urlsplit(base_url).netloc
+    with peer_sessions_lock:
+        session = peer_sessions.get(peer_id)
+    if session and session['expires_at'] - SESSION_REFRESH_MARGIN > time.time():
+        return session
+    return establish_session(base_url, **kwargs)
+
+
+def drop_session(base_url):
+    with peer_sessions_lock:
+        peer_sessions.pop(urlsplit(base_url).netloc, None)
+
+
+def session_post(url, payload, content_type='application/json', **kwargs):
+    """
+    POST a payload to a peer, authenticated with an HMAC under our session with that peer.
+    payload is JSON-encoded unless it is already bytes, in which case it is sent as-is with content_type.
+    A rejected session (401) is re-established once before giving up.
+    """
+    parts = urlsplit(url)
+    base_url = f"{parts.scheme}://{parts.netloc}"
+    path = (parts.path or '/') + (f"?{parts.query}" if parts.query else '')
+    if isinstance(payload, bytes):
+        body = payload
+    else:
+        body = json.dumps(payload).encode('utf-8')
+        content_type = 'application/json'
+    response = None
+    for _ in range(2):
+        session = get_session(base_url, **kwargs)
+        if session is None:
+            raise RuntimeError(f"Could not establish session with {parts.netloc}")
+        timestamp = f"{time.time():.3f}"
+        nonce = os.urandom(16).hex()
+        headers = {
+            'Content-Type': content_type,
+            SESSION_HEADER: session['session_id'],
+            TIMESTAMP_HEADER: timestamp,
+            NONCE_HEADER: nonce,
+            MAC_HEADER: compute_mac(session['key'], timestamp, nonce, 'POST', path, body),
+        }
+        response = requests.post(url, data=body, headers=headers, **kwargs)
+        if response.status_code != 401:
+            return response
+        drop_session(base_url)
+    return response
+
+
 def register_routes(app):
     @app.route('/register', methods=['POST'])
     def register():
@@ -22,8 +284,13 @@ def register_routes(app):
         print(f"[AUTH] Registration request from {identifier}")
 
         peer_key = ECC.import_key(data["public_key"])
+        with pinned_keys_lock:
+            pinned = pinned_keys.get(identifier)
+        if pinned is not None and pinned != peer_key.export_key(format='PEM'):
+            print(f"[AUTH] Rejected registration for {identifier}: key differs from the pinned key")
+            return jsonify({"error": "A different key is pinned for this peer"}), 409
         challenge = generate_challenge()
-        challenges[identifier] = peer_key, challenge
+        store_challenge(identifier, peer_key, challenge)
 
         print("[AUTH] Public Key received and challenge generated!")
         print(f"[AUTH] Challenge for {identifier}: {challenge}")
@@ -34,7 +301,7 @@ def register_routes(app):
     def authenticate():
         data = request.json
         identifier = f"{data['ip']}:{data['port']}"
-        peer_key, challenge = challenges.get(identifier, (None, None))
+        peer_key, challenge = pop_challenge(identifier)
 
         if not peer_key:
             print("[ERROR] No challenge found for peer!")
@@ -45,14 +312,26 @@ def register_routes(app):
 
         try:
             verifier.verify(h, bytes.fromhex(data['signature']))
-            known_peers[identifier] = {
-                "ip": data['ip'],
-                "port": data['port'],
-                "promised_capacity": data['promised_capacity'],
-                "current_load": 0
-            }
-            print(f"[VERIFY] Peer {identifier} authenticated successfully!")
-            return {"status": "Authenticated"}
         except Exception as e:
             print(f"[ERROR] Signature invalid for {identifier}")
-            return {"error": "Authentication Failed"}, 403
\ No newline at end of file
+            return {"error": "Authentication Failed"}, 403
+        if not pin_peer_key(identifier, peer_key):
+            return {"error": "A different key is pinned for this peer"}, 409
+
+        peer = dict(known_peers.get(identifier, {}))
+        peer.update({
+            "ip": data['ip'],
+            "port": data['port'],
+            "promised_capacity": data['promised_capacity'],
+            "public_key": peer_key.export_key(format='PEM')
+        })
+        peer.setdefault("current_load", 0)
+        known_peers[identifier] = peer
+        session_id, eph_public_key = create_session(identifier, peer_key)
+        print(f"[VERIFY] Peer {identifier} authenticated successfully!")
+        return {
+            "status": "Authenticated",
+            "session_id": session_id,
+            "ephemeral_public_key": eph_public_key,
+            "expires_in": SESSION_TTL
+        }
@@ -0,0 +1,206 @@
+import hashlib
+import json
+import os
+import platform
+import socket
+import time
+import psutil
+from datetime import datetime, timezone
+
+CAPACITY_CACHE_FILE = os.path.join(os.path.dirname(__file__), 'capacity_cache.json')
+CGROUP_ROOT = '/sys/fs/cgroup'
+
+# Micro-benchmark of the ESP kernels: loads span what the ESP simulator sends (100-1000 units)
+BENCHMARK_KERNELS = ('prime', 'matrix')
+BENCHMARK_LOADS = (100, 550, 1000)
+BENCHMARK_BUDGET_S = 0.5  # per kernel; long enough to span several CFS quota periods
+CAPACITY_WINDOW_S = 1.0  # promised_capacity = load units completed within this window
+
+capacity_profile = {}
+
+
+def _read_first_line(path):
+    try:
+        with open(path) as f:
+            return f.readline().strip()
+    except OSError:
+        return None
+
+
+def _cgroup_paths(controller):
+    """Candidate directories for a controller: the process's own cgroup first, then the mount root."""
+    paths = []
+    try:
+        with open('/proc/self/cgroup') as f:
+            lines = f.read().splitlines()
+    except OSError:
+        lines = []
+    for line in lines:
+        parts = line.split(':', 2)
+        if len(parts) != 3:
+            continue
+        _, controllers, rel = parts
+        if controllers == '':  # cgroup v2 unified hierarchy
+            paths.append(os.path.join(CGROUP_ROOT, rel.lstrip('/')))
+        elif controller in controllers.split(','):
+            for name in (controllers, controller):
+                paths.append(os.path.join(CGROUP_ROOT, name, rel.lstrip('/')))
+                paths.append(os.path.join(CGROUP_ROOT, name))
+    paths.append(CGROUP_ROOT)
+    seen = []
+    for p in paths:
+        if p not in seen:
+            seen.append(p)
+    return seen
+
+
+def _read_cgroup_file(controller, *names):
+    for base in _cgroup_paths(controller):
+        for name in names:
+            value = _read_first_line(os.path.join(base, name))
+            if value is not None:
+                return name, value
+    return None, None
+
+
+def read_cgroup_limits():
+    """
+    CPU quota (in cores) and memory limit (bytes) imposed by cgroup v2 or v1, or None where unlimited.
+    """
+    cpu_quota_cores = None
+    _, value = _read_cgroup_file('cpu', 'cpu.max')
+    if value:
+        quota, _, period = value.partition(' ')
+        if quota != 'max' and period:
+            cpu_quota_cores = int(quota) / int(period)
+    else:
+        _, quota = _read_cgroup_file('cpu', 'cpu.cfs_quota_us')
+        _, period = _read_cgroup_file('cpu', 'cpu.cfs_period_us')
+        if quota and period and int(quota) > 0:
+            cpu_quota_cores = int(quota) / int(period)
+
+    memory_limit_bytes = None
+    _, value = _read_cgroup_file('memory', 'memory.max', 'memory.limit_in_bytes')
+    if value and value != 'max':
+        limit = int(value)
+        # v1 reports "unlimited" as a huge page-aligned number
+        if limit < psutil.virtual_memory().total:
+            memory_limit_bytes = limit
+    return {'cpu_quota_cores': cpu_quota_cores, 'memory_limit_bytes': memory_limit_bytes}
+
+
+def read_cgroup_memory_usage():
+    """Current cgroup memory usage in bytes, or None if not available."""
+    _, value = _read_cgroup_file('memory', 'memory.current', 'memory.usage_in_bytes')
+    return int(value) if value and value.isdigit() else None
+
+
+def effective_cpu_cores(limits):
+    try:
+        cores = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cores = psutil.cpu_count(logical=True) or 1
+    if limits.get('cpu_quota_cores'):
+        cores = min(cores, limits['cpu_quota_cores'])
+    return round(cores, 2)
+
+
+def effective_memory_gb(limits):
+    total = psutil.virtual_memory().total
+    if limits.get('memory_limit_bytes'):
+        total = min(total, limits['memory_limit_bytes'])
+    return round(total / (1024 ** 3), 2)
+
+
+def machine_fingerprint(limits):
+    """Identifies hardware, limits and interpreter; any change invalidates the cached benchmark."""
+    cpu_freq = psutil.cpu_freq()
+    parts = [
+        socket.gethostname(),
+        platform.machine(),
+        platform.processor(),
+        platform.python_implementation(),
+        platform.python_version(),
+        str(psutil.cpu_count(logical=True)),
+        str(round(cpu_freq.max) if cpu_freq else None),
+        str(psutil.virtual_memory().total),
+        json.dumps(limits, sort_keys=True),
+    ]
+    return hashlib.sha256('|'.join(parts).encode('utf-8')).hexdigest()[:16]
+
+
+def benchmark_kernel(task_type, budget_s=BENCHMARK_BUDGET_S):
+    """Throughput of one ESP kernel in load units per second."""
+    from esp_handler import run_esp_kernel
+    units = 0
+    start = time.perf_counter()
+    elapsed = 0.0
+    while elapsed < budget_s:
+        for load in BENCHMARK_LOADS:
+            run_esp_kernel(task_type, load)
+            units += load
+        elapsed = time.perf_counter() - start
+    return round(units / elapsed, 1)
+
+
+def run_benchmark():
+    # ESP requests run on Flask threads that share the GIL, so single-thread throughput is node throughput;
+    # a CPU quota below one core already shows up as throttling during the run
+    return {task_type: benchmark_kernel(task_type) for task_type in BENCHMARK_KERNELS}
+
+
+def _load_cache():
+    try:
+        with open(CAPACITY_CACHE_FILE) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_cache(cache):
+    tmp_path = CAPACITY_CACHE_FILE + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(cache, f, indent=2)
+    os.replace(tmp_path, CAPACITY_CACHE_FILE)
+
+
+def calibrate_capacity(force=False):
+    """
+    Build the node's capacity profile: cgroup-aware cores and memory plus measured ESP kernel throughput.
+    The profile is cached per machine fingerprint, so warm restarts skip the benchmark unless force is set.
+    """
+    global capacity_profile
+    limits = read_cgroup_limits()
+    fingerprint = machine_fingerprint(limits)
+    cache = _load_cache()
+    profile = None if force else cache.get(fingerprint)
+    if profile is None:
+        print("[CAPACITY] Running ESP kernel micro-benchmark...")
+        throughput = run_benchmark()
+        # Conservative: the slowest kernel bounds what we can promise per window
+        capacity_score = int(min(throughput.values()) * CAPACITY_WINDOW_S)
+        profile = {
+            'fingerprint': fingerprint,
+            'cgroup_limits': limits,
+            'cpu_cores_effective': effective_cpu_cores(limits),
+            'memory_limit_gb': effective_memory_gb(limits),
+            'throughput_lps': throughput,
+            'capacity_window_s': CAPACITY_WINDOW_S,
+            'capacity_score': capacity_score,
+            'calibrated_at_utc': datetime.utcnow().replace(tzinfo=timezone.utc).isoformat(),
+        }
+        cache[fingerprint] = profile
+        try:
+            _save_cache(cache)
+        except OSError as e:
+            print(f"[CAPACITY] Could not write capacity cache: {e}")
+    else:
+        print(f"[CAPACITY] Using cached calibration for fingerprint {fingerprint}")
+    capacity_profile = profile
+    print(f"[CAPACITY] cores={profile['cpu_cores_effective']} mem={profile['memory_limit_gb']}GB "
+          f"throughput={profile['throughput_lps']} capacity={profile['capacity_score']}")
+    return profile
+
+
+def get_capacity_profile():
+    return capacity_profile
@@ -4,7 +4,8 @@ import time
 import random
 from peers import node_info, known_peers, get_signed_resource_offer, key_pair
 import requests
-from offer_manager import verify_resource_offer
+from offer_manager import verify_resource_offer, offer_to_wire, offer_from_wire
+from codec import pack, unpack, MSGPACK_MIMETYPE
 
 # Chord configuration
 CHORD_BITS = 160 
@@ -196,13 +197,14 @@ def notify_successor():
     """Notify our successor that we might be its predecessor"""
     if successor and successor["chord_id"] != node_info["chord_id"]:
         try:
+            from auth import session_post
             url = f"https://{successor['ip']}:{successor['port']}/chord/notify"
             payload = {
                 "ip": node_info["ip"],
                 "port": node_info["port"],
                 "chord_id": node_info["chord_id"]
             }
-            requests.post(url, json=payload, timeout=3, verify=False)
+            session_post(url, payload, timeout=3, verify=False)
         except Exception as e:
             print(f"[CHORD] Failed to notify successor: {e}")
 
@@ -316,17 +318,15 @@ def fix_fingers():
         print(f"[CHORD] Error fixing finger {i}: {e}")
 
 def advertise_resource_offer_to_peers():
-    """Send our current resource offer to all known peers (could be called during stabilization/gossip)."""
+    """Push our current signed offer to all known peers so their local offer views stay warm."""
     import requests
-    from peers import known_peers, node_info
-    offer = get_signed_resource_offer()
-    for peer_id, peer in known_peers.items():
+    from peers import known_peers, node_info, get_signed_resource_offer_wire
+    wire = get_signed_resource_offer_wire()
+    for peer_id, peer in list(known_peers.items()):
         if peer_id != f"{node_info['ip']}:{node_info['port']}":
             try:
-                url = f"https://{peer['ip']}:{peer['port']}/resource_offer"
-                # Optionally POST or PUT if you want to push, or just GET if you want to fetch
-                # Here, just an example of fetching peer's offer (for demonstration)
-                requests.get(url, timeout=3, verify=False)  # Set verify=True in production
+                url = f"https://{peer['ip']}:{peer['port']}/offers/push"
+                requests.post(url, data=wire, headers={'Content-Type': MSGPACK_MIMETYPE}, timeout=3, verify=False)  # Set verify=True in production
             except Exception as e:
                 print(f"[RESOURCE OFFER] Failed to reach {peer['ip']}:{peer['port']}: {e}")
 
@@ -366,7 +366,7 @@ def print_finger_table():
 
 def register_routes(app):
     """Register Chord protocol API endpoints"""
-    from flask import request, jsonify
+    from flask import request, jsonify, Response
     
     @app.route('/chord/find_successor', methods=['GET'])
     def route_find_successor():
@@ -381,7 +381,10 @@ def register_routes(app):
     @app.route('/chord/notify', methods=['POST'])
     def route_notify():
         global predecessor
+        from auth import verify_session_request
         node = request.json
+        if verify_session_request(expected_peer=f"{node['ip']}:{node['port']}") is None:
+            return jsonify({'error': 'Invalid or missing session MAC'}), 401
         
         if "chord_id" not in node:
             node["chord_id"] = get_chord_id(node["ip"], node["port"])
@@ -463,20 +466,21 @@ def register_routes(app):
 
     @app.route('/chord/store_metadata', methods=['POST'])
     def store_metadata():
-        data = request.json
-        key = int(data['key'])
-        offer = data['value']
-        signature = data.get('signature')
+        body = request.get_data()
+        try:
+            update = unpack(body)
+            key = int(update['key'])
+            offer = offer_from_wire(update['offer'])
+        except Exception as e:
+            return jsonify({'error': f'Malformed DHT update: {e}'}), 400
         node_address = offer['node_address']
-        from peers import known_peers
-        peer = known_peers.get(node_address)
-        if not peer or 'public_key' not in peer:
+        from auth import peer_public_key, verify_session_request
+        # The session MAC authenticates the writer as the offer's own node; the offer carries its ECDSA signature
+        if verify_session_request(expected_peer=node_address) is None:
+            return jsonify({'error': 'Invalid or missing session MAC'}), 401
+        public_key = peer_public_key(node_address)
+        if public_key is None:
             return jsonify({'error': 'Unknown peer or missing public key'}), 400
-        from Crypto.PublicKey import ECC
-        public_key = ECC.import_key(peer['public_key'])
-        # FIX: Pass the full data dict (including 'signature') to verify_dht_update
-        if not signature or not verify_dht_update(data, public_key):
-            return jsonify({'error': 'Invalid DHT update signature'}), 400
         if not verify_resource_offer(offer, public_key):
             return jsonify({'error': 'Invalid offer signature'}), 400
         if key not in self_dht_data_store:
@@ -490,7 +494,9 @@ def register_routes(app):
         key = int(request.args.get('key'))
         if not is_successor_for_key(key):
             return jsonify({'error': 'Not responsible for this key'}), 400
-        return jsonify({'offers': self_dht_data_store.get(key, [])})
+        # Stored offers keep their signed payload, so they are served without re-encoding
+        offers = [offer_to_wire(o) for o in self_dht_data_store.get(key, [])]
+        return Response(pack({'offers': offers}), mimetype=MSGPACK_MIMETYPE)
 
 def is_successor_for_key(key_chord_id):
     global node_info, predecessor
@@ -503,59 +509,31 @@ def is_successor_for_key(key_chord_id):
     else:
         return key_chord_id > pred_id or key_chord_id <= my_id
 
+def encode_dht_update(key, offer):
+    """Encode a DHT store request once; the session MAC covers exactly these bytes."""
+    return pack({'key': str(key), 'offer': offer_to_wire(offer)})
+
 def publish_offer(offer):
     from peers import get_peer_url
+    from auth import session_post
     key = offer['node_id']
     successor_node = find_successor(key)
-    import requests
-    dht_update = {'key': key, 'value': offer}
-    dht_update['signature'] = sign_dht_update(dht_update)
+    body = encode_dht_update(key, offer)
     url = get_peer_url(successor_node['ip'], successor_node['port']) + "/chord/store_metadata"
-    resp = requests.post(url, json=dht_update, timeout=5, verify=False)
+    resp = session_post(url, body, content_type=MSGPACK_MIMETYPE, timeout=5, verify=False)
     return resp.json()
 
-def discover_offers_by_chord_id(chord_id):
+def discover_offers_by_chord_id(chord_id, timeout=5):
     from peers import get_peer_url
     responsible_node = find_successor(chord_id)
     import requests
     url = get_peer_url(responsible_node['ip'], responsible_node['port']) + f"/chord/lookup_metadata?key={chord_id}"
     try:
-        resp = requests.get(url, timeout=5, verify=False)
+        resp = requests.get(url, timeout=timeout, verify=False)
         if resp.status_code == 200:
-            return resp.json().get('offers', [])
+            return [offer_from_wire(o) for o in unpack(resp.content).get('offers', [])]
         else:
             return []
     except Exception as e:
         print(f"[DHT DISCOVERY] Error discovering offers for {chord_id}: {e}")
         return []
-
-def sign_dht_update(update_dict):
-    from Crypto.Hash import SHA256
-    from Crypto.Signature import DSS
-    import json
-    from peers import ensure_key_pair, key_pair
-    ensure_key_pair()  # Ensure key_pair is valid before signing
-    if key_pair is None:
-        raise RuntimeError("[DHT SIGN] key_pair is None! Cannot sign DHT update.")
-    update = dict(update_dict)
-    update.pop('signature', None)
-    serialized = json.dumps(update, sort_keys=True).encode()
-    h = SHA256.new(serialized)
-    signer = DSS.new(key_pair, 'fips-186-3')
-    signature = signer.sign(h)
-    return signature.hex()
-
-def verify_dht_update(update_dict, public_key):
-    from Crypto.Hash import SHA256
-    from Crypto.Signature import DSS
-    import json
-    update = dict(update_dict)
-    sig = bytes.fromhex(update.pop('signature'))
-    serialized = json.dumps(update, sort_keys=True).encode()
-    h = SHA256.new(serialized)
-    verifier = DSS.new(public_key, 'fips-186-3')
-    try:
-        verifier.verify(h, sig)
-        return True
-    except Exception:
-        return False
\ No newline at end of file
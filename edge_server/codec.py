@@ -0,0 +1,25 @@
+import msgpack
+
+# Canonical binary encoding for anything that gets signed or MAC'd.
+# Maps are packed with sorted keys and tuples as arrays, so equal values always produce equal bytes;
+# floats are always packed as float64, so no text formatting is involved.
+
+MSGPACK_MIMETYPE = 'application/msgpack'
+
+
+def _canonicalize(obj):
+    if isinstance(obj, dict):
+        return {k: _canonicalize(obj[k]) for k in sorted(obj)}
+    if isinstance(obj, (list, tuple)):
+        return [_canonicalize(v) for v in obj]
+    return obj
+
+
+def pack(obj):
+    """Serialize obj to canonical msgpack bytes."""
+    return msgpack.packb(_canonicalize(obj), use_bin_type=True)
+
+
+def unpack(data):
+    """Inverse of pack(); bytes stay bytes, strings stay strings."""
+    return msgpack.unpackb(data, raw=False)
@@ -2,8 +2,63 @@ from flask import request, jsonify
 import requests
 from peers import known_peers, node_info
 from accounting import append_log_entry, LOG_FILE
+from capacity import get_capacity_profile, CAPACITY_WINDOW_S
 import os
 import json
+import threading
+import time
+
+load_lock = threading.Lock()
+ESP_MAX_BACKLOG_S = 1.0  # forward when in-flight load would take longer than this to drain
+
+
+def backlog_seconds(in_flight, capacity_lps):
+    """Time to drain in-flight load units at capacity_lps load units per second (inf without a capacity)."""
+    return in_flight / capacity_lps if capacity_lps else float('inf')
+
+
+def local_capacity_lps(task_type):
+    """Calibrated throughput for this kernel, else promised_capacity converted to units per second."""
+    profile = get_capacity_profile()
+    throughput = (profile.get('throughput_lps') or {}).get(task_type)
+    if throughput:
+        return throughput
+    window = profile.get('capacity_window_s') or CAPACITY_WINDOW_S
+    return (node_info.get('promised_capacity', 0) or 0) / window
+
+
+def peer_capacity_lps(peer):
+    return (peer.get('promised_capacity', 0) or 0) / CAPACITY_WINDOW_S
+
+
+def run_esp_kernel(task_type, processing_load):
+    """Run one ESP computation; also used by the capacity benchmark."""
+    if task_type == 'prime':
+        n = max(2, processing_load)
+        is_prime = True
+        for i in range(2, int(n**0.5) + 1):
+            if n % i == 0:
+                is_prime = False
+                break
+        return is_prime
+    elif task_type == 'matrix':
+        size = min(100, max(2, int(processing_load/10)))
+        a = [[i+j for j in range(size)] for i in range(size)]
+        b = [[i*j for j in range(size)] for i in range(size)]
+        c = [[sum(a[i][k]*b[k][j] for k in range(size)) for j in range(size)] for i in range(size)]
+        return c[0][0]
+    else:
+        # Fallback: busy-wait
+        t0 = time.time()
+        while time.time() - t0 < processing_load/1000.0:
+            pass
+        return True
+
+
+def adjust_current_load(delta):
+    with load_lock:
+        node_info['current_load'] = max(0, node_info.get('current_load', 0) + delta)
+
 
 def register_routes(app):
     @app.route('/handle_request', methods=['POST'])
@@ -31,39 +86,19 @@ def register_routes(app):
             }
         )
 
-        result = None
-        if task_type == 'prime':
-            n = max(2, processing_load)
-            is_prime = True
-            for i in range(2, int(n**0.5) + 1):
-                if n % i == 0:
-                    is_prime = False
-                    break
-            result = is_prime
-        elif task_type == 'matrix':
-            size = min(100, max(2, int(processing_load/10)))
-            a = [[i+j for j in range(size)] for i in range(size)]
-            b = [[i*j for j in range(size)] for i in range(size)]
-            c = [[sum(a[i][k]*b[k][j] for k in range(size)) for j in range(size)] for i in range(size)]
-            result = c[0][0]
-        else:
-            # Fallback: busy-wait
-            import time
-            t0 = time.time()
-            while time.time() - t0 < processing_load/1000.0:
-                pass
-            result = True
-
         # Earnings calculation
         earned = processing_load * 0.01
 
-        # Check if we need to forward (simulate capacity exceeded)
+        # Forward before doing any work if the load already in flight here, plus this request, would take
+        # longer than ESP_MAX_BACKLOG_S to drain at the calibrated throughput (load units per second)
         best_peer = None
-        if node_info.get('promised_capacity', 0) and node_info.get('current_load', 0) + processing_load > node_info.get('promised_capacity', 0):
+        in_flight = node_info.get('current_load', 0) + processing_load
+        if node_info.get('promised_capacity', 0) and backlog_seconds(in_flight, local_capacity_lps(task_type)) > ESP_MAX_BACKLOG_S:
             for peer in known_peers.values():
                 if peer['ip'] == node_info['ip'] and peer['port'] == node_info['port']:
                     continue
-                if peer.get('current_load', 0) + processing_load <= peer.get('promised_capacity', 0):
+                peer_in_flight = peer.get('current_load', 0) + processing_load
+                if backlog_seconds(peer_in_flight, peer_capacity_lps(peer)) <= ESP_MAX_BACKLOG_S:
                     best_peer = peer
                     break
 
@@ -80,6 +115,13 @@ def register_routes(app):
                     return jsonify({"redirected": f"{best_peer['ip']}:{best_peer['port']}"})
                 except Exception as e:
                     print("[ERROR] Failed to forward. Accepting locally.")
+
+        # current_load counts load units in flight here, so it is comparable with the calibrated capacity
+        adjust_current_load(processing_load)
+        try:
+            result = run_esp_kernel(task_type, processing_load)
+        finally:
+            adjust_current_load(-processing_load)
         # Log completion
         append_log_entry(
             event_type="ESP_REQUEST_COMPLETED",
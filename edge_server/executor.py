@@ -1,37 +1,355 @@
-from flask import Blueprint, request, jsonify
-from resource_manager import get_latest_stats
-from task_manager import TaskDescriptor
+from flask import Blueprint, request, jsonify, send_file
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from resource_manager import get_latest_stats, percentile
+from capacity import get_capacity_profile
+from task_manager import TaskDescriptor, parse_utc_timestamp
+from task_queue import DrainRateMeter
+from locality import input_cache
+from image_cache import get_docker_client, image_index
+from warm_pool import warm_pool
+from output_store import OutputSpool, output_fields, output_store
+from script_engine import script_pool, SCRIPT_TASKS_ENABLED
+from metering import ContainerMeter, overruns
 from accounting import append_log_entry
-import docker
 import os
-import tempfile
 import requests
 import threading
-import hashlib
+import heapq
+import itertools
+import math
+import time
+import uuid
+from urllib.parse import urlsplit
 
 # In-memory resource allocation tracker
 allocated_resources = {}
 total_earnings = 0.0
 
+# Tasks accepted and not yet finished, their containers once started, and those cancelled by their scheduler
+active_tasks = {}
+running_containers = {}
+cancelled_tasks = set()
+tasks_lock = threading.Lock()
+
+# Admission control: capacity is divided into slots of SLOT_CPU_CORES cores and SLOT_RAM_GB of RAM, plus one
+# worker slot per task (MAX_RUNNING_TASKS). A task starts on the bounded worker pool only while the slots its
+# resource_requirements round up to are free; the rest wait in a bounded earliest-deadline-first queue, and
+# beyond that we push back with 503.
+SLOT_CPU_CORES = 0.25
+SLOT_RAM_GB = 0.25
+MAX_RUNNING_TASKS = 16
+MAX_PENDING_TASKS = 32
+BACKFILL_MAX_WAIT_S = 30  # smaller tasks may start ahead of a waiting one only until it has waited this long
+WAIT_HISTORY = 200  # queue wait times kept for the metrics
+worker_pool = ThreadPoolExecutor(max_workers=MAX_RUNNING_TASKS, thread_name_prefix='task')
+pending_heap = []  # (deadline, seq, task_id); entries no longer in pending_tasks are skipped
+pending_tasks = {}  # task_id -> {'task', 'enqueued_at'}
+pending_seq = itertools.count()
+wait_times = deque(maxlen=WAIT_HISTORY)
+completions = DrainRateMeter()
+
+# Two-phase placement: a scheduler reserves cores and RAM under a short lease, then commits by sending the task
+# with the lease_id. Leases count against capacity like allocations until committed or expired.
+LEASE_TTL_S = 10
+MAX_LEASE_TTL_S = 60
+LEASE_SWEEP_INTERVAL_S = 1.0
+leases = {}  # lease_id -> {'task_id', 'reqs', 'holder', 'expires_at'}
+
+# Evicted images are no longer advertised in the node's locality summary
+image_index.on_evict = input_cache.forget_image
+
 executor_bp = Blueprint('executor', __name__)
 
+def node_capacity():
+    """Cores and RAM (GB) tasks may hold at once: the calibrated cgroup-aware limits, else the raw machine."""
+    profile = get_capacity_profile()
+    stats = get_latest_stats()
+    cores = profile.get('cpu_cores_effective') or stats.get('cpu_cores_logical', 0)
+    ram_gb = profile.get('memory_limit_gb') or stats.get('memory_total_gb', 0)
+    return cores, ram_gb
+
+def slot_capacity():
+    cores, ram_gb = node_capacity()
+    return {'cpu': int(cores / SLOT_CPU_CORES), 'ram': int(ram_gb / SLOT_RAM_GB), 'workers': MAX_RUNNING_TASKS}
+
+def slots_for(reqs):
+    """Slots a task holds; requirements round up to whole slots so fragments cannot oversubscribe the node."""
+    return {
+        'cpu': math.ceil(round(reqs.get('cpu_cores', 0) / SLOT_CPU_CORES, 6)),
+        'ram': math.ceil(round(reqs.get('ram_gb', 0) / SLOT_RAM_GB, 6)),
+        'workers': 1,
+    }
+
+def committed_slots():
+    """Slots held by allocated tasks and live leases; caller holds tasks_lock."""
+    used = {'cpu': 0, 'ram': 0, 'workers': 0}
+    for reqs in list(allocated_resources.values()) + [lease['reqs'] for lease in leases.values()]:
+        for kind, count in slots_for(reqs).items():
+            used[kind] += count
+    return used
+
+def expire_leases(now=None):
+    """Drop leases past their TTL; caller holds tasks_lock. Returns how many were dropped."""
+    now = time.time() if now is None else now
+    expired = [lease_id for lease_id, lease in leases.items() if lease['expires_at'] <= now]
+    for lease_id in expired:
+        lease = leases.pop(lease_id)
+        print(f"[EXECUTOR] Lease {lease_id} for task {lease['task_id']} expired uncommitted")
+    return len(expired)
+
+def reserve(task_id, reqs, holder, ttl_s=LEASE_TTL_S):
+    """Grant a lease on reqs if they fit beside allocations and other leases, else None."""
+    capacity = slot_capacity()
+    with tasks_lock:
+        expire_leases()
+        if not fits(reqs, capacity):
+            return None
+        lease_id = str(uuid.uuid4())
+        leases[lease_id] = {'task_id': task_id, 'reqs': dict(reqs), 'holder': holder, 'expires_at': time.time() + ttl_s}
+    return {'task_id': task_id, 'lease_id': lease_id, 'expires_in': ttl_s}
+
+def start_lease_sweeper(interval=LEASE_SWEEP_INTERVAL_S):
+    """Release expired leases in the background, so queued tasks can use the capacity they held."""
+    def sweeper():
+        while True:
+            with tasks_lock:
+                expired = expire_leases()
+            if expired:
+                start_pending_tasks()
+            time.sleep(interval)
+    t = threading.Thread(target=sweeper, daemon=True)
+    t.start()
+    return t
+
+def fits(reqs, capacity):
+    used = committed_slots()
+    return all(used[kind] + count <= capacity[kind] for kind, count in slots_for(reqs).items())
+
+def start_task(task):
+    """Allocate the task's slots and run it on the worker pool; caller holds tasks_lock."""
+    allocate_resources(task.task_id, task.resource_requirements)
+    worker_pool.submit(execute_containerized_task, task)
+
+def queue_task(task):
+    """Add a task to the pending queue in deadline order; caller holds tasks_lock."""
+    deadline = parse_utc_timestamp(task.deadline_utc)
+    heapq.heappush(pending_heap, (math.inf if deadline is None else deadline, next(pending_seq), task.task_id))
+    pending_tasks[task.task_id] = {'task': task, 'enqueued_at': time.time()}
+
+def start_pending_tasks():
+    """
+    Start queued tasks in deadline order while their slots are free. Smaller tasks may backfill past one
+    that does not fit, unless it has already waited BACKFILL_MAX_WAIT_S.
+    """
+    capacity = slot_capacity()
+    now = time.time()
+    with tasks_lock:
+        for entry in sorted(pending_heap):
+            waiting = pending_tasks.get(entry[2])
+            if waiting is None:
+                continue
+            if fits(waiting['task'].resource_requirements, capacity):
+                del pending_tasks[entry[2]]
+                wait_times.append(now - waiting['enqueued_at'])
+                start_task(waiting['task'])
+            elif now - waiting['enqueued_at'] > BACKFILL_MAX_WAIT_S:
+                break
+        pending_heap[:] = [entry for entry in pending_heap if entry[2] in pending_tasks]
+        heapq.heapify(pending_heap)
+
+def queue_metrics():
+    now = time.time()
+    with tasks_lock:
+        waits = sorted(round(w, 3) for w in wait_times)
+        oldest = min((w['enqueued_at'] for w in pending_tasks.values()), default=None)
+        return {
+            'queue_depth': len(pending_tasks),
+            'max_pending': MAX_PENDING_TASKS,
+            'running': len(allocated_resources),
+            'leases': len(leases),
+            'slots_capacity': slot_capacity(),
+            'slots_used': committed_slots(),
+            'wait_s_p50': percentile(waits, 50),
+            'wait_s_p95': percentile(waits, 95),
+            'oldest_wait_s': round(now - oldest, 3) if oldest is not None else None,
+            'completion_rate_per_s': round(completions.rate(now), 3),
+        }
+
+def accept_task(task, lease_id=None, holder=None):
+    """
+    Admit a task: start it if it fits, else queue it. Returns (body, http_status, headers);
+    a full queue gets 503 with a Retry-After from how fast tasks have been completing.
+    With lease_id the task commits its reservation and starts at once. The commit must come from the lease's
+    holder (the session-authenticated peer that reserved it) with the reserved resource_requirements;
+    otherwise, or if the lease is unknown or expired, it gets 409.
+    """
+    if task.task_type == 'python_script' and not SCRIPT_TASKS_ENABLED:
+        return {'task_id': task.task_id, 'error': 'python_script tasks are not enabled on this node'}, 422, {}
+    reqs = task.resource_requirements
+    capacity = slot_capacity()
+    if any(count > capacity[kind] for kind, count in slots_for(reqs).items()):
+        return {'task_id': task.task_id, 'error': 'Task exceeds node capacity'}, 422, {}
+    with tasks_lock:
+        if task.task_id in active_tasks:
+            return {'task_id': task.task_id, 'error': 'Task already accepted'}, 409, {}
+        if lease_id is not None:
+            expire_leases()
+            lease = leases.get(lease_id)
+            if lease is None or lease['task_id'] != task.task_id:
+                return {'task_id': task.task_id, 'error': 'Lease expired or unknown'}, 409, {}
+            if lease['holder'] != holder:
+                return {'task_id': task.task_id, 'error': 'Lease is held by another peer'}, 409, {}
+            if lease['reqs'] != dict(reqs):
+                return {'task_id': task.task_id, 'error': 'resource_requirements differ from the lease'}, 409, {}
+            # The lease's cores and RAM pass to the task's allocation
+            del leases[lease_id]
+            status = 'accepted/running'
+        elif fits(reqs, capacity) and not pending_tasks:
+            status = 'accepted/running'
+        elif len(pending_tasks) < MAX_PENDING_TASKS:
+            status = 'accepted/queued'
+        else:
+            retry_after = completions.retry_after(len(pending_tasks) + 1)
+            return {'task_id': task.task_id, 'error': 'Executor saturated', 'retry_after': retry_after}, 503, \
+                {'Retry-After': str(retry_after)}
+        active_tasks[task.task_id] = task
+        append_log_entry(
+            event_type="TASK_ACCEPTED_BY_NODE_X",
+            task_id=task.task_id,
+            node_id=os.getenv('NODE_ID', 'executor'),
+            details={'queued': status == 'accepted/queued', 'lease_id': lease_id}
+        )
+        if status == 'accepted/running':
+            start_task(task)
+        else:
+            queue_task(task)
+    return {'task_id': task.task_id, 'status': status}, 200, {}
+
 @executor_bp.route('/execute_task', methods=['POST'])
 def execute_task_endpoint():
     data = request.json
     try:
-        task = TaskDescriptor.from_dict(data)
+        task = TaskDescriptor.from_dict(data, keep_identity=True)
     except Exception as e:
         return jsonify({'error': f'Invalid task descriptor: {e}'}), 400
-    append_log_entry(
-        event_type="TASK_ACCEPTED_BY_NODE_X",
-        task_id=task.task_id,
-        node_id=os.getenv('NODE_ID', 'executor'),
-        details={}
-    )
-    # Run the task in a background thread
-    thread = threading.Thread(target=execute_containerized_task, args=(task,))
-    thread.start()
-    return jsonify({'task_id': task.task_id, 'status': 'accepted/running'})
+    from auth import verify_session_request
+    body, status, headers = accept_task(task, data.get('lease_id'), verify_session_request())
+    return jsonify(body), status, headers
+
+@executor_bp.route('/execute_tasks', methods=['POST'])
+def execute_tasks_endpoint():
+    """Batched form of /execute_task: one request carrying a list of task descriptors."""
+    from auth import verify_session_request
+    data = request.json
+    if not isinstance(data, dict) or not isinstance(data.get('tasks'), list):
+        return jsonify({'error': 'Expected {"tasks": [...]}'}), 400
+    holder = verify_session_request()
+    accepted = []
+    rejected = []
+    for item in data['tasks']:
+        try:
+            task = TaskDescriptor.from_dict(item, keep_identity=True)
+        except Exception as e:
+            rejected.append({'task_id': item.get('task_id') if isinstance(item, dict) else None,
+                             'error': f'Invalid task descriptor: {e}'})
+            continue
+        body, status, _ = accept_task(task, item.get('lease_id'), holder)
+        (accepted if status == 200 else rejected).append(body)
+    return jsonify({'accepted': accepted, 'rejected': rejected})
+
+@executor_bp.route('/executor/metrics', methods=['GET'])
+def executor_metrics():
+    return jsonify(queue_metrics())
+
+@executor_bp.route('/executor/images', methods=['GET'])
+def executor_images():
+    return jsonify(image_index.snapshot())
+
+@executor_bp.route('/task_output/<task_id>', methods=['GET'])
+def task_output(task_id):
+    """A task's full output when it was too large to send inline; supports Range requests."""
+    path = output_store.lookup(task_id, request.args.get('token'))
+    if path is None:
+        return jsonify({'error': 'Unknown or expired output'}), 404
+    return send_file(path, mimetype='application/octet-stream', conditional=True)
+
+@executor_bp.route('/executor/warm_pool', methods=['GET'])
+def executor_warm_pool():
+    return jsonify({'containers': warm_pool.snapshot(), 'scripts': script_pool.snapshot()})
+
+@executor_bp.route('/reserve', methods=['POST'])
+def reserve_endpoint():
+    """
+    Phase one of placement: {"reservations": [{"task_id", "resource_requirements"}], "ttl_s": ...}.
+    Leases are granted individually; if any is refused the response is 503 with Retry-After.
+    """
+    from auth import verify_session_request
+    holder = verify_session_request()
+    if holder is None:
+        return jsonify({'error': 'Invalid or missing session MAC'}), 401
+    data = request.get_json(silent=True) or {}
+    items = data.get('reservations')
+    if not isinstance(items, list) or not items:
+        return jsonify({'error': 'Expected {"reservations": [...]}'}), 400
+    ttl_s = data.get('ttl_s', LEASE_TTL_S)
+    if isinstance(ttl_s, bool) or not isinstance(ttl_s, (int, float)) or not math.isfinite(ttl_s):
+        return jsonify({'error': 'ttl_s must be a number of seconds'}), 400
+    ttl_s = min(MAX_LEASE_TTL_S, max(1, float(ttl_s)))
+    granted = []
+    refused = []
+    for item in items:
+        lease = reserve(item.get('task_id'), item.get('resource_requirements') or {}, holder, ttl_s)
+        (granted if lease else refused).append(lease or {'task_id': item.get('task_id'), 'error': 'Insufficient free capacity'})
+    if refused:
+        with tasks_lock:
+            retry_after = completions.retry_after(len(pending_tasks) + 1)
+        return jsonify({'leases': granted, 'refused': refused, 'retry_after': retry_after}), 503, \
+            {'Retry-After': str(retry_after)}
+    return jsonify({'leases': granted, 'refused': []})
+
+@executor_bp.route('/cancel_task', methods=['POST'])
+def cancel_task_endpoint():
+    """Cancel a task on behalf of the scheduler that dispatched it (e.g. a slower speculative copy)."""
+    from auth import verify_session_request
+    data = request.get_json(silent=True) or {}
+    task_id = data.get('task_id')
+    with tasks_lock:
+        task = active_tasks.get(task_id)
+    if task is None:
+        return jsonify({'error': 'Unknown or finished task'}), 404
+    scheduler = urlsplit(task.callback_url).netloc if task.callback_url else None
+    if scheduler is None or verify_session_request(expected_peer=scheduler) is None:
+        return jsonify({'error': 'Only the dispatching scheduler may cancel a task'}), 401
+    with tasks_lock:
+        if task_id in pending_tasks:
+            # Never started: nothing to stop or deallocate
+            del pending_tasks[task_id]
+            active_tasks.pop(task_id, None)
+            print(f"[EXECUTOR] Queued task {task_id} cancelled by scheduler {scheduler}")
+            return jsonify({'task_id': task_id, 'status': 'cancelled'})
+        cancelled_tasks.add(task_id)
+        container = running_containers.get(task_id)
+    if container is not None:
+        try:
+            container.kill()
+        except Exception as e:
+            print(f"[EXECUTOR] Error killing container for task {task_id}: {e}")
+    print(f"[EXECUTOR] Task {task_id} cancelled by scheduler {scheduler}")
+    return jsonify({'task_id': task_id, 'status': 'cancelled'})
+
+def is_cancelled(task_id):
+    with tasks_lock:
+        return task_id in cancelled_tasks
+
+def finish_task(task_id):
+    """The task's run is over and its resources released: let waiting tasks take them."""
+    with tasks_lock:
+        active_tasks.pop(task_id, None)
+        running_containers.pop(task_id, None)
+        cancelled_tasks.discard(task_id)
+    completions.mark()
+    start_pending_tasks()
 
 def allocate_resources(task_id, reqs):
     """Mark resources as allocated for a task."""
@@ -45,7 +363,8 @@ def allocate_resources(task_id, reqs):
 
 def deallocate_resources(task_id):
     """Free resources allocated for a task."""
-    reqs = allocated_resources.pop(task_id, None)
+    with tasks_lock:
+        reqs = allocated_resources.pop(task_id, None)
     append_log_entry(
         event_type="RESOURCE_DEALLOCATED",
         task_id=task_id,
@@ -63,11 +382,114 @@ def add_earnings(task_id, amount):
         details={'amount': amount, 'total_earnings': total_earnings}
     )
 
+def report_result(task_descriptor, task_result):
+    """Send a task's result to the requester's submission_url and to the scheduler that dispatched it."""
+    if task_descriptor.submission_url:
+        try:
+            requests.post(task_descriptor.submission_url, json=task_result)
+        except Exception as e:
+            print(f"[EXECUTOR] Error reporting result: {e}")
+    if task_descriptor.callback_url:
+        from auth import session_post
+        try:
+            session_post(task_descriptor.callback_url, task_result, timeout=10, verify=False)
+        except Exception as e:
+            print(f"[EXECUTOR] Error reporting result to scheduler: {e}")
+
+def complete_task(task_descriptor, result, spool):
+    """
+    Report a finished run (result shaped like container.wait(), with the engine's measured 'usage') and
+    account for it; the same for every engine.
+    """
+    exit_code = result.get('StatusCode', -2)
+    usage = result.get('usage') or {}
+    overrun = overruns(usage, task_descriptor.resource_requirements)
+    if overrun:
+        print(f"[EXECUTOR] Task {task_descriptor.task_id} used more {', '.join(overrun)} than it requested: {usage}")
+    if is_cancelled(task_descriptor.task_id):
+        append_log_entry(
+            event_type="TASK_CANCELLED_ON_NODE_X",
+            task_id=task_descriptor.task_id,
+            node_id=os.getenv('NODE_ID', 'executor'),
+            details={'exit_code': exit_code, 'usage': usage}
+        )
+        print(f"[EXECUTOR] Task {task_descriptor.task_id} cancelled. Exit: {exit_code}")
+        return
+    task_result = {
+        'task_id': task_descriptor.task_id,
+        'status': 'completed',
+        'exit_code': exit_code,
+        'error': result.get('Error'),
+        'usage': usage,
+    }
+    # Small outputs travel inline; large ones stay here and the result carries an output_url
+    task_result.update(output_fields(spool))
+    report_result(task_descriptor, task_result)
+    append_log_entry(
+        event_type="TASK_COMPLETED_ON_NODE_X",
+        task_id=task_descriptor.task_id,
+        node_id=os.getenv('NODE_ID', 'executor'),
+        details={'exit_code': exit_code, 'output_checksum': spool.checksum,
+                 'output_size_bytes': spool.size, 'output_truncated': spool.truncated,
+                 'usage': usage, 'requested': task_descriptor.resource_requirements, 'overrun': overrun}
+    )
+    # Earnings logic: for demo, $1 per successful task
+    if exit_code == 0:
+        add_earnings(task_descriptor.task_id, 1.0)
+    print(f"[EXECUTOR] Task {task_descriptor.task_id} completed. Exit: {exit_code}")
+
+def fail_task(task_descriptor, error):
+    append_log_entry(
+        event_type="TASK_FAILED_ON_NODE_X",
+        task_id=task_descriptor.task_id,
+        node_id=os.getenv('NODE_ID', 'executor'),
+        details={'error': error}
+    )
+    print(f"[EXECUTOR] Task {task_descriptor.task_id} failed: {error}")
+    report_result(task_descriptor, {'task_id': task_descriptor.task_id, 'status': 'failed', 'error': error})
+
+def execute_python_script(task_descriptor):
+    """python_script tasks: run on a warm interpreter from the script pool instead of in a container."""
+    payload = task_descriptor.payload
+    input_file_path = None
+    spool = OutputSpool(task_descriptor.task_id)
+
+    def on_start(worker):
+        # The cancel endpoint kills whatever is registered here
+        with tasks_lock:
+            running_containers[task_descriptor.task_id] = worker
+        if is_cancelled(task_descriptor.task_id):
+            worker.kill()
+    try:
+        if is_cancelled(task_descriptor.task_id):
+            raise RuntimeError('cancelled before start')
+        if not payload.get('script'):
+            raise ValueError('python_script payload needs a script')
+        if payload.get('input_data_url'):
+            input_file_path = input_cache.fetch(payload['input_data_url'], payload.get('input_data_sha256'))
+        result = script_pool.run(task_descriptor.task_id, task_descriptor.requester_id, payload,
+                                 task_descriptor.resource_requirements, input_file_path, spool, on_start)
+        complete_task(task_descriptor, result, spool)
+    except Exception as e:
+        fail_task(task_descriptor, str(e))
+    finally:
+        spool.discard()
+        if input_file_path:
+            input_cache.release(input_file_path)
+        deallocate_resources(task_descriptor.task_id)
+        finish_task(task_descriptor.task_id)
+
 def execute_containerized_task(task_descriptor):
     stats = get_latest_stats()
     reqs = task_descriptor.resource_requirements
-    if stats.get('cpu_cores_logical', 0) < reqs.get('cpu_cores', 0) or \
-       stats.get('memory_available_gb', 0) < reqs.get('ram_gb', 0):
+    with tasks_lock:
+        # A task holding an allocation was admitted on slots (and may be running on committed lease capacity),
+        # so instantaneous free memory, which other running tasks already consume, is not a reason to fail it
+        admitted = task_descriptor.task_id in allocated_resources
+    # cgroup-aware core count when calibrated; raw logical cores otherwise
+    cpu_cores = stats.get('cpu_cores_effective', stats.get('cpu_cores_logical', 0))
+    if not admitted and (cpu_cores < reqs.get('cpu_cores', 0) or
+                         stats.get('memory_available_gb', 0) < reqs.get('ram_gb', 0)):
         append_log_entry(
             event_type="TASK_FAILED_ON_NODE_X",
             task_id=task_descriptor.task_id,
@@ -75,8 +497,10 @@ def execute_containerized_task(task_descriptor):
             details={'reason': 'insufficient resources'}
         )
         print(f"[EXECUTOR] Task {task_descriptor.task_id} rejected: insufficient resources.")
+        report_result(task_descriptor, {'task_id': task_descriptor.task_id, 'status': 'failed', 'error': 'insufficient resources'})
+        deallocate_resources(task_descriptor.task_id)
+        finish_task(task_descriptor.task_id)
         return
-    allocate_resources(task_descriptor.task_id, reqs)
     append_log_entry(
         event_type="TASK_STARTED_ON_NODE_X",
         task_id=task_descriptor.task_id,
@@ -91,69 +515,88 @@ def execute_containerized_task(task_descriptor):
         input_data_url = payload.get('input_data_url')
         env_vars = payload.get('environment_vars', {})
         max_duration = payload.get('max_duration_seconds', 3600)
-        client = docker.from_env()
         input_file_path = None
+        image_pinned = False
+        warm = None
+        meter = None
+        result = None
+        spool = OutputSpool(task_descriptor.task_id)
         try:
-            client.images.pull(image_name)
+            if is_cancelled(task_descriptor.task_id):
+                raise RuntimeError('cancelled before start')
+            client = get_docker_client()
+            # Pulled only if not already present (unless image_pull_policy says otherwise); concurrent tasks share one pull
+            image_index.acquire(image_name, payload.get('image_pull_policy'))
+            image_pinned = True
+            input_cache.record_image(image_name)
             if input_data_url:
-                resp = requests.get(input_data_url)
-                tmp_dir = tempfile.mkdtemp()
-                input_file_path = os.path.join(tmp_dir, 'input.data')
-                with open(input_file_path, 'wb') as f:
-                    f.write(resp.content)
-            volumes = {input_file_path: {'bind': '/input/input.data', 'mode': 'ro'}} if input_file_path else {}
-            container = client.containers.run(
-                image_name,
-                environment=env_vars,
-                volumes=volumes,
-                detach=True,
-                mem_limit=f"{reqs.get('ram_gb', 1)}g",
-                nano_cpus=int(reqs.get('cpu_cores', 1) * 1e9),
-                stdout=True,
-                stderr=True
-            )
-            try:
-                result = container.wait(timeout=max_duration)
-            except Exception as e:
-                container.kill()
-                result = {'StatusCode': -1, 'Error': str(e)}
-            logs = container.logs(stdout=True, stderr=True).decode()
-            exit_code = result.get('StatusCode', -2)
-            output_checksum = None
-            task_result = {
-                'task_id': task_descriptor.task_id,
-                'exit_code': exit_code,
-                'stdout_stderr': logs,
-                'error': result.get('Error'),
-            }
-            if logs:
-                output_checksum = hashlib.sha256(logs.encode()).hexdigest()
-                task_result['output_checksum'] = output_checksum
-            if task_descriptor.submission_url:
+                # Content-addressed cache: repeated inputs are bound from disk instead of downloaded again
+                input_file_path = input_cache.fetch(input_data_url, payload.get('input_data_sha256'))
+            warm_pool.note_start(image_name)
+            started = time.time()
+            # Hot images have pre-created containers: hand the task to one instead of creating and starting
+            if payload.get('warm_start', True):
+                warm = warm_pool.take(image_name, task_descriptor.requester_id)
+            if warm is not None:
+                with tasks_lock:
+                    running_containers[task_descriptor.task_id] = warm['container']
+                if is_cancelled(task_descriptor.task_id):
+                    raise RuntimeError('cancelled before start')
+                meter = ContainerMeter(warm['container'], from_zero=False).start()
+                result = warm_pool.run(warm, input_file_path, env_vars, reqs, max_duration, spool)
+                result['usage'] = meter.stop(final_sample=True)
+            else:
+                volumes = {input_file_path: {'bind': '/input/input.data', 'mode': 'ro'}} if input_file_path else {}
+                container = client.containers.run(
+                    image_name,
+                    environment=env_vars,
+                    volumes=volumes,
+                    detach=True,
+                    mem_limit=f"{reqs.get('ram_gb', 1)}g",
+                    nano_cpus=int(reqs.get('cpu_cores', 1) * 1e9),
+                    stdout=True,
+                    stderr=True
+                )
+                with tasks_lock:
+                    running_containers[task_descriptor.task_id] = container
+                meter = ContainerMeter(container).start()
+                if is_cancelled(task_descriptor.task_id):
+                    container.kill()
+                # Output is spooled and hashed as the container writes it, not read back whole at exit
+                capture = threading.Thread(
+                    target=spool.consume,
+                    args=(container.logs(stdout=True, stderr=True, stream=True, follow=True),),
+                    daemon=True
+                )
+                capture.start()
                 try:
-                    requests.post(task_descriptor.submission_url, json=task_result)
+                    result = container.wait(timeout=max_duration)
                 except Exception as e:
-                    print(f"[EXECUTOR] Error reporting result: {e}")
-            append_log_entry(
-                event_type="TASK_COMPLETED_ON_NODE_X",
-                task_id=task_descriptor.task_id,
-                node_id=os.getenv('NODE_ID', 'executor'),
-                details={'exit_code': exit_code, 'output_checksum': output_checksum}
-            )
-            # Earnings logic: for demo, $1 per successful task
-            if exit_code == 0:
-                add_earnings(task_descriptor.task_id, 1.0)
-            print(f"[EXECUTOR] Task {task_descriptor.task_id} completed. Exit: {exit_code}")
+                    container.kill()
+                    result = {'StatusCode': -1, 'Error': str(e)}
+                capture.join()
+                result['usage'] = meter.stop()
+            warm_pool.note_runtime(image_name, time.time() - started)
+            complete_task(task_descriptor, result, spool)
         except Exception as e:
-            append_log_entry(
-                event_type="TASK_FAILED_ON_NODE_X",
-                task_id=task_descriptor.task_id,
-                node_id=os.getenv('NODE_ID', 'executor'),
-                details={'error': str(e)}
-            )
-            print(f"[EXECUTOR] Task {task_descriptor.task_id} failed: {e}")
+            fail_task(task_descriptor, str(e))
         finally:
-            if input_file_path and os.path.exists(input_file_path):
-                os.remove(input_file_path)
+            spool.discard()
+            if meter is not None:
+                meter.stopped.set()
+            if warm is not None:
+                # A killed or failed warm container is destroyed rather than recycled
+                warm_pool.give_back(warm, reusable=result is not None and not is_cancelled(task_descriptor.task_id))
+            if input_file_path:
+                input_cache.release(input_file_path)
+            if image_pinned:
+                image_index.release(image_name)
             deallocate_resources(task_descriptor.task_id)
+            finish_task(task_descriptor.task_id)
+    elif task_descriptor.task_type == 'python_script':
+        execute_python_script(task_descriptor)
+    else:
+        fail_task(task_descriptor, f"unsupported task type {task_descriptor.task_type}")
+        deallocate_resources(task_descriptor.task_id)
+        finish_task(task_descriptor.task_id)
     # 5. Resource De-allocation (now implemented)
@@ -0,0 +1,256 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import Future
+
+IMAGE_DISK_BUDGET_BYTES = 20 * 1024 ** 3  # pulled task images are evicted least recently used beyond this
+PULL_POLICIES = ('if-not-present', 'always', 'never')
+DEFAULT_PULL_POLICY = 'if-not-present'
+IMAGE_BACKEND = os.getenv('DSEF_IMAGE_BACKEND', 'docker')  # 'local' uses the offline stand-in
+# Only images this node pulled (recorded here across restarts) or that carry this label are ever evicted;
+# the operator's own images are used but never counted against the budget or removed
+IMAGE_MANAGED_LABEL = 'dsef.managed'
+PULLED_IMAGES_FILE = os.path.join(os.path.dirname(__file__), 'pulled_images.json')
+
+_docker_client = None
+_docker_client_lock = threading.Lock()
+
+
+def get_docker_client():
+    """Process-wide Docker client, created on first use (docker.from_env() per task costs a connection setup)."""
+    global _docker_client
+    with _docker_client_lock:
+        if _docker_client is None:
+            import docker
+            _docker_client = docker.from_env()
+        return _docker_client
+
+
+class DockerImageBackend:
+    """Image operations against the local Docker daemon."""
+    def __init__(self, client=None):
+        self._client = client
+
+    @property
+    def client(self):
+        return self._client or get_docker_client()
+
+    def get(self, name):
+        """(digest, size_bytes) of a locally present image, or None."""
+        import docker
+        try:
+            image = self.client.images.get(name)
+        except docker.errors.ImageNotFound:
+            return None
+        return image.id, image.attrs.get('Size', 0)
+
+    def pull(self, name):
+        image = self.client.images.pull(name)
+        return image.id, image.attrs.get('Size', 0)
+
+    def remove(self, name):
+        self.client.images.remove(name)
+
+    def list(self):
+        """{tag: (digest, size_bytes, labelled)}; labelled means the image carries IMAGE_MANAGED_LABEL."""
+        images = {}
+        for image in self.client.images.list():
+            labelled = IMAGE_MANAGED_LABEL in (image.labels or {})
+            for tag in image.tags:
+                images[tag] = (image.id, image.attrs.get('Size', 0), labelled)
+        return images
+
+
+class LocalImageBackend:
+    """
+    Offline stand-in for a registry plus daemon: catalog maps image names to sizes that can be "pulled";
+    pulled images live in memory with a digest derived from the name. pull_delay_s simulates transfer time.
+    """
+    def __init__(self, catalog=None, pull_delay_s=0.0, labelled=()):
+        self.catalog = dict(catalog or {})
+        self.pull_delay_s = pull_delay_s
+        self.labelled = set(labelled)
+        self.present = {}
+        self.pulls = 0
+
+    def get(self, name):
+        return self.present.get(name)
+
+    def pull(self, name):
+        if name not in self.catalog:
+            raise LookupError(f"Image {name} not found in local catalog")
+        time.sleep(self.pull_delay_s)
+        self.pulls += 1
+        self.present[name] = ('sha256:' + hashlib.sha256(name.encode('utf-8')).hexdigest(), self.catalog[name])
+        return self.present[name]
+
+    def remove(self, name):
+        self.present.pop(name, None)
+
+    def list(self):
+        return {name: (digest, size, name in self.labelled) for name, (digest, size) in self.present.items()}
+
+
+class ImageIndex:
+    """
+    Local index of task images by name and digest, in front of a backend.
+    acquire() applies the pull policy, shares one in-flight pull among concurrent tasks, and pins the image
+    until release(). Managed images (pulled by this node, or labelled IMAGE_MANAGED_LABEL) count against
+    disk_budget_bytes once per digest, and unpinned ones are evicted least recently used beyond it.
+    Images that were already on the host are used as they are and never evicted.
+    """
+    def __init__(self, backend=None, disk_budget_bytes=IMAGE_DISK_BUDGET_BYTES, on_evict=None,
+                 state_path=PULLED_IMAGES_FILE):
+        self.backend = backend
+        self.disk_budget_bytes = disk_budget_bytes
+        self.on_evict = on_evict  # called with the image name after eviction
+        self.state_path = state_path  # digests this node pulled, kept across restarts (None: in memory only)
+        self.images = {}  # name -> {'digest', 'size', 'last_used', 'managed'}
+        self.pulled = set()  # digests this node pulled
+        self.pulls = {}  # name -> Future of an in-flight pull
+        self.in_use = {}  # name -> running tasks using the image
+        self.lock = threading.Lock()
+        self.seeded = False
+
+    def _save_pulled(self):
+        if self.state_path is None:
+            return
+        tmp_path = self.state_path + '.tmp'
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(sorted(self.pulled), f)
+            os.replace(tmp_path, self.state_path)
+        except OSError as e:
+            print(f"[IMAGES] Could not record pulled images: {e}")
+
+    def _seed(self):
+        """Index what the backend already holds; caller holds the lock."""
+        if self.seeded:
+            return
+        self.seeded = True
+        if self.state_path is not None:
+            try:
+                with open(self.state_path) as f:
+                    self.pulled = set(json.load(f))
+            except (OSError, ValueError):
+                pass
+        try:
+            for name, (digest, size, labelled) in self.backend.list().items():
+                self.images.setdefault(name, {'digest': digest, 'size': size, 'last_used': 0.0,
+                                              'managed': labelled or digest in self.pulled})
+        except Exception as e:
+            print(f"[IMAGES] Could not list local images: {e}")
+
+    def acquire(self, name, policy=None):
+        """Make an image available locally per policy and pin it; returns its digest."""
+        policy = policy or DEFAULT_PULL_POLICY
+        if policy not in PULL_POLICIES:
+            raise ValueError(f"Unknown image pull policy {policy}")
+        with self.lock:
+            self._seed()
+            entry = self.images.get(name)
+            if entry is not None and policy != 'always':
+                return self._pin(name, entry)
+            pull = self.pulls.get(name)
+            owner = pull is None
+            if owner:
+                if policy == 'never':
+                    found = self.backend.get(name)
+                    if found is None:
+                        raise LookupError(f"Image {name} is not present and pull policy is 'never'")
+                    entry = self.images[name] = {'digest': found[0], 'size': found[1], 'last_used': 0.0,
+                                                 'managed': found[0] in self.pulled}
+                    return self._pin(name, entry)
+                pull = self.pulls[name] = Future()
+        if owner:
+            try:
+                present = self.backend.get(name)
+                if present is not None and policy == 'if-not-present':
+                    found = present + (present[0] in self.pulled,)
+                else:
+                    started = time.time()
+                    digest, size = self.backend.pull(name)
+                    print(f"[IMAGES] Pulled {name} in {time.time() - started:.2f}s")
+                    # Re-pulling an image the host already had does not make it ours to evict
+                    found = (digest, size, present is None or present[0] in self.pulled)
+                pull.set_result(found)
+            except Exception as e:
+                pull.set_exception(e)
+            finally:
+                with self.lock:
+                    self.pulls.pop(name, None)
+        digest, size, managed = pull.result()
+        with self.lock:
+            if managed and digest not in self.pulled:
+                self.pulled.add(digest)
+                self._save_pulled()
+            entry = self.images[name] = {'digest': digest, 'size': size, 'last_used': time.time(), 'managed': managed}
+            pinned = self._pin(name, entry)
+            self._evict()
+        return pinned
+
+    def _pin(self, name, entry):
+        entry['last_used'] = time.time()
+        self.in_use[name] = self.in_use.get(name, 0) + 1
+        return entry['digest']
+
+    def release(self, name):
+        with self.lock:
+            count = self.in_use.get(name, 0) - 1
+            if count > 0:
+                self.in_use[name] = count
+            else:
+                self.in_use.pop(name, None)
+            self._evict()
+
+    def _by_digest(self):
+        """Images grouped by digest, since tags of one image share its layers; caller holds the lock."""
+        groups = {}
+        for name, entry in self.images.items():
+            group = groups.setdefault(entry['digest'], {'names': [], 'size': entry['size'], 'last_used': 0.0,
+                                                        'managed': True})
+            group['names'].append(name)
+            group['last_used'] = max(group['last_used'], entry['last_used'])
+            group['managed'] = group['managed'] and entry['managed']
+        return groups
+
+    def managed_bytes(self):
+        with self.lock:
+            return sum(g['size'] for g in self._by_digest().values() if g['managed'])
+
+    def _evict(self):
+        """Remove least recently used unpinned managed images beyond the disk budget; caller holds the lock."""
+        groups = self._by_digest()
+        total = sum(g['size'] for g in groups.values() if g['managed'])
+        for digest, group in sorted(groups.items(), key=lambda item: item[1]['last_used']):
+            if total <= self.disk_budget_bytes:
+                break
+            if not group['managed'] or any(name in self.in_use for name in group['names']):
+                continue
+            removed = []
+            for name in group['names']:
+                try:
+                    self.backend.remove(name)
+                except Exception as e:
+                    print(f"[IMAGES] Could not evict {name}: {e}")
+                    continue
+                del self.images[name]
+                removed.append(name)
+            if self.on_evict:
+                for name in removed:
+                    self.on_evict(name)
+            if len(removed) < len(group['names']):
+                continue  # another tag still holds the layers
+            total -= group['size']
+            self.pulled.discard(digest)
+            self._save_pulled()
+            print(f"[IMAGES] Evicted {', '.join(removed)} ({group['size']} bytes)")
+
+    def snapshot(self):
+        with self.lock:
+            return {name: dict(entry, in_use=self.in_use.get(name, 0)) for name, entry in self.images.items()}
+
+
+image_index = ImageIndex(LocalImageBackend() if IMAGE_BACKEND == 'local' else DockerImageBackend())
@@ -0,0 +1,341 @@
+import hashlib
+import json
+import math
+import os
+import re
+import threading
+import time
+import requests
+
+INPUT_CACHE_DIR = os.path.join(os.path.dirname(__file__), 'input_cache')
+INPUT_CACHE_MAX_BYTES = 2 * 1024 ** 3
+DOWNLOAD_CHUNK_BYTES = 1024 * 1024
+DOWNLOAD_TIMEOUT_S = 30
+DOWNLOAD_ATTEMPTS = 3  # an interrupted download resumes from its partial file with an HTTP Range request
+PARTIAL_RETENTION_S = 3600  # partial downloads nobody resumes are deleted after this long
+SHA256_HEX = re.compile(r'[0-9a-f]{64}')  # input_data_sha256 names a cache file, so nothing else is accepted
+
+# Bloom filters are sized to their contents: BLOOM_BITS_PER_KEY bits per key (about 1% false positives
+# with BLOOM_HASHES hash functions), rounded up to a power of two and never below BLOOM_MIN_BITS
+BLOOM_BITS_PER_KEY = 10
+BLOOM_HASHES = 7
+BLOOM_MIN_BITS = 256
+
+
+def input_keys(payload):
+    """Locality keys under which a task's input may be cached: its URL and, if given, its content hash."""
+    keys = []
+    if payload.get('input_data_url'):
+        keys.append(f"url:{payload['input_data_url']}")
+    if payload.get('input_data_sha256'):
+        keys.append(f"sha256:{payload['input_data_sha256']}")
+    return keys
+
+
+def image_keys(payload):
+    return [f"image:{payload['image_name']}"] if payload.get('image_name') else []
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings, using double hashing of one SHA-256 digest."""
+    def __init__(self, bits, hashes=BLOOM_HASHES, data=None):
+        self.bits = bits
+        self.hashes = hashes
+        self.array = bytearray(data) if data is not None else bytearray(bits // 8)
+
+    @classmethod
+    def for_keys(cls, keys, hashes=BLOOM_HASHES):
+        keys = list(keys)
+        bits = max(BLOOM_MIN_BITS, 1 << math.ceil(math.log2(max(1, len(keys) * BLOOM_BITS_PER_KEY))))
+        bloom = cls(bits, hashes)
+        for key in keys:
+            bloom.add(key)
+        return bloom
+
+    def _positions(self, key):
+        digest = hashlib.sha256(key.encode('utf-8')).digest()
+        h1 = int.from_bytes(digest[:8], 'big')
+        h2 = int.from_bytes(digest[8:16], 'big') | 1
+        return [(h1 + i * h2) % self.bits for i in range(self.hashes)]
+
+    def add(self, key):
+        for pos in self._positions(key):
+            self.array[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, key):
+        return all(self.array[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+    def to_summary(self):
+        return {'bits': self.bits, 'hashes': self.hashes, 'data': bytes(self.array)}
+
+    @classmethod
+    def from_summary(cls, summary):
+        if not summary or not summary.get('data'):
+            return None
+        return cls(summary['bits'], summary['hashes'], summary['data'])
+
+
+class InputCache:
+    """
+    Content-addressed cache of task inputs: objects are stored under their SHA-256, and an index maps each
+    input URL to the hash it last produced (URLs are taken to name immutable data). Least recently used
+    objects are evicted beyond max_bytes, except those bound into a running task.
+    """
+    def __init__(self, root=INPUT_CACHE_DIR, max_bytes=INPUT_CACHE_MAX_BYTES):
+        self.root = root
+        self.objects_dir = os.path.join(root, 'objects')
+        self.index_path = os.path.join(root, 'index.json')
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.fetch_locks = {}  # locality key -> [lock, fetches holding or waiting], so concurrent tasks download an input once
+        self.in_use = {}  # sha256 -> number of tasks using the object
+        self.images = set()
+        self.url_index = None
+        self.version = 0
+        self._summary = None
+
+    def _load_index(self):
+        if self.url_index is None:
+            os.makedirs(self.objects_dir, exist_ok=True)
+            try:
+                with open(self.index_path) as f:
+                    self.url_index = json.load(f)
+            except (OSError, ValueError):
+                self.url_index = {}
+
+    def _save_index(self):
+        tmp_path = self.index_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.url_index, f)
+        os.replace(tmp_path, self.index_path)
+
+    def object_path(self, sha256):
+        return os.path.join(self.objects_dir, sha256)
+
+    def _lookup(self, url, expected_sha256):
+        """Cached object hash for an input, or None; caller holds the lock."""
+        self._load_index()
+        sha256 = expected_sha256 or self.url_index.get(url)
+        if sha256 and os.path.exists(self.object_path(sha256)):
+            return sha256
+        return None
+
+    def _acquire(self, sha256):
+        self.in_use[sha256] = self.in_use.get(sha256, 0) + 1
+        os.utime(self.object_path(sha256))  # mtime doubles as the LRU clock
+
+    def fetch(self, url, expected_sha256=None):
+        """
+        Local path of an input, downloading it only on a cache miss. The object stays pinned until
+        release(path). Raises ValueError if expected_sha256 is not a lowercase hex SHA-256 digest or the
+        content does not match it.
+        """
+        if expected_sha256 is not None and not (isinstance(expected_sha256, str) and SHA256_HEX.fullmatch(expected_sha256)):
+            raise ValueError('input_data_sha256 must be 64 lowercase hex characters')
+        key = f"sha256:{expected_sha256}" if expected_sha256 else f"url:{url}"
+        with self.lock:
+            entry = self.fetch_locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                return self._fetch_locked(url, expected_sha256, key)
+        finally:
+            with self.lock:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self.fetch_locks[key]
+
+    def _fetch_locked(self, url, expected_sha256, key):
+        """fetch() under the input's fetch lock."""
+        with self.lock:
+            sha256 = self._lookup(url, expected_sha256)
+            if sha256:
+                self._acquire(sha256)
+                print(f"[INPUT CACHE] Hit for {url} ({sha256[:12]})")
+                return self.object_path(sha256)
+        sha256 = self._download(url, expected_sha256, key)
+        with self.lock:
+            self.url_index[url] = sha256
+            self._save_index()
+            self._acquire(sha256)
+            self._changed()
+            self._evict()
+        return self.object_path(sha256)
+
+    def _partial_paths(self, key):
+        name = hashlib.sha256(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.objects_dir, f".partial-{name}"), os.path.join(self.objects_dir, f".partial-{name}.json")
+
+    def _download(self, url, expected_sha256, key):
+        """
+        Stream an input to disk, hashing as it goes. Bytes already received survive in a partial file kept per
+        locality key, so a retry (or a later fetch after a failure) asks only for the rest with Range and
+        If-Range; a server that ignores the range, or whose content changed, sends it all again.
+        """
+        partial_path, meta_path = self._partial_paths(key)
+        for attempt in range(1, DOWNLOAD_ATTEMPTS + 1):
+            try:
+                sha256 = self._download_once(url, partial_path, meta_path)
+                break
+            except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError) as e:
+                if attempt == DOWNLOAD_ATTEMPTS:
+                    raise
+                print(f"[INPUT CACHE] Download of {url} interrupted ({e}); resuming")
+        if os.path.exists(meta_path):
+            os.remove(meta_path)
+        if expected_sha256 and sha256 != expected_sha256:
+            os.remove(partial_path)
+            raise ValueError(f"Input {url} has sha256 {sha256}, expected {expected_sha256}")
+        os.replace(partial_path, self.object_path(sha256))
+        return sha256
+
+    def _download_once(self, url, partial_path, meta_path):
+        digest = hashlib.sha256()
+        offset = os.path.getsize(partial_path) if os.path.exists(partial_path) else 0
+        headers = {}
+        if offset:
+            try:
+                with open(meta_path) as f:
+                    validator = json.load(f).get('validator')
+            except (OSError, ValueError):
+                validator = None
+            if validator:
+                headers = {'Range': f"bytes={offset}-", 'If-Range': validator}
+        with requests.get(url, headers=headers, stream=True, timeout=DOWNLOAD_TIMEOUT_S) as resp:
+            if resp.status_code == 416 and offset:
+                # Nothing left to send: an earlier attempt already wrote every byte, or the content shrank
+                if resp.headers.get('Content-Range', '') == f"bytes */{offset}":
+                    with open(partial_path, 'rb') as f:
+                        for chunk in iter(lambda: f.read(DOWNLOAD_CHUNK_BYTES), b''):
+                            digest.update(chunk)
+                    return digest.hexdigest()
+                os.remove(partial_path)
+                raise requests.ConnectionError(f"range not satisfiable at byte {offset}; restarting")
+            resp.raise_for_status()
+            if resp.status_code == 206 and not resp.headers.get('Content-Range', '').startswith(f"bytes {offset}-"):
+                os.remove(partial_path)
+                raise requests.ConnectionError(f"unexpected Content-Range {resp.headers.get('Content-Range')}")
+            if resp.status_code == 206:
+                # Rebuild the hash state from the bytes already on disk, a chunk at a time
+                with open(partial_path, 'rb') as f:
+                    for chunk in iter(lambda: f.read(DOWNLOAD_CHUNK_BYTES), b''):
+                        digest.update(chunk)
+                mode = 'ab'
+                print(f"[INPUT CACHE] Resuming {url} at byte {offset}")
+            else:
+                mode = 'wb'
+                # If-Range needs a strong validator
+                etag = resp.headers.get('ETag')
+                validator = etag if etag and not etag.startswith('W/') else resp.headers.get('Last-Modified')
+                with open(meta_path, 'w') as f:
+                    json.dump({'url': url, 'validator': validator}, f)
+            with open(partial_path, mode) as f:
+                for chunk in resp.iter_content(DOWNLOAD_CHUNK_BYTES):
+                    digest.update(chunk)
+                    f.write(chunk)
+        return digest.hexdigest()
+
+    def release(self, path):
+        sha256 = os.path.basename(path)
+        with self.lock:
+            count = self.in_use.get(sha256, 0) - 1
+            if count > 0:
+                self.in_use[sha256] = count
+            else:
+                self.in_use.pop(sha256, None)
+            self._evict()
+
+    def _evict(self):
+        """
+        Drop least recently used objects until under max_bytes; caller holds the lock. Partial downloads
+        count towards max_bytes: those no fetch is working on go first, and any left over
+        PARTIAL_RETENTION_S are deleted regardless.
+        """
+        active = {os.path.basename(self._partial_paths(key)[0]) for key in self.fetch_locks}
+        entries = []
+        partials = []
+        total = 0
+        now = time.time()
+        for name in os.listdir(self.objects_dir):
+            if name.startswith('.partial-') and not name.endswith('.json'):
+                st = os.stat(self.object_path(name))
+                total += st.st_size
+                if name not in active:
+                    partials.append((st.st_mtime, name, st.st_size))
+                continue
+            if name.startswith('.'):
+                continue
+            st = os.stat(self.object_path(name))
+            entries.append((st.st_mtime, name, st.st_size))
+            total += st.st_size
+        for mtime, name, size in sorted(partials):
+            if total <= self.max_bytes and now - mtime <= PARTIAL_RETENTION_S:
+                continue
+            for path in (self.object_path(name), self.object_path(name) + '.json'):
+                if os.path.exists(path):
+                    os.remove(path)
+            total -= size
+        evicted = False
+        for _, name, size in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if name in self.in_use:
+                continue
+            os.remove(self.object_path(name))
+            total -= size
+            evicted = True
+        if evicted:
+            self.url_index = {u: h for u, h in self.url_index.items() if os.path.exists(self.object_path(h))}
+            self._save_index()
+            self._changed()
+
+    def record_image(self, image_name):
+        with self.lock:
+            if image_name not in self.images:
+                self.images.add(image_name)
+                self._changed()
+
+    def forget_image(self, image_name):
+        with self.lock:
+            if image_name in self.images:
+                self.images.discard(image_name)
+                self._changed()
+
+    def _changed(self):
+        self.version += 1
+        self._summary = None
+
+    def summary(self):
+        """Bloom filters of cached input keys and pulled images, for the node's offers."""
+        with self.lock:
+            if self._summary is None:
+                self._load_index()
+                hashes = [n for n in os.listdir(self.objects_dir) if not n.startswith('.')]
+                input_keys = [f"url:{u}" for u, h in self.url_index.items() if h in hashes] + \
+                    [f"sha256:{h}" for h in hashes]
+                self._summary = {
+                    'version': self.version,
+                    'inputs': BloomFilter.for_keys(input_keys).to_summary() if input_keys else None,
+                    'images': BloomFilter.for_keys(f"image:{i}" for i in self.images).to_summary() if self.images else None,
+                }
+            return self._summary
+
+
+input_cache = InputCache()
+
+
+def locality_score(locality, payload):
+    """
+    Share of a task's data a node advertises having: one part for the input, one for the image.
+    0.0 when the task names neither or the offer carries no summary.
+    """
+    groups = [(input_keys(payload), 'inputs'), (image_keys(payload), 'images')]
+    groups = [(keys, name) for keys, name in groups if keys]
+    if not groups or not locality:
+        return 0.0
+    held = 0
+    for keys, name in groups:
+        bloom = BloomFilter.from_summary(locality.get(name))
+        if bloom is not None and any(key in bloom for key in keys):
+            held += 1
+    return held / len(groups)
@@ -1,3 +1,9 @@
+import sys
+from script_engine import SCRIPT_WORKER_FLAG, worker_main
+if __name__ == '__main__' and sys.argv[1:2] == [SCRIPT_WORKER_FLAG]:
+    # A PyInstaller build has no separate interpreter, so script workers start as the node executable
+    worker_main()
+    sys.exit(0)
 from flask import Flask, jsonify
 import argparse
 import threading
@@ -7,8 +13,13 @@ from esp_handler import register_routes as register_esp_routes
 from auth import register_routes as register_auth_routes
 from chord import initialize_chord, register_routes as register_chord_routes, join_chord, print_finger_table, publish_offer
 from resource_manager import start_resource_monitor, get_latest_stats
-from scheduler import scheduler_bp
-from executor import executor_bp
+from capacity import calibrate_capacity, get_capacity_profile
+from scheduler import scheduler_bp, start_scheduler_queue, start_speculation_monitor
+from executor import executor_bp, start_lease_sweeper
+from warm_pool import start_warm_pool
+from script_engine import start_script_pool
+from offer_view import offer_view_bp, start_offer_view_subscriber
+from result_tracker import result_tracker_bp
 import os
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
@@ -17,13 +28,9 @@ import psutil
 app = Flask(__name__)
 
 def get_actual_capacity():
-    # Use available CPU and RAM to estimate capacity
-    cpu_count = psutil.cpu_count(logical=False) or 1
-    cpu_freq = psutil.cpu_freq()
-    cpu_ghz = cpu_freq.max/1000.0 if cpu_freq else 2.0
-    ram_gb = psutil.virtual_memory().total / (1024**3)
-    # Example: weighted sum (customize as needed)
-    return int((cpu_count * cpu_ghz * 1000) + (ram_gb * 100))
+    # Calibrated ESP throughput under cgroup limits (cached per machine, see capacity.py)
+    profile = get_capacity_profile() or calibrate_capacity()
+    return profile['capacity_score']
 
 parser = argparse.ArgumentParser(description="Edge Server Node")
 parser.add_argument("--ip", type=str, required=True)
@@ -31,8 +38,11 @@ parser.add_argument("--port", type=int, required=True)
 parser.add_argument("--promised_capacity", type=int, required=False, help="(Deprecated) Simulated capacity. Actual system resources will be used.")
 parser.add_argument("--bootstrap", type=str, required=False)
 parser.add_argument("--debug", action='store_true')
+parser.add_argument("--recalibrate", action='store_true', help="Ignore the cached capacity calibration and re-run the benchmark")
 args = parser.parse_args()
 
+calibrate_capacity(force=args.recalibrate)
+
 node_info = {
     "ip": args.ip,
     "port": args.port,
@@ -48,6 +58,8 @@ register_esp_routes(app)
 register_chord_routes(app)
 app.register_blueprint(scheduler_bp)
 app.register_blueprint(executor_bp)
+app.register_blueprint(offer_view_bp)
+app.register_blueprint(result_tracker_bp)
 
 initialize_chord()
 
@@ -77,6 +89,22 @@ def periodic_offer_advertisement():
 
 threading.Thread(target=periodic_offer_advertisement, daemon=True).start()
 
+# Local offer view for the scheduler, refreshed from the DHT and by peer pushes
+start_offer_view_subscriber()
+
+# Deadline-ordered scheduling queue behind /submit_task
+start_scheduler_queue()
+start_speculation_monitor()
+
+# Expire uncommitted executor reservations
+start_lease_sweeper()
+
+# Pre-created containers for hot task images
+start_warm_pool()
+
+# Warm interpreters for python_script tasks
+start_script_pool()
+
 if args.bootstrap:
     def delayed_join():
         time.sleep(2)  
@@ -0,0 +1,127 @@
+import threading
+import time
+
+OVERRUN_TOLERANCE = 0.10  # usage this far above resource_requirements counts as an overrun
+
+
+def blkio_bytes(stats):
+    """(read, write) bytes from a Docker stats sample (cgroup v1 and v2 both report io_service_bytes)."""
+    read = write = 0
+    for entry in (stats.get('blkio_stats') or {}).get('io_service_bytes_recursive') or []:
+        op = entry.get('op', '').lower()
+        if op == 'read':
+            read += entry.get('value', 0)
+        elif op == 'write':
+            write += entry.get('value', 0)
+    return read, write
+
+
+def network_bytes(stats):
+    networks = (stats.get('networks') or {}).values()
+    return sum(n.get('rx_bytes', 0) for n in networks), sum(n.get('tx_bytes', 0) for n in networks)
+
+
+class ContainerMeter:
+    """
+    Per-task usage from a container's Docker stats stream (about one sample a second), sampled on a
+    background thread while the task runs. Counters are cumulative per container, so a warm container
+    (from_zero=False) is metered from a baseline read when the meter starts, before the task runs; a fresh
+    container from zero. The memory peak is the highest usage sampled during the task, plus, for a fresh
+    container, the kernel's own high-water mark; a recycled container's mark may come from an earlier task.
+    """
+    def __init__(self, container, from_zero=True):
+        self.container = container
+        self.from_zero = from_zero
+        self.baseline = None
+        self.latest = None
+        self.memory_peak = 0
+        self.samples = 0
+        self.started = time.time()
+        self.stopped = threading.Event()
+        self.lock = threading.Lock()
+        self.thread = threading.Thread(target=self._sample, daemon=True)
+
+    def start(self):
+        """Start sampling; call before the task runs."""
+        if not self.from_zero:
+            try:
+                stats = self.container.stats(stream=False, one_shot=True)
+                if stats.get('read') and not stats['read'].startswith('0001-'):
+                    self.baseline = self._counters(stats)
+            except Exception as e:
+                print(f"[METERING] Baseline stats for container {self.container.id[:12]} failed: {e}")
+        self.started = time.time()
+        self.thread.start()
+        return self
+
+    @staticmethod
+    def _counters(stats):
+        cpu_ns = ((stats.get('cpu_stats') or {}).get('cpu_usage') or {}).get('total_usage', 0)
+        return (cpu_ns,) + blkio_bytes(stats) + network_bytes(stats)
+
+    def _add(self, stats):
+        if not stats.get('read') or stats['read'].startswith('0001-'):
+            return  # a stopped container reports an empty sample
+        counters = self._counters(stats)
+        memory = stats.get('memory_stats') or {}
+        with self.lock:
+            if self.baseline is None:
+                # Without a baseline read, a warm container falls back to its first sample
+                self.baseline = (0,) * len(counters) if self.from_zero else counters
+            self.latest = counters
+            self.memory_peak = max(self.memory_peak, memory.get('usage', 0),
+                                   memory.get('max_usage', 0) if self.from_zero else 0)
+            self.samples += 1
+
+    def _sample(self):
+        try:
+            for stats in self.container.stats(stream=True, decode=True):
+                if self.stopped.is_set():
+                    return
+                self._add(stats)
+        except Exception as e:
+            if not self.stopped.is_set():
+                print(f"[METERING] Stats stream for container {self.container.id[:12]} ended: {e}")
+
+    def stop(self, final_sample=False):
+        """Stop sampling and return the usage summary; final_sample reads once more (container still up)."""
+        self.stopped.set()
+        if final_sample:
+            try:
+                self._add(self.container.stats(stream=False, one_shot=True))
+            except Exception as e:
+                print(f"[METERING] Final stats sample failed: {e}")
+        wall_s = time.time() - self.started
+        with self.lock:
+            if self.latest is None:
+                return {'samples': 0, 'wall_s': round(wall_s, 3)}
+            cpu_ns, read, write, rx, tx = (now - base for now, base in zip(self.latest, self.baseline))
+            return usage_summary(cpu_ns, self.memory_peak, read, write, rx, tx, wall_s, self.samples)
+
+
+def usage_summary(cpu_ns, memory_peak_bytes, blkio_read, blkio_write, net_rx, net_tx, wall_s, samples):
+    """Usage report for a task; memory_peak_bytes is None when no peak can be attributed to the task."""
+    return {
+        'cpu_ns': int(cpu_ns),
+        'cpu_cores_avg': round(cpu_ns / 1e9 / wall_s, 3) if wall_s > 0 else 0.0,
+        'memory_peak_bytes': None if memory_peak_bytes is None else int(memory_peak_bytes),
+        'blkio_read_bytes': int(blkio_read),
+        'blkio_write_bytes': int(blkio_write),
+        'net_rx_bytes': int(net_rx),
+        'net_tx_bytes': int(net_tx),
+        'wall_s': round(wall_s, 3),
+        'samples': samples,
+    }
+
+
+def overruns(usage, reqs, tolerance=OVERRUN_TOLERANCE):
+    """Resources a task used beyond its stated resource_requirements, e.g. ['cpu_cores', 'ram_gb']."""
+    over = []
+    if not usage.get('samples'):
+        return over
+    if 'cpu_cores' in reqs and usage['cpu_cores_avg'] > reqs['cpu_cores'] * (1 + tolerance):
+        over.append('cpu_cores')
+    peak = usage.get('memory_peak_bytes')
+    if 'ram_gb' in reqs and peak is not None and peak > reqs['ram_gb'] * 1024 ** 3 * (1 + tolerance):
+        over.append('ram_gb')
+    return over
@@ -1,10 +1,41 @@
 import json
+from codec import pack, unpack
 from Crypto.Hash import SHA256
 from Crypto.Signature import DSS
 from Crypto.PublicKey import ECC
 from datetime import datetime
+import threading
+import time
 import uuid
 
+# --- Cached offer re-signing ---
+OFFER_TTL = 300  # seconds; schedulers ignore offers older than this
+OFFER_REFRESH_MARGIN = 60  # re-sign this long before the current offer would go stale
+# Re-sign when a stat moves by more than this (absolute units of the stat)
+OFFER_STAT_THRESHOLDS = {
+    'cpu_percent': 10.0,
+    'memory_available_gb': 0.5,
+    'disk_free_gb': 1.0,
+    'cpu_cores_logical': 0,
+}
+# ...and when a forecast headroom moves by more than this, at any advertised horizon
+OFFER_FORECAST_THRESHOLDS = {
+    'cpu_headroom_cores': 0.5,
+    'memory_headroom_gb': 0.5,
+}
+# current_load is in ESP load units; re-sign when it moves by this share of promised_capacity (at least one unit)
+OFFER_LOAD_THRESHOLD_FRACTION = 0.1
+# The stats an offer advertises: only what placement reads (scoring, evaluate_offer, offer_view) and the
+# re-sign thresholds above. Smoothing state and window percentiles stay local.
+OFFER_STATS_FIELDS = (
+    'cpu_percent',
+    'cpu_cores_logical',
+    'cpu_cores_effective',
+    'memory_available_gb',
+    'disk_free_gb',
+)
+OFFER_FORECAST_FIELDS = ('cpu_headroom_cores', 'memory_headroom_gb')
+
 def create_resource_offer(node_info, resource_stats, private_key):
     """
     Create and sign a resource offer JSON object.
@@ -30,6 +61,71 @@ def create_resource_offer(node_info, resource_stats, private_key):
     offer['signature'] = signature.hex()
     return offer
 
+# Field order of the signed offer payload. New fields are only ever appended.
+OFFER_SCHEMA_VERSION = 1
+OFFER_SCHEMA = (
+    'node_id',
+    'node_address',
+    'system_stats',
+    'pricing_parameters',
+    'offer_timestamp_utc',
+    'offer_id',
+    'current_load',
+    'locality',
+)
+NODE_ID_BYTES = 20  # Chord IDs are 160-bit SHA1 values, too wide for a msgpack int
+
+def encode_offer(offer):
+    """
+    Encode offer fields into the canonical payload that gets signed.
+    The payload is produced once per offer and carried as bytes from then on.
+    """
+    values = []
+    for field in OFFER_SCHEMA:
+        value = offer.get(field)
+        if field == 'node_id' and value is not None:
+            value = int(value).to_bytes(NODE_ID_BYTES, 'big')
+        values.append(value)
+    return pack([OFFER_SCHEMA_VERSION] + values)
+
+def decode_offer(encoded):
+    """Decode a canonical offer payload back into a dict of offer fields."""
+    version, *values = unpack(encoded)
+    if version != OFFER_SCHEMA_VERSION:
+        raise ValueError(f"Unsupported offer schema version: {version}")
+    offer = dict(zip(OFFER_SCHEMA, values))
+    if offer.get('node_id') is not None:
+        offer['node_id'] = int.from_bytes(offer['node_id'], 'big')
+    return offer
+
+def offer_to_wire(offer):
+    """Wrap a signed offer's payload and signature for transport; the payload is not re-encoded."""
+    return pack([offer['encoded'], bytes.fromhex(offer['signature'])])
+
+def offer_from_wire(data):
+    """
+    Parse bytes produced by offer_to_wire().
+    Returns the decoded offer dict with the original 'encoded' payload and 'signature' attached.
+    """
+    encoded, signature = unpack(data)
+    offer = decode_offer(encoded)
+    offer['encoded'] = encoded
+    offer['signature'] = signature.hex()
+    return offer
+
+def _json_safe(value):
+    if isinstance(value, bytes):
+        return value.hex()
+    if isinstance(value, dict):
+        return {k: _json_safe(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_json_safe(v) for v in value]
+    return value
+
+def offer_to_json(offer):
+    """JSON-safe view of an offer (drops the binary payload, hex-encodes locality filters)."""
+    return {k: _json_safe(v) for k, v in offer.items() if k != 'encoded'}
+
 def verify_resource_offer(offer, public_key):
     """
     Verify a resource offer's signature.
@@ -40,10 +136,14 @@ def verify_resource_offer(offer, public_key):
         bool: True if valid, False otherwise
     """
     signature = bytes.fromhex(offer['signature'])
-    offer_copy = dict(offer)
-    del offer_copy['signature']
-    offer_json = json.dumps(offer_copy, sort_keys=True)
-    h = SHA256.new(offer_json.encode('utf-8'))
+    if 'encoded' in offer:
+        # Signature covers the canonical payload bytes exactly as received
+        signed_bytes = offer['encoded']
+    else:
+        offer_copy = dict(offer)
+        del offer_copy['signature']
+        signed_bytes = json.dumps(offer_copy, sort_keys=True).encode('utf-8')
+    h = SHA256.new(signed_bytes)
     verifier = DSS.new(public_key, 'fips-186-3')
     try:
         verifier.verify(h, signature)
@@ -51,27 +151,107 @@ def verify_resource_offer(offer, public_key):
     except Exception:
         return False
 
-def create_signed_resource_offer(node_info, system_stats, pricing_parameters, private_key):
+def advertised_stats(system_stats):
     """
-    Construct and sign a Resource Offer JSON object with all required fields.
+    The subset of get_latest_stats() carried in an offer. Sampled metrics are advertised smoothed (their
+    EWMA) when available, so sampling noise neither reaches schedulers nor triggers re-signs.
     """
-    from datetime import datetime
-    from Crypto.Hash import SHA256
-    from Crypto.Signature import DSS
-    import json
+    smoothed = system_stats.get('ewma') or {}
+    stats = {}
+    for key in OFFER_STATS_FIELDS:
+        value = smoothed.get(key, system_stats.get(key))
+        if value is not None:
+            stats[key] = value
+    forecast = system_stats.get('forecast')
+    if forecast:
+        stats['forecast'] = {horizon: {k: entry[k] for k in OFFER_FORECAST_FIELDS if k in entry}
+                             for horizon, entry in forecast.items()}
+    return stats
 
+def create_signed_resource_offer(node_info, system_stats, pricing_parameters, private_key):
+    """
+    Construct and sign a Resource Offer with all required fields.
+    The canonical payload is kept in offer['encoded'] and is what the signature covers.
+    """
     offer = {
         'node_id': node_info.get('chord_id'),
         'node_address': f"{node_info.get('ip')}:{node_info.get('port')}",
-        'system_stats': system_stats,
+        'system_stats': advertised_stats(system_stats),
         'pricing_parameters': pricing_parameters,
         'offer_timestamp_utc': datetime.utcnow().isoformat(),
         'offer_id': str(uuid.uuid4()),
+        'current_load': node_info.get('current_load', 0),
+        'locality': node_info.get('locality'),
     }
-    # Prepare for signing
-    offer_json = json.dumps(offer, sort_keys=True)
-    h = SHA256.new(offer_json.encode('utf-8'))
+    encoded = encode_offer(offer)
+    h = SHA256.new(encoded)
     signer = DSS.new(private_key, 'fips-186-3')
     signature = signer.sign(h)
+    offer['encoded'] = encoded
     offer['signature'] = signature.hex()
     return offer
+
+def _moved(signed, current, thresholds):
+    """True if any value in thresholds appeared, disappeared or moved past its threshold since signing."""
+    for key, threshold in thresholds.items():
+        old = signed.get(key)
+        new = current.get(key)
+        if old is None or new is None:
+            if old != new:
+                return True
+        elif abs(new - old) > threshold:
+            return True
+    return False
+
+class SignedOfferCache:
+    """
+    Holds the node's current signed offer and re-signs only when it would materially change:
+    a stat in stat_thresholds or a forecast headroom in forecast_thresholds moves past its threshold, current_load
+    moves by load_fraction of promised_capacity, pricing changes, the locality summary changes, or the offer is
+    within refresh_margin of its TTL. The wire encoding is built once per signature so it can be served as-is.
+    """
+    def __init__(self, ttl=OFFER_TTL, refresh_margin=OFFER_REFRESH_MARGIN, stat_thresholds=None, load_fraction=OFFER_LOAD_THRESHOLD_FRACTION,
+                 forecast_thresholds=None):
+        self.ttl = ttl
+        self.refresh_margin = refresh_margin
+        self.stat_thresholds = dict(OFFER_STAT_THRESHOLDS if stat_thresholds is None else stat_thresholds)
+        self.forecast_thresholds = dict(OFFER_FORECAST_THRESHOLDS if forecast_thresholds is None else forecast_thresholds)
+        self.load_fraction = load_fraction
+        self.offer = None
+        self.wire = None
+        self.signed_at = 0.0
+        self.signatures_issued = 0
+        self.lock = threading.Lock()
+
+    def needs_resign(self, node_info, system_stats, pricing_parameters):
+        if self.offer is None:
+            return True
+        if time.time() - self.signed_at >= self.ttl - self.refresh_margin:
+            return True
+        if pricing_parameters != self.offer['pricing_parameters']:
+            return True
+        if (node_info.get('locality') or {}).get('version') != (self.offer.get('locality') or {}).get('version'):
+            return True
+        load_threshold = max(1, self.load_fraction * (node_info.get('promised_capacity', 0) or 0))
+        if abs((node_info.get('current_load', 0) or 0) - (self.offer.get('current_load', 0) or 0)) >= load_threshold:
+            return True
+        signed_stats = self.offer['system_stats'] or {}
+        current_stats = advertised_stats(system_stats)
+        if _moved(signed_stats, current_stats, self.stat_thresholds):
+            return True
+        signed_forecast = signed_stats.get('forecast') or {}
+        current_forecast = current_stats.get('forecast') or {}
+        if set(signed_forecast) != set(current_forecast):
+            return True
+        return any(_moved(signed_forecast[horizon], current_forecast[horizon], self.forecast_thresholds)
+                   for horizon in current_forecast)
+
+    def get(self, node_info, system_stats, pricing_parameters, private_key):
+        """Return the current signed offer, re-signing first if needs_resign() says so."""
+        with self.lock:
+            if self.needs_resign(node_info, system_stats, pricing_parameters):
+                self.offer = create_signed_resource_offer(node_info, system_stats, pricing_parameters, private_key)
+                self.wire = offer_to_wire(self.offer)
+                self.signed_at = time.time()
+                self.signatures_issued += 1
+            return self.offer
@@ -0,0 +1,214 @@
+from flask import Blueprint, request, jsonify
+from bisect import bisect_left, bisect_right, insort
+from operator import itemgetter
+from concurrent.futures import ThreadPoolExecutor
+from peers import known_peers
+from offer_manager import OFFER_TTL, offer_from_wire, offer_to_json, verify_resource_offer
+from task_manager import parse_utc_timestamp
+import threading
+import time
+
+OFFER_VIEW_REFRESH_S = 10  # background DHT poll interval
+OFFER_VIEW_MAX_AGE_S = 300  # offers not received again (pushed or found in the DHT) for this long are expired
+OFFER_VIEW_POLL_WORKERS = 8
+
+offer_view_bp = Blueprint('offer_view', __name__)
+
+
+def offer_cores(offer):
+    stats = offer.get('system_stats') or {}
+    return stats.get('cpu_cores_effective', stats.get('cpu_cores_logical', 0)) or 0
+
+
+def offer_ram(offer):
+    return (offer.get('system_stats') or {}).get('memory_available_gb', 0) or 0
+
+
+def offer_unit_price(offer):
+    pricing = offer.get('pricing_parameters') or {}
+    return pricing.get('cpu_per_hour_usd', 0) + pricing.get('ram_gb_per_hour_usd', 0)
+
+
+class OfferView:
+    """
+    This node's local copy of every live offer in the cluster, one per node_address.
+    Sorted indexes on cores, free RAM and unit price let the scheduler answer placement queries in memory.
+    An offer's age is the time since it last reached the view: nodes re-sign only on change, so an idle node's
+    offer keeps its signing time while it is pushed and polled again. Offers past their signed OFFER_TTL are
+    dropped regardless, so a dead node's offer left in the DHT does not stay fresh.
+    """
+    INDEXES = {'cpu': offer_cores, 'ram': offer_ram, 'price': offer_unit_price}
+
+    def __init__(self, max_age_s=OFFER_VIEW_MAX_AGE_S):
+        self.max_age_s = max_age_s
+        self.offers = {}  # node_address -> offer
+        self.received_at = {}  # node_address -> local time the offer arrived
+        self.indexes = {name: [] for name in self.INDEXES}  # name -> sorted [(value, node_address)]
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.offers)
+
+    def _unindex(self, address):
+        old = self.offers.get(address)
+        if old is None:
+            return
+        for name, key in self.INDEXES.items():
+            index = self.indexes[name]
+            pos = bisect_left(index, (key(old), address))
+            if pos < len(index) and index[pos] == (key(old), address):
+                del index[pos]
+
+    def upsert(self, offer):
+        """Insert or replace a node's offer; older offers than the one held are ignored."""
+        address = offer['node_address']
+        offer_ts = parse_utc_timestamp(offer.get('offer_timestamp_utc')) or time.time()
+        with self.lock:
+            current = self.offers.get(address)
+            if current is not None:
+                if current.get('offer_id') == offer.get('offer_id'):
+                    self.received_at[address] = time.time()
+                    return False
+                current_ts = parse_utc_timestamp(current.get('offer_timestamp_utc')) or 0
+                if current_ts > offer_ts:
+                    return False
+            self._unindex(address)
+            self.offers[address] = offer
+            self.received_at[address] = time.time()
+            for name, key in self.INDEXES.items():
+                insort(self.indexes[name], (key(offer), address))
+        return True
+
+    def remove(self, address):
+        with self.lock:
+            self._unindex(address)
+            self.offers.pop(address, None)
+            self.received_at.pop(address, None)
+
+    def offer_age(self, address, now=None):
+        """Seconds since the node's offer last reached the view; caller holds the lock."""
+        return (time.time() if now is None else now) - self.received_at[address]
+
+    @staticmethod
+    def signed_age(offer, now):
+        offer_ts = parse_utc_timestamp(offer.get('offer_timestamp_utc'))
+        return 0.0 if offer_ts is None else now - offer_ts
+
+    def expire(self):
+        now = time.time()
+        with self.lock:
+            stale = [a for a, o in self.offers.items()
+                     if self.offer_age(a, now) > self.max_age_s or self.signed_age(o, now) > OFFER_TTL]
+        for address in stale:
+            self.remove(address)
+        return len(stale)
+
+    def query(self, min_cores=0, min_ram_gb=0, max_unit_price=None, max_age_s=None):
+        """
+        Offers with at least min_cores and min_ram_gb (and unit price up to max_unit_price), received within
+        max_age_s (defaults to the view's expiry age) and within their signed TTL. Candidates come from the
+        narrowest index.
+        """
+        max_age_s = self.max_age_s if max_age_s is None else max_age_s
+        now = time.time()
+        with self.lock:
+            cpu_index, ram_index, price_index = self.indexes['cpu'], self.indexes['ram'], self.indexes['price']
+            value = itemgetter(0)
+            candidate_sets = [
+                cpu_index[bisect_left(cpu_index, min_cores, key=value):],
+                ram_index[bisect_left(ram_index, min_ram_gb, key=value):],
+            ]
+            if max_unit_price is not None:
+                candidate_sets.append(price_index[:bisect_right(price_index, max_unit_price, key=value)])
+            narrowest = min(candidate_sets, key=len)
+            result = []
+            for _, address in narrowest:
+                offer = self.offers[address]
+                if offer_cores(offer) < min_cores or offer_ram(offer) < min_ram_gb:
+                    continue
+                if max_unit_price is not None and offer_unit_price(offer) > max_unit_price:
+                    continue
+                if self.offer_age(address, now) > max_age_s or self.signed_age(offer, now) > OFFER_TTL:
+                    continue
+                result.append(offer)
+        return result
+
+    def snapshot(self):
+        with self.lock:
+            return list(self.offers.values())
+
+
+offer_view = OfferView()
+
+
+def is_held(offer):
+    """True if the view already holds this exact signed offer (so it was verified when it arrived)."""
+    with offer_view.lock:
+        held = offer_view.offers.get(offer['node_address'])
+    return held is not None and held.get('offer_id') == offer.get('offer_id') and held['signature'] == offer['signature']
+
+
+def verify_peer_offer(offer):
+    """
+    Check an offer's signature against the key its node authenticated with.
+    Returns None if valid, else the reason it is rejected.
+    """
+    from auth import peer_public_key
+    public_key = peer_public_key(offer['node_address'])
+    if public_key is None:
+        return 'Unknown peer or missing public key'
+    if not verify_resource_offer(offer, public_key):
+        return 'Invalid offer signature'
+    return None
+
+
+def refresh_from_dht():
+    """Pull every known peer's offer from the DHT into the view and drop expired entries."""
+    from chord import discover_offers_by_chord_id
+    chord_ids = [peer.get('chord_id') for peer in list(known_peers.values()) if peer.get('chord_id')]
+    with ThreadPoolExecutor(max_workers=OFFER_VIEW_POLL_WORKERS) as pool:
+        for peer_offers in pool.map(discover_offers_by_chord_id, chord_ids):
+            for offer in peer_offers:
+                if not is_held(offer):
+                    rejection = verify_peer_offer(offer)
+                    if rejection:
+                        print(f"[OFFER VIEW] Dropped DHT offer from {offer.get('node_address')}: {rejection}")
+                        continue
+                offer_view.upsert(offer)
+    offer_view.expire()
+
+
+def start_offer_view_subscriber(interval=OFFER_VIEW_REFRESH_S):
+    def subscriber():
+        while True:
+            try:
+                refresh_from_dht()
+            except Exception as e:
+                print(f"[OFFER VIEW] Refresh error: {e}")
+            time.sleep(interval)
+    t = threading.Thread(target=subscriber, daemon=True)
+    t.start()
+    return t
+
+
+@offer_view_bp.route('/offers/push', methods=['POST'])
+def push_offer():
+    """Accept a peer's signed offer in wire form; the signature is checked against the peer's known key."""
+    try:
+        offer = offer_from_wire(request.get_data())
+    except Exception as e:
+        return jsonify({'error': f'Malformed offer: {e}'}), 400
+    if is_held(offer):
+        # Unchanged offer: already verified, just refresh its arrival time
+        offer_view.upsert(offer)
+        return jsonify({'status': 'unchanged'})
+    rejection = verify_peer_offer(offer)
+    if rejection:
+        return jsonify({'error': rejection}), 400
+    offer_view.upsert(offer)
+    return jsonify({'status': 'stored'})
+
+
+@offer_view_bp.route('/offers', methods=['GET'])
+def list_offers():
+    return jsonify({'offers': [offer_to_json(o) for o in offer_view.snapshot()]})
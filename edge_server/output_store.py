@@ -0,0 +1,166 @@
+import hashlib
+import hmac
+import io
+import os
+import secrets
+import shutil
+import threading
+import time
+from urllib.parse import quote
+
+OUTPUT_DIR = os.path.join(os.path.dirname(__file__), 'task_outputs')
+INLINE_OUTPUT_MAX_BYTES = 256 * 1024  # smaller outputs stay in memory and travel inside the task result
+MAX_OUTPUT_BYTES = 1024 ** 3  # output beyond this is dropped (and excluded from the checksum)
+OUTPUT_PREVIEW_BYTES = 4096
+OUTPUT_RETENTION_S = 3600  # outputs kept by reference stay retrievable this long
+OUTPUT_STORE_MAX_BYTES = 10 * 1024 ** 3  # oldest outputs are deleted beyond this
+
+
+class OutputSpool:
+    """
+    Task output captured while the task runs: kept in memory up to memory_bytes, then spilled to a file,
+    with its SHA-256 computed incrementally, so the checksum is ready when the output ends.
+    """
+    def __init__(self, task_id, max_bytes=MAX_OUTPUT_BYTES, memory_bytes=INLINE_OUTPUT_MAX_BYTES, root=OUTPUT_DIR):
+        self.task_id = task_id
+        self.max_bytes = max_bytes
+        self.memory_bytes = memory_bytes
+        self.root = root
+        self.digest = hashlib.sha256()
+        self.size = 0
+        self.truncated = False
+        self.buffer = io.BytesIO()
+        self.file = None
+        self.path = None
+
+    def write(self, chunk):
+        if self.size + len(chunk) > self.max_bytes:
+            chunk = chunk[:self.max_bytes - self.size]
+            self.truncated = True
+        if not chunk:
+            return
+        self.digest.update(chunk)
+        self.size += len(chunk)
+        if self.file is None and self.size > self.memory_bytes:
+            os.makedirs(self.root, exist_ok=True)
+            # task_id comes from the request, so it never becomes part of a file name
+            self.path = os.path.join(self.root, f".spool-{secrets.token_hex(8)}")
+            self.file = open(self.path, 'wb')
+            self.file.write(self.buffer.getvalue())
+            self.buffer = None
+            self.file.write(chunk)
+        elif self.file is not None:
+            self.file.write(chunk)
+        else:
+            self.buffer.write(chunk)
+
+    def consume(self, chunks):
+        """Drain an output stream (docker logs or exec output) into the spool."""
+        try:
+            for chunk in chunks:
+                self.write(chunk)
+        except Exception as e:
+            print(f"[OUTPUT] Output stream of task {self.task_id} ended early: {e}")
+
+    @property
+    def checksum(self):
+        return self.digest.hexdigest() if self.size else None
+
+    def preview(self, limit=OUTPUT_PREVIEW_BYTES):
+        if self.file is None:
+            return self.buffer.getvalue()[:limit]
+        with open(self.path, 'rb') as f:
+            return f.read(limit)
+
+    def finish(self):
+        if self.file is not None:
+            self.file.close()
+
+    def discard(self):
+        """Drop the spilled file unless it was handed to the output store."""
+        self.finish()
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class OutputStore:
+    """
+    Outputs too large to send inline, kept on disk for retrieval by reference through /task_output.
+    Each is guarded by a random token carried in its URL, and expires after retention_s or when the store
+    exceeds max_bytes (oldest first).
+    """
+    def __init__(self, root=OUTPUT_DIR, retention_s=OUTPUT_RETENTION_S, max_bytes=OUTPUT_STORE_MAX_BYTES):
+        self.root = root
+        self.retention_s = retention_s
+        self.max_bytes = max_bytes
+        self.outputs = {}  # task_id -> {'path' (a generated name), 'token', 'size', 'sha256', 'stored_at'}
+        self.lock = threading.Lock()
+        self.created_at = time.time()
+        self.cleared = False
+
+    def _sweep(self, now):
+        """Expire outputs by age, then by total size; caller holds the lock."""
+        total = sum(o['size'] for o in self.outputs.values())
+        for task_id, output in sorted(self.outputs.items(), key=lambda item: item[1]['stored_at']):
+            if now - output['stored_at'] <= self.retention_s and total <= self.max_bytes:
+                break
+            del self.outputs[task_id]
+            total -= output['size']
+            if os.path.exists(output['path']):
+                os.remove(output['path'])
+
+    def keep(self, spool):
+        """Take ownership of a spilled spool file; returns the token that retrieves it."""
+        spool.finish()
+        with self.lock:
+            if not self.cleared:
+                # Outputs and spools of an earlier run can no longer be retrieved
+                self.cleared = True
+                for name in os.listdir(self.root):
+                    path = os.path.join(self.root, name)
+                    if os.path.getmtime(path) < self.created_at:
+                        os.remove(path)
+            previous = self.outputs.pop(spool.task_id, None)
+            if previous is not None and os.path.exists(previous['path']):
+                os.remove(previous['path'])
+            path = os.path.join(self.root, secrets.token_hex(16))
+            shutil.move(spool.path, path)
+            spool.path = None
+            token = secrets.token_urlsafe(16)
+            self.outputs[spool.task_id] = {'path': path, 'token': token, 'size': spool.size,
+                                           'sha256': spool.checksum, 'stored_at': time.time()}
+            self._sweep(time.time())
+        return token
+
+    def lookup(self, task_id, token):
+        """Path of a stored output if the token matches, else None."""
+        with self.lock:
+            self._sweep(time.time())
+            output = self.outputs.get(task_id)
+        if output is None or not token or not hmac.compare_digest(output['token'], token):
+            return None
+        return output['path']
+
+
+output_store = OutputStore()
+
+
+def output_fields(spool):
+    """
+    Result fields for a task's output: small outputs inline in stdout_stderr, larger ones as an output_url
+    to fetch (with Range support) plus a preview. The checksum always covers the full captured output.
+    """
+    from peers import node_info, get_peer_url
+    fields = {
+        'output_checksum': spool.checksum,
+        'output_size_bytes': spool.size,
+        'output_truncated': spool.truncated,
+    }
+    if spool.file is None:
+        fields['stdout_stderr'] = spool.buffer.getvalue().decode(errors='replace')
+        return fields
+    fields['output_preview'] = spool.preview().decode(errors='replace')
+    token = output_store.keep(spool)
+    fields['output_url'] = f"{get_peer_url(node_info['ip'], node_info['port'])}/task_output/" \
+        f"{quote(spool.task_id, safe='')}?token={token}"
+    return fields
@@ -0,0 +1,51 @@
+from scoring import pack_offers, rank_offers
+
+
+def task_price(pricing, reqs):
+    """Hourly price of reqs under an offer's pricing, or None if the offer is unpriced."""
+    if 'cpu_per_hour_usd' not in pricing or 'ram_gb_per_hour_usd' not in pricing:
+        return None
+    return pricing['cpu_per_hour_usd'] * reqs.get('cpu_cores', 0) + pricing['ram_gb_per_hour_usd'] * reqs.get('ram_gb', 0)
+
+
+def first_fit_decreasing(tasks, offers, weights=None, rtt_ms=None):
+    """
+    Pack tasks onto offered nodes with first-fit-decreasing over resource_requirements.
+    Bins are the offers in score order (so "first fit" prefers the best-ranked node), each sized by its
+    free cores (forecast headroom where advertised) and free RAM. Tasks are placed largest first, where size
+    is a task's larger share of the biggest bin's cores or RAM.
+    Returns (placements, unplaced): placements maps node_address -> {'offer', 'tasks': [(task, price)]}.
+    """
+    if not tasks or not offers:
+        return {}, list(tasks)
+    # Order bins by the default multi-criteria score for a zero-size request
+    ranked = [offer for offer, _, _ in rank_offers(offers, {}, weights=weights, rtt_ms=rtt_ms)]
+    cols = pack_offers(ranked, {}, rtt_ms=rtt_ms)
+    free_cores = [min(c, h) for c, h in zip(cols['cores'].tolist(), cols['headroom'].tolist())]
+    free_ram = cols['free_ram'].tolist()
+    max_cores = max(free_cores) or 1.0
+    max_ram = max(free_ram) or 1.0
+
+    def size(task):
+        reqs = task.resource_requirements
+        return max(reqs.get('cpu_cores', 0) / max_cores, reqs.get('ram_gb', 0) / max_ram)
+
+    placements = {}
+    unplaced = []
+    for task in sorted(tasks, key=size, reverse=True):
+        reqs = task.resource_requirements
+        cpu, ram = reqs.get('cpu_cores', 0), reqs.get('ram_gb', 0)
+        for i, offer in enumerate(ranked):
+            if free_cores[i] < cpu or free_ram[i] < ram:
+                continue
+            price = task_price(offer.get('pricing_parameters') or {}, reqs)
+            if task.max_price_usd is not None and price is not None and price > task.max_price_usd:
+                continue
+            free_cores[i] -= cpu
+            free_ram[i] -= ram
+            node_bin = placements.setdefault(offer['node_address'], {'offer': offer, 'tasks': []})
+            node_bin['tasks'].append((task, price))
+            break
+        else:
+            unplaced.append(task)
+    return placements, unplaced
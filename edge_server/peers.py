@@ -2,7 +2,7 @@ import threading
 import random
 import time
 import requests
-from flask import request, jsonify, Blueprint
+from flask import request, jsonify, Blueprint, Response
 from Crypto.PublicKey import ECC
 from Crypto.Signature import DSS
 from Crypto.Hash import SHA256
@@ -14,6 +14,8 @@ misbehavior_counts = {}
 MISBEHAVIOR_THRESHOLD = 5
 MISBEHAVIOR_QUARANTINE_TIME = 300  # seconds
 quarantined_peers = {}
+peer_rtt_ms = {}  # peer_id -> EWMA of health-check round-trip time
+RTT_EWMA_ALPHA = 0.3
 
 # --- TLS/HTTPS Support ---
 HTTPS_PREFIX = "https://"
@@ -29,6 +31,28 @@ PROTOCOL = 'https' if ssl_exists else 'http'
 def get_peer_url(ip, port):
     return f"{PROTOCOL}://{ip}:{port}"
 
+def get_node_url(node_address):
+    """URL of a node given as "ip:port", the form offers, sessions and the result tracker name nodes by."""
+    ip, port = node_address.rsplit(':', 1)
+    return get_peer_url(ip, port)
+
+# Node keys persist per ip:port, so a restarted node still matches the key its peers have pinned
+NODE_KEY_DIR = os.path.join(os.path.dirname(__file__), 'node_keys')
+
+def load_or_create_key_pair(ip, port):
+    global key_pair
+    path = os.path.join(NODE_KEY_DIR, f"{ip}_{port}.pem")
+    if os.path.exists(path):
+        with open(path) as f:
+            key_pair = ECC.import_key(f.read())
+        return key_pair
+    key_pair = ECC.generate(curve='P-256')
+    os.makedirs(NODE_KEY_DIR, mode=0o700, exist_ok=True)
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'w') as f:
+        f.write(key_pair.export_key(format='PEM'))
+    return key_pair
+
 # --- Global safety check for key_pair ---
 def ensure_key_pair():
     global key_pair
@@ -41,13 +65,15 @@ def ensure_key_pair():
 
 def initialize_node(args):
     global key_pair
+    load_or_create_key_pair(args.ip, args.port)
     ensure_key_pair()
     print("[DEBUG] initialize_node called. key_pair:", key_pair)
     from chord import get_chord_id
+    from capacity import get_capacity_profile
     node_info.update({
         "ip": args.ip,
         "port": args.port,
-        "promised_capacity": int(get_actual_capacity() if 'get_actual_capacity' in globals() else args.promised_capacity or 0),
+        "promised_capacity": int(get_capacity_profile().get('capacity_score') or args.promised_capacity or 0),
         "current_load": 0,
         "public_key": key_pair.public_key().export_key(format='PEM')
     })
@@ -64,29 +90,15 @@ def initialize_node(args):
     
 
 def join_network(bootstrap_url):
-    payload = {
-        "ip": node_info["ip"],
-        "port": node_info["port"],
-        "promised_capacity": node_info["promised_capacity"],
-        "public_key": key_pair.public_key().export_key(format='PEM')
-    }
+    from auth import establish_session
+    bootstrap_host = bootstrap_url.split('://')[-1]
+    bootstrap_peer_url = get_peer_url(bootstrap_host.split(':')[0], bootstrap_host.split(':')[1])
     try:
-        response = requests.post(get_peer_url(bootstrap_url.split('://')[-1].split(':')[0], bootstrap_url.split('://')[-1].split(':')[1]) + "/register", json=payload, timeout=5, verify=ssl_exists)
-        if response.status_code == 200:
-            challenge = response.json().get('challenge')
-            h = SHA256.new(challenge.encode('utf-8'))
-            signer = DSS.new(key_pair, 'fips-186-3')
-            signature = signer.sign(h)
-            auth_payload = {
-                "ip": node_info["ip"],
-                "port": node_info["port"],
-                "promised_capacity": node_info["promised_capacity"],
-                "signature": signature.hex()
-            }
-            requests.post(get_peer_url(bootstrap_url.split('://')[-1].split(':')[0], bootstrap_url.split('://')[-1].split(':')[1]) + "/authenticate", json=auth_payload, verify=ssl_exists)
+        # Challenge-response once; later calls to the bootstrap node ride on the session key
+        if establish_session(bootstrap_peer_url, timeout=5, verify=ssl_exists):
             print(f"[SYNC] Joined network via {bootstrap_url}")
-            fetch_peer_table(get_peer_url(bootstrap_url.split('://')[-1].split(':')[0], bootstrap_url.split('://')[-1].split(':')[1]))
-            gossip_new_peer(get_peer_url(bootstrap_url.split('://')[-1].split(':')[0], bootstrap_url.split('://')[-1].split(':')[1]))
+            fetch_peer_table(bootstrap_peer_url)
+            gossip_new_peer(bootstrap_peer_url)
     except Exception as e:
         print(f"[ERROR] Could not join network: {e}")
 
@@ -117,10 +129,11 @@ def gossip_new_peer(peer_url):
         from chord import get_chord_id
         node_info["chord_id"] = get_chord_id(node_info["ip"], node_info["port"])
         
-    for peer_id, peer in known_peers.items():
+    from auth import session_post
+    for peer_id, peer in list(known_peers.items()):
         if not is_peer_quarantined(peer_id):
             try:
-                requests.post(get_peer_url(peer['ip'], peer['port']) + "/update_peer", json=node_info, timeout=3, verify=ssl_exists)
+                session_post(get_peer_url(peer['ip'], peer['port']) + "/update_peer", node_info, timeout=3, verify=ssl_exists)
             except:
                 mark_peer_misbehavior(peer_id)
 
@@ -136,21 +149,28 @@ def start_auto_discovery():
 
     threading.Thread(target=discover_peers, daemon=True).start()
 
+def record_peer_rtt(peer_id, rtt_ms):
+    """Smoothed round-trip time to a peer, used when ranking its offers."""
+    prev = peer_rtt_ms.get(peer_id)
+    peer_rtt_ms[peer_id] = rtt_ms if prev is None else RTT_EWMA_ALPHA * rtt_ms + (1 - RTT_EWMA_ALPHA) * prev
+
 def health_check():
     dead_peers = []
-    for peer_id, peer in known_peers.items():
+    for peer_id, peer in list(known_peers.items()):
         # Never remove self!
         if peer_id == f"{node_info['ip']}:{node_info['port']}":
             continue
         if not is_peer_quarantined(peer_id):
             try:
-                requests.get(get_peer_url(peer['ip'], peer['port']) + "/peer", timeout=3, verify=ssl_exists)
+                resp = requests.get(get_peer_url(peer['ip'], peer['port']) + "/peer", timeout=3, verify=ssl_exists)
+                record_peer_rtt(peer_id, resp.elapsed.total_seconds() * 1000)
             except:
                 dead_peers.append(peer_id)
                 mark_peer_misbehavior(peer_id)
     for dead in dead_peers:
         print(f"[HEALTH] Removing dead peer {dead}")
         known_peers.pop(dead, None)
+        peer_rtt_ms.pop(dead, None)
 
 def print_peer_table():
     print("\n========== UPDATED PEER TABLE ==========")
@@ -194,7 +214,8 @@ def status_endpoint():
         "chord_id": int(node_info.get("chord_id", 0) or 0),  # Ensure integer
         "current_load": int(node_info.get("current_load", 0) or 0),
         "promised_capacity": int(node_info.get("promised_capacity", 0) or 0),
-        "tasks": tasks
+        "tasks": tasks,
+        "offer_signatures_issued": offer_cache.signatures_issued,
     }
     return jsonify(status_info)
 
@@ -202,12 +223,21 @@ def register_routes(app):
     app.register_blueprint(peer_bp)
     @app.route('/update_peer', methods=['POST'])
     def update_peer():
+        from auth import verify_session_request
         data = request.json
         peer_id = f"{data['ip']}:{data['port']}"
+        # Peers may only announce themselves, under their own session
+        if verify_session_request(expected_peer=peer_id) is None:
+            return {"error": "Invalid or missing session MAC"}, 401
         # Add Chord ID if missing
         if "chord_id" not in data:
             from chord import get_chord_id
             data["chord_id"] = get_chord_id(data["ip"], data["port"])
+        # The authenticated key stays; a gossiped update cannot replace it
+        from auth import pinned_keys, pinned_keys_lock
+        with pinned_keys_lock:
+            if peer_id in pinned_keys:
+                data["public_key"] = pinned_keys[peer_id]
         known_peers[peer_id] = data
         print(f"[GOSSIP] Peer table updated with {data['ip']}:{data['port']}")
         return {"status": "peer updated"}
@@ -215,31 +245,43 @@ def register_routes(app):
     # --- Resource Offer Endpoint ---
     @app.route('/resource_offer', methods=['GET'])
     def resource_offer():
+        from offer_manager import offer_to_json
+        from codec import MSGPACK_MIMETYPE
         try:
-            offer = get_signed_resource_offer()
-            return jsonify(offer)
+            if request.args.get('format') == 'json':
+                return jsonify(offer_to_json(get_signed_resource_offer()))
+            return Response(get_signed_resource_offer_wire(), mimetype=MSGPACK_MIMETYPE)
         except Exception as e:
             return jsonify({'error': str(e)}), 500
 
 # --- Resource Offer Integration ---
-from offer_manager import create_signed_resource_offer
+from offer_manager import SignedOfferCache
 from resource_manager import get_latest_stats
+from locality import input_cache
 
 DEFAULT_PRICING = {"cpu_per_hour_usd": 0.01, "ram_gb_per_hour_usd": 0.005}
 
+offer_cache = SignedOfferCache()
+
 def get_signed_resource_offer():
     ensure_key_pair()  # Always ensure key_pair is valid
     global key_pair, node_info
     if key_pair is None:
         raise RuntimeError("[OFFER] key_pair is None! Cannot sign resource offer.")
-    print("[DEBUG] get_signed_resource_offer called. key_pair:", key_pair)
-    offer = create_signed_resource_offer(
+    # Advertise which inputs and images this node already holds, for locality-aware placement
+    node_info['locality'] = input_cache.summary()
+    # Re-signed only when stats/load/pricing/locality moved past their thresholds or the offer nears its TTL
+    return offer_cache.get(
         node_info,
         get_latest_stats(),
         DEFAULT_PRICING,
         key_pair
     )
-    return offer
+
+def get_signed_resource_offer_wire():
+    """Current offer in its pre-encoded wire form."""
+    get_signed_resource_offer()
+    return offer_cache.wire
 
 # Optionally: expose offer via a Flask endpoint or use in DHT advertisement logic
 
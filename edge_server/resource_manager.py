@@ -2,62 +2,263 @@ import psutil
 import threading
 import time
 import json
+import math
+from collections import deque
 from datetime import datetime, timezone
+from capacity import get_capacity_profile, read_cgroup_memory_usage
 
 # This will hold the latest system stats
 latest_stats = {}
 
-STATS_UPDATE_INTERVAL = 60  # seconds
+STATS_UPDATE_INTERVAL = 0.5  # seconds between samples
+HISTORY_SIZE = 1200  # samples kept in the ring buffer (10 minutes at the default interval)
+STATS_WINDOWS = (10, 60, 300)  # seconds; p50/p95 are reported for each window
+EWMA_ALPHA = 0.2
 
+# Metrics that vary over time; these get EWMA smoothing and windowed percentiles
+SAMPLED_METRICS = (
+    'cpu_percent',
+    'memory_used_percent',
+    'memory_available_gb',
+    'disk_used_percent',
+    'disk_read_bps',
+    'disk_write_bps',
+    'net_sent_bps',
+    'net_recv_bps',
+)
 
+# Short-horizon forecasting: damped Holt (EWMA level + trend) over FORECAST_STEP_S buckets of samples
+FORECAST_STEP_S = 10
+FORECAST_HORIZONS = (60, 300, 900)  # seconds ahead
+FORECAST_ALPHA = 0.3  # level smoothing
+FORECAST_BETA = 0.1  # trend smoothing
+FORECAST_PHI = 0.95  # trend damping per step, keeps 15-minute extrapolation bounded
+FORECAST_METRICS = ('cpu_percent', 'memory_available_gb')
+
+# Ring buffer of samples: dicts with 'time' (epoch seconds) plus every SAMPLED_METRICS key
+history = deque(maxlen=HISTORY_SIZE)
+history_lock = threading.Lock()
+ewma = {}
+_last_io = None
+
+# Prime psutil so the first non-blocking cpu_percent() call has a reference point
+psutil.cpu_percent(interval=None)
+
+
+def _default_partition():
+    # Default to root partition on Unix, C: on Windows
+    return 'C:/' if psutil.WINDOWS else '/'
+
+
+def _io_rates(now):
+    """Disk and network throughput since the previous call, in bytes per second."""
+    global _last_io
+    disk_io = psutil.disk_io_counters()
+    net_io = psutil.net_io_counters()
+    current = (
+        now,
+        disk_io.read_bytes if disk_io else 0,
+        disk_io.write_bytes if disk_io else 0,
+        net_io.bytes_sent if net_io else 0,
+        net_io.bytes_recv if net_io else 0,
+    )
+    previous, _last_io = _last_io, current
+    if previous is None or current[0] <= previous[0]:
+        return 0.0, 0.0, 0.0, 0.0
+    elapsed = current[0] - previous[0]
+    return tuple(max(0.0, (c - p) / elapsed) for c, p in zip(current[1:], previous[1:]))
 
 
 def get_current_system_stats(partition=None):
     """
     Returns a JSON-serializable dictionary of current system stats.
+    Non-blocking: CPU usage is measured since the previous call rather than over a fixed interval.
     """
     if partition is None:
-        # Default to root partition on Unix, C: on Windows
-        partition = 'C:/' if psutil.WINDOWS else '/'
-    cpu_percent = psutil.cpu_percent(interval=1)
-    cpu_cores_physical = psutil.cpu_count(logical=False)
-    cpu_cores_logical = psutil.cpu_count(logical=True)
+        partition = _default_partition()
     mem = psutil.virtual_memory()
-    memory_total_gb = round(mem.total / (1024 ** 3), 2)
-    memory_available_gb = round(mem.available / (1024 ** 3), 2)
-    memory_used_percent = mem.percent
+    memory_available = mem.available
+    profile = get_capacity_profile()
+    limit_bytes = (profile.get('cgroup_limits') or {}).get('memory_limit_bytes')
+    if limit_bytes:
+        # Inside a memory-limited cgroup, headroom is the limit minus what the cgroup already uses
+        usage = read_cgroup_memory_usage()
+        if usage is not None:
+            memory_available = min(memory_available, max(0, limit_bytes - usage))
     disk = psutil.disk_usage(partition)
-    disk_total_gb = round(disk.total / (1024 ** 3), 2)
-    disk_free_gb = round(disk.free / (1024 ** 3), 2)
-    disk_used_percent = disk.percent
+    disk_read_bps, disk_write_bps, net_sent_bps, net_recv_bps = _io_rates(time.time())
     timestamp_utc = datetime.utcnow().replace(tzinfo=timezone.utc).isoformat()
+    cpu_cores_logical = psutil.cpu_count(logical=True)
     return {
-        'cpu_percent': cpu_percent,
-        'cpu_cores_physical': cpu_cores_physical,
+        'cpu_percent': psutil.cpu_percent(interval=None),
+        'cpu_cores_physical': psutil.cpu_count(logical=False),
         'cpu_cores_logical': cpu_cores_logical,
-        'memory_total_gb': memory_total_gb,
-        'memory_available_gb': memory_available_gb,
-        'memory_used_percent': memory_used_percent,
-        'disk_total_gb': disk_total_gb,
-        'disk_free_gb': disk_free_gb,
-        'disk_used_percent': disk_used_percent,
+        'cpu_cores_effective': profile.get('cpu_cores_effective', cpu_cores_logical),
+        'memory_total_gb': round(mem.total / (1024 ** 3), 2),
+        'memory_limit_gb': profile.get('memory_limit_gb', round(mem.total / (1024 ** 3), 2)),
+        'memory_available_gb': round(memory_available / (1024 ** 3), 2),
+        'memory_used_percent': mem.percent,
+        'disk_total_gb': round(disk.total / (1024 ** 3), 2),
+        'disk_free_gb': round(disk.free / (1024 ** 3), 2),
+        'disk_used_percent': disk.percent,
+        'disk_read_bps': round(disk_read_bps, 1),
+        'disk_write_bps': round(disk_write_bps, 1),
+        'net_sent_bps': round(net_sent_bps, 1),
+        'net_recv_bps': round(net_recv_bps, 1),
+        'throughput_lps': profile.get('throughput_lps'),
         'timestamp_utc': timestamp_utc
     }
 
-def update_stats_periodically(interval=STATS_UPDATE_INTERVAL, partition=None):
+
+def percentile(sorted_values, q):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = math.ceil(q / 100.0 * len(sorted_values))
+    return sorted_values[min(len(sorted_values), max(1, rank)) - 1]
+
+
+def get_history(window=None):
+    """Samples from the ring buffer, oldest first; only the last `window` seconds if given."""
+    with history_lock:
+        samples = list(history)
+    if window is not None:
+        cutoff = time.time() - window
+        samples = [s for s in samples if s['time'] >= cutoff]
+    return samples
+
+
+def summarize_windows(samples, windows=STATS_WINDOWS):
+    """p50/p95 of every sampled metric over each window, keyed like {'60s': {'cpu_percent': {'p50': .., 'p95': ..}}}."""
+    now = time.time()
+    summary = {}
+    for window in windows:
+        cutoff = now - window
+        in_window = [s for s in samples if s['time'] >= cutoff]
+        metrics = {}
+        for metric in SAMPLED_METRICS:
+            values = sorted(s[metric] for s in in_window)
+            metrics[metric] = {'p50': percentile(values, 50), 'p95': percentile(values, 95)}
+        summary[f"{window}s"] = metrics
+    return summary
+
+
+class DampedHoltForecaster:
+    """
+    Incrementally updated Holt linear-trend model with a damped trend.
+    Samples are averaged into fixed-width steps; each completed step updates level and trend once.
+    """
+    def __init__(self, step_s=FORECAST_STEP_S, alpha=FORECAST_ALPHA, beta=FORECAST_BETA, phi=FORECAST_PHI):
+        self.step_s = step_s
+        self.alpha = alpha
+        self.beta = beta
+        self.phi = phi
+        self.level = None
+        self.trend = 0.0
+        self._bucket_start = None
+        self._bucket_sum = 0.0
+        self._bucket_count = 0
+
+    def add(self, value, now):
+        if self._bucket_start is None:
+            self._bucket_start = now
+        if now - self._bucket_start >= self.step_s and self._bucket_count:
+            self._update(self._bucket_sum / self._bucket_count)
+            self._bucket_start, self._bucket_sum, self._bucket_count = now, 0.0, 0
+        self._bucket_sum += value
+        self._bucket_count += 1
+
+    def _update(self, value):
+        if self.level is None:
+            self.level = value
+            return
+        prev_level = self.level
+        self.level = self.alpha * value + (1 - self.alpha) * (prev_level + self.phi * self.trend)
+        self.trend = self.beta * (self.level - prev_level) + (1 - self.beta) * self.phi * self.trend
+
+    def forecast(self, horizon_s):
+        """Predicted value horizon_s seconds ahead, or None before the first completed step."""
+        if self.level is None:
+            return None
+        steps = horizon_s / self.step_s
+        if self.phi == 1:
+            damped_steps = steps
+        else:
+            damped_steps = self.phi * (1 - self.phi ** steps) / (1 - self.phi)
+        return self.level + self.trend * damped_steps
+
+
+forecasters = {metric: DampedHoltForecaster() for metric in FORECAST_METRICS}
+
+
+def forecast_headroom(stats, horizons=FORECAST_HORIZONS):
+    """
+    Predicted free capacity per horizon, keyed like {'300s': {'cpu_headroom_percent', 'cpu_headroom_cores', 'memory_headroom_gb'}}.
+    Empty until the forecasters have seen a full step.
+    """
+    cores = stats.get('cpu_cores_effective') or stats.get('cpu_cores_logical') or 0
+    memory_limit = stats.get('memory_limit_gb') or stats.get('memory_total_gb') or 0
+    result = {}
+    with history_lock:
+        predictions = {h: {m: f.forecast(h) for m, f in forecasters.items()} for h in horizons}
+    for horizon, predicted in predictions.items():
+        if predicted['cpu_percent'] is None or predicted['memory_available_gb'] is None:
+            continue
+        cpu_headroom = min(100.0, max(0.0, 100.0 - predicted['cpu_percent']))
+        result[f"{horizon}s"] = {
+            'cpu_headroom_percent': round(cpu_headroom, 1),
+            'cpu_headroom_cores': round(cores * cpu_headroom / 100.0, 2),
+            'memory_headroom_gb': round(min(memory_limit, max(0.0, predicted['memory_available_gb'])), 2),
+        }
+    return result
+
+
+def record_sample(stats, alpha=EWMA_ALPHA):
+    sample = {k: stats[k] for k in SAMPLED_METRICS}
+    sample['time'] = time.time()
+    with history_lock:
+        history.append(sample)
+        for metric in SAMPLED_METRICS:
+            prev = ewma.get(metric)
+            ewma[metric] = sample[metric] if prev is None else alpha * sample[metric] + (1 - alpha) * prev
+        for metric, forecaster in forecasters.items():
+            forecaster.add(sample[metric], sample['time'])
+
+
+def update_stats_periodically(interval=STATS_UPDATE_INTERVAL, partition=None, windows=STATS_WINDOWS, alpha=EWMA_ALPHA):
     global latest_stats
     while True:
         try:
-            latest_stats = get_current_system_stats(partition=partition)
+            stats = get_current_system_stats(partition=partition)
+            record_sample(stats, alpha)
+            with history_lock:
+                stats['ewma'] = {k: round(v, 2) for k, v in ewma.items()}
+                samples = list(history)
+            stats['windows'] = summarize_windows(samples, windows)
+            stats['forecast'] = forecast_headroom(stats)
+            stats['sample_interval_s'] = interval
+            stats['sample_count'] = len(samples)
+            latest_stats = stats
         except Exception as e:
             latest_stats = {'error': str(e)}
         time.sleep(interval)
 
-def start_resource_monitor(interval=STATS_UPDATE_INTERVAL, partition=None):
-    t = threading.Thread(target=update_stats_periodically, args=(interval, partition), daemon=True)
+
+def start_resource_monitor(interval=STATS_UPDATE_INTERVAL, partition=None, history_size=HISTORY_SIZE, windows=STATS_WINDOWS, alpha=EWMA_ALPHA):
+    global history
+    if history_size != history.maxlen:
+        with history_lock:
+            history = deque(history, maxlen=history_size)
+    t = threading.Thread(target=update_stats_periodically, args=(interval, partition, windows, alpha), daemon=True)
     t.start()
     return t
 
-# Optionally, add a function to get the latest cached stats
+
 def get_latest_stats():
+    """
+    Latest cached stats: instantaneous values at the top level, plus
+    'ewma' (smoothed values) and 'windows' (p50/p95 per window) for the sampled metrics,
+    and 'forecast' (predicted CPU/memory headroom per horizon, see forecast_headroom()).
+    Never blocks; the sampler thread replaces the dict wholesale every interval.
+    """
     return latest_stats
@@ -0,0 +1,441 @@
+from flask import Blueprint, request, jsonify, Response, stream_with_context
+from collections import OrderedDict, deque
+from accounting import append_log_entry
+from resource_manager import percentile
+import json
+import os
+import threading
+import time
+
+MAX_TRACKED_TASKS = 10000  # oldest finished tasks are evicted beyond this
+RESULT_RETENTION_S = 3600  # finished tasks stay queryable this long
+LONG_POLL_MAX_S = 60
+STREAM_KEEPALIVE_S = 15
+COMPLETION_HISTORY = 200  # completion times kept per workload and per (node, workload)
+COMPLETION_MIN_SAMPLES = 20  # a workload needs this many completions before its p95 is trusted
+PROFILE_HISTORY = 200  # measured usages kept per image
+PROFILE_MIN_SAMPLES = 5  # an image needs this many measured runs before its profile is reported
+
+TERMINAL_STATES = ('completed', 'failed', 'no_consensus', 'expired')
+# A task only moves forward through these; register() never moves a record back
+PROGRESS_STATES = ('queued', 'dispatching', 'running')
+
+result_tracker_bp = Blueprint('result_tracker', __name__)
+
+
+class CompletionTimes:
+    """
+    Recent dispatch-to-result durations of successful replicas, per workload (see workload_key) and per node
+    and workload, so a slow image is compared with earlier runs of the same image.
+    """
+    def __init__(self, history=COMPLETION_HISTORY, min_samples=COMPLETION_MIN_SAMPLES):
+        self.history = history
+        self.min_samples = min_samples
+        self.samples = {}  # workload or (node, workload) -> deque of seconds
+        self.lock = threading.Lock()
+
+    def add(self, node, workload, duration_s):
+        with self.lock:
+            for key in (workload, (node, workload)):
+                self.samples.setdefault(key, deque(maxlen=self.history)).append(duration_s)
+
+    def _percentile(self, key, q, min_samples):
+        with self.lock:
+            values = sorted(self.samples.get(key, ()))
+        return percentile(values, q) if len(values) >= min_samples else None
+
+    def p95(self, workload):
+        """p95 completion time of a workload, or None until enough completions have been seen."""
+        return self._percentile(workload, 95, self.min_samples)
+
+    def expected(self, node, workload):
+        """Median completion time on this node, falling back to the workload's median; None if unknown."""
+        expected = self._percentile((node, workload), 50, 1)
+        return expected if expected is not None else self._percentile(workload, 50, 1)
+
+
+def workload_key(task_descriptor):
+    """What a resource profile is learned for: the task's image, or its task type when it has none."""
+    return task_descriptor.payload.get('image_name') or task_descriptor.task_type
+
+
+class ResourceProfiles:
+    """
+    Measured usage of successful runs per workload (image), from the usage executors report with results:
+    the resources a workload really needs, next to what its tasks request.
+    """
+    def __init__(self, history=PROFILE_HISTORY, min_samples=PROFILE_MIN_SAMPLES):
+        self.history = history
+        self.min_samples = min_samples
+        self.samples = {}  # workload -> deque of (cpu_cores_avg, memory_peak_gb or None, wall_s, requested)
+        self.lock = threading.Lock()
+
+    def add(self, workload, usage, requested):
+        if not usage or not usage.get('samples'):
+            return
+        peak = usage.get('memory_peak_bytes')
+        with self.lock:
+            self.samples.setdefault(workload, deque(maxlen=self.history)).append(
+                (usage['cpu_cores_avg'], None if peak is None else peak / 1024 ** 3, usage['wall_s'], requested or {}))
+
+    def profile(self, workload):
+        """
+        p50/p95 measured cores, memory and runtime, and the median request; None until enough runs.
+        Memory covers only runs whose peak could be attributed to the task (None if there are none).
+        """
+        with self.lock:
+            samples = list(self.samples.get(workload, ()))
+        if len(samples) < self.min_samples:
+            return None
+        cores, wall = sorted(s[0] for s in samples), sorted(s[2] for s in samples)
+        ram = sorted(s[1] for s in samples if s[1] is not None)
+        requested = [s[3] for s in samples]
+        return {
+            'runs': len(samples),
+            'cpu_cores_p50': round(percentile(cores, 50), 3),
+            'cpu_cores_p95': round(percentile(cores, 95), 3),
+            'ram_gb_p50': round(percentile(ram, 50), 3) if ram else None,
+            'ram_gb_p95': round(percentile(ram, 95), 3) if ram else None,
+            'wall_s_p50': round(percentile(wall, 50), 3),
+            'requested_cpu_cores_p50': percentile(sorted(r.get('cpu_cores', 0) for r in requested), 50),
+            'requested_ram_gb_p50': percentile(sorted(r.get('ram_gb', 0) for r in requested), 50),
+        }
+
+    def profiles(self):
+        with self.lock:
+            workloads = list(self.samples)
+        return {w: p for w, p in ((w, self.profile(w)) for w in workloads) if p is not None}
+
+
+class ResultTracker:
+    """
+    Scheduler-side record of every dispatched task and its replicas.
+    Executors report completions through /task_result; checksum consensus is evaluated as each replica
+    reports, and waiters on a task are woken whenever its record changes.
+    """
+    def __init__(self, max_tasks=MAX_TRACKED_TASKS, retention_s=RESULT_RETENTION_S):
+        self.max_tasks = max_tasks
+        self.retention_s = retention_s
+        self.tasks = OrderedDict()  # task_id -> record, oldest first
+        self.changed = threading.Condition()
+        self.completion_times = CompletionTimes()
+        self.resource_profiles = ResourceProfiles()
+
+    def _evict(self, now):
+        """Drop finished tasks past retention_s, then the oldest finished ones beyond max_tasks; caller holds the lock."""
+        for task_id, record in list(self.tasks.items()):
+            if record['status'] not in TERMINAL_STATES:
+                continue  # still queued or running: someone may be waiting on it
+            if len(self.tasks) <= self.max_tasks and now - record['updated_at'] <= self.retention_s:
+                break
+            del self.tasks[task_id]
+
+    def _touch(self, record):
+        record['version'] += 1
+        record['updated_at'] = time.time()
+        self.changed.notify_all()
+
+    def register(self, task_descriptor, redundant_k=1, status='dispatching'):
+        """
+        Start tracking a task before it is dispatched, so early completions are never lost.
+        Registering a task again (queued, then dispatching) updates its record in place, but never moves
+        it back: a task already running or finished keeps its status.
+        """
+        now = time.time()
+        target = max(1, redundant_k)
+        with self.changed:
+            record = self.tasks.get(task_descriptor.task_id)
+            if record is not None:
+                if record['status'] in TERMINAL_STATES:
+                    return
+                if PROGRESS_STATES.index(status) > PROGRESS_STATES.index(record['status']):
+                    record['status'] = status
+                record.update(redundant_k=target, quorum=target // 2 + 1)
+                self._touch(record)
+                return
+            self._create(task_descriptor, status, target, now)
+
+    def _create(self, task_descriptor, status, target, now):
+        """New record for a task; caller holds the lock."""
+        record = {
+            'task_id': task_descriptor.task_id,
+            'task_type': task_descriptor.task_type,
+            'workload': workload_key(task_descriptor),
+            'requested': task_descriptor.resource_requirements,
+            'status': status,
+            'redundant_k': target,
+            'quorum': target // 2 + 1,
+            'expected_checksum': task_descriptor.payload.get('expected_output_checksum'),
+            'replicas': {},
+            'consensus_checksum': None,
+            'consensus_count': 0,
+            'consensus_valid': None,
+            'dispatch_complete': False,
+            'version': 0,
+            'created_at': now,
+            'updated_at': now,
+        }
+        self.tasks[task_descriptor.task_id] = record
+        self._evict(now)
+        self._touch(record)
+
+    def unregister(self, task_id):
+        """Forget a task that was registered but never accepted (the queue turned it away)."""
+        with self.changed:
+            record = self.tasks.get(task_id)
+            if record is not None and record['status'] == 'queued':
+                del self.tasks[task_id]
+                self.changed.notify_all()
+
+    def expire(self, task_id, reason):
+        """The task was dropped before dispatch (its deadline passed while queued)."""
+        with self.changed:
+            record = self.tasks.get(task_id)
+            if record is None:
+                return
+            record['status'] = 'expired'
+            record['error'] = reason
+            self._touch(record)
+
+    def fail(self, task_id, reason):
+        """Scheduling the task failed before any replica was running; waiters get the error."""
+        with self.changed:
+            record = self.tasks.get(task_id)
+            if record is None or record['status'] not in ('queued', 'dispatching'):
+                return
+            record['status'] = 'failed'
+            record['error'] = reason
+            self._touch(record)
+
+    def expect_replica(self, task_id, executor):
+        """A replica is about to be sent to executor; from now on its result report is accepted."""
+        with self.changed:
+            record = self.tasks.get(task_id)
+            if record is None:
+                return
+            replica = record['replicas'].setdefault(executor, {'status': 'dispatching', 'agreed_price': None})
+            replica.setdefault('dispatched_at', time.time())
+            self._touch(record)
+
+    def drop_replica(self, task_id, executor):
+        """The executor refused the replica (or never got it), so it will not report."""
+        with self.changed:
+            record = self.tasks.get(task_id)
+            if record is None or record['replicas'].get(executor, {}).get('status') != 'dispatching':
+                return
+            del record['replicas'][executor]
+            self._evaluate(record)
+            self._touch(record)
+
+    def add_replica(self, task_id, executor, agreed_price=None):
+        with self.changed:
+            record = self.tasks.get(task_id)
+            if record is None:
+                return
+            replica = record['replicas'].setdefault(executor, {'status': 'running'})
+            if replica['status'] == 'dispatching':
+                replica['status'] = 'running'
+            replica['agreed_price'] = agreed_price
+            replica['dispatched_at'] = time.time()
+            if record['status'] == 'dispatching':
+                record['status'] = 'running'
+            self._touch(record)
+
+    def mark_dispatched(self, task_id):
+        """Dispatch is over: no further replicas will be added, so outstanding ones decide the outcome."""
+        with self.changed:
+            record = self.tasks.get(task_id)
+            if record is None:
+                return
+            record['dispatch_complete'] = True
+            self._evaluate(record)
+            self._touch(record)
+
+    def record_completion(self, task_id, executor, report):
+        """
+        Store one replica's report; returns the task record, or None if the task is unknown.
+        Raises PermissionError if the task was never sent to executor: only its replicas get a vote.
+        """
+        with self.changed:
+            record = self.tasks.get(task_id)
+            if record is None:
+                return None
+            replica = record['replicas'].get(executor)
+            if replica is None:
+                raise PermissionError(f"Task {task_id} was not dispatched to {executor}")
+            if replica.get('status') == 'cancelled':
+                return record
+            replica['status'] = 'completed' if report.get('status', 'completed') == 'completed' else 'failed'
+            replica['result'] = report
+            replica['reported_at'] = time.time()
+            if replica['status'] == 'completed' and replica.get('dispatched_at'):
+                self.completion_times.add(executor, record['workload'], replica['reported_at'] - replica['dispatched_at'])
+            if replica['status'] == 'completed' and report.get('exit_code') == 0:
+                self.resource_profiles.add(record['workload'], report.get('usage'), record['requested'])
+            if record['expected_checksum'] and replica['status'] == 'completed':
+                replica['checksum_valid'] = record['expected_checksum'] == report.get('output_checksum')
+            self._evaluate(record)
+            self._touch(record)
+            return record
+
+    def _evaluate(self, record):
+        if record['status'] in TERMINAL_STATES:
+            return
+        counts = {}
+        for replica in record['replicas'].values():
+            checksum = (replica.get('result') or {}).get('output_checksum')
+            if replica['status'] == 'completed' and checksum:
+                counts[checksum] = counts.get(checksum, 0) + 1
+        if counts:
+            best = max(counts, key=counts.get)
+            record['consensus_checksum'] = best
+            record['consensus_count'] = counts[best]
+            if counts[best] >= record['quorum']:
+                record['consensus_valid'] = True
+                record['status'] = 'completed'
+                return
+        completed = [r for r in record['replicas'].values() if r['status'] == 'completed']
+        if completed and record['redundant_k'] == 1:
+            # First result wins; a single replica without output has nothing to agree on
+            record['status'] = 'completed'
+            return
+        outstanding = [r for r in record['replicas'].values() if r['status'] in ('dispatching', 'running')]
+        if not record['dispatch_complete'] or outstanding:
+            return
+        if not completed:
+            record['status'] = 'failed'
+        else:
+            record['consensus_valid'] = False
+            record['status'] = 'no_consensus'
+
+    def outstanding_replicas(self, task_id):
+        """Executors still running a task that has already finished; they are marked cancelled."""
+        with self.changed:
+            record = self.tasks.get(task_id)
+            if record is None or record['status'] not in TERMINAL_STATES:
+                return []
+            executors = [e for e, r in record['replicas'].items() if r['status'] == 'running']
+            for executor in executors:
+                record['replicas'][executor]['status'] = 'cancelled'
+            if executors:
+                self._touch(record)
+            return executors
+
+    def status(self, task_id):
+        with self.changed:
+            record = self.tasks.get(task_id)
+            return None if record is None else record['status']
+
+    def running_tasks(self):
+        """(task_id, workload, first dispatch time, replica executors) for tasks still awaiting results."""
+        with self.changed:
+            return [
+                (task_id, record['workload'],
+                 min(r.get('dispatched_at', record['created_at']) for r in record['replicas'].values()),
+                 list(record['replicas']))
+                for task_id, record in self.tasks.items()
+                if record['status'] == 'running' and record['replicas']
+            ]
+
+    def snapshot(self, task_id):
+        with self.changed:
+            record = self.tasks.get(task_id)
+            return None if record is None else json.loads(json.dumps(record))
+
+    def wait_for_change(self, task_id, since_version, timeout):
+        """Block until the task's version exceeds since_version, it finishes, or timeout passes."""
+        deadline = time.time() + timeout
+        with self.changed:
+            while True:
+                record = self.tasks.get(task_id)
+                if record is None or record['version'] > since_version or record['status'] in TERMINAL_STATES:
+                    break
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                self.changed.wait(remaining)
+        return self.snapshot(task_id)
+
+
+result_tracker = ResultTracker()
+
+
+@result_tracker_bp.route('/task_result', methods=['POST'])
+def task_result():
+    """Executor completion callback, authenticated with the executor's session MAC."""
+    from auth import verify_session_request
+    executor = verify_session_request()
+    if executor is None:
+        return jsonify({'error': 'Invalid or missing session MAC'}), 401
+    report = request.get_json(silent=True)
+    if not isinstance(report, dict) or not report.get('task_id'):
+        return jsonify({'error': 'Expected a task result with task_id'}), 400
+    try:
+        record = result_tracker.record_completion(report['task_id'], executor, report)
+    except PermissionError as e:
+        print(f"[RESULTS] Rejected a result report: {e}")
+        return jsonify({'error': 'Task was not dispatched to this node'}), 403
+    if record is None:
+        return jsonify({'error': 'Unknown task'}), 404
+    replica = record['replicas'][executor]
+    if 'checksum_valid' in replica:
+        append_log_entry(
+            event_type="TASK_RESULT_CHECKSUM_VERIFIED",
+            task_id=report['task_id'],
+            node_id=os.getenv('NODE_ID', 'scheduler'),
+            details={
+                'executor': executor,
+                'expected_checksum': record['expected_checksum'],
+                'actual_checksum': report.get('output_checksum'),
+                'checksum_valid': replica['checksum_valid']
+            }
+        )
+    print(f"[RESULTS] Task {report['task_id']} replica on {executor} reported {replica['status']}; "
+          f"task is {record['status']}")
+    if record['status'] in TERMINAL_STATES:
+        from scheduler import cancel_outstanding_replicas
+        cancel_outstanding_replicas(report['task_id'])
+    return jsonify({'status': 'recorded', 'task_status': record['status']})
+
+
+@result_tracker_bp.route('/tasks/<task_id>', methods=['GET'])
+def task_status(task_id):
+    """Task status; with ?since=<version>, long-poll until it changes (at most ?timeout= seconds)."""
+    since = request.args.get('since', type=int)
+    if since is None:
+        record = result_tracker.snapshot(task_id)
+    else:
+        timeout = min(LONG_POLL_MAX_S, max(0.0, request.args.get('timeout', default=30.0, type=float)))
+        record = result_tracker.wait_for_change(task_id, since, timeout)
+    if record is None:
+        return jsonify({'error': 'Unknown task'}), 404
+    return jsonify(record)
+
+
+@result_tracker_bp.route('/resource_profiles', methods=['GET'])
+def resource_profiles():
+    """Measured resource profile per image (or task type), learned from executors' usage reports."""
+    return jsonify(result_tracker.resource_profiles.profiles())
+
+
+@result_tracker_bp.route('/tasks/<task_id>/stream', methods=['GET'])
+def task_stream(task_id):
+    """Server-sent events: one event per change to the task, ending once it reaches a terminal state."""
+    if result_tracker.snapshot(task_id) is None:
+        return jsonify({'error': 'Unknown task'}), 404
+
+    def events():
+        version = -1
+        while True:
+            record = result_tracker.wait_for_change(task_id, version, STREAM_KEEPALIVE_S)
+            if record is None:
+                return
+            if record['version'] == version:
+                yield ': keepalive\n\n'
+                continue
+            version = record['version']
+            yield f"event: status\ndata: {json.dumps(record)}\n\n"
+            if record['status'] in TERMINAL_STATES:
+                return
+    return Response(stream_with_context(events()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache'})
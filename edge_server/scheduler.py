@@ -1,127 +1,701 @@
 from flask import Blueprint, request, jsonify
-from peers import known_peers
+from peers import known_peers, peer_rtt_ms, node_info, get_peer_url, get_node_url
 from chord import discover_offers_by_chord_id
-from task_manager import TaskDescriptor
+from offer_view import offer_view
+from scoring import rank_offers, forecast_for_horizon, scoring_weights_error
+from packing import first_fit_decreasing
+from result_tracker import result_tracker, TERMINAL_STATES
+from task_queue import DeadlineQueue, estimated_runtime, RETRY_AFTER_DEFAULT_S
+from task_manager import TaskDescriptor, parse_utc_timestamp
 from accounting import append_log_entry
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED, TimeoutError as FuturesTimeoutError
+from collections import deque
+import os
+import random
+import threading
 import time
 import requests
 
+OFFER_MAX_AGE_S = 300  # ignore offers older than this
+DISCOVERY_WORKERS = 16  # shared across concurrent /submit_task requests
+DISCOVERY_TIMEOUT_S = 5.0  # upper bound on discovery, even without a deadline
+DISCOVERY_DEADLINE_FRACTION = 0.25  # share of the time left before deadline_utc spent on discovery
+
+BATCH_DISPATCH_WORKERS = 16
+BATCH_DISPATCH_TIMEOUT_S = 10
+
+DISPATCH_WORKERS = 32  # shared across concurrent /submit_task requests
+DISPATCH_TIMEOUT_S = 10  # shared deadline for all replicas of one task, substitutes included
+
+SCHEDULER_QUEUE_WORKERS = 4  # tasks scheduled concurrently from the deadline queue
+SUBMIT_WAIT_S = 30  # /submit_task waits this long for its task to be dispatched before answering 202
+DISPATCH_OVERHEAD_S = 1.0  # allowance for discovery and dispatch when checking deadline feasibility
+
+PLACEMENT_MODES = ('score', 'p2c')
+P2C_CHOICES = 2  # d: candidates sampled per placement in power-of-d-choices mode
+RECENT_DISPATCH_WINDOW_S = 300  # our own dispatches are remembered this long (at least one offer refresh)
+
+SPECULATION_CHECK_INTERVAL_S = 1.0
+MAX_SPECULATIVE_COPIES = 1  # extra replicas launched per straggling task
+CANCEL_TIMEOUT_S = 5
+RESERVATION_TTL_S = 10  # executor leases must be committed within this long
+
+discovery_pool = ThreadPoolExecutor(max_workers=DISCOVERY_WORKERS, thread_name_prefix='discovery')
+dispatch_pool = ThreadPoolExecutor(max_workers=DISPATCH_WORKERS, thread_name_prefix='dispatch')
+
+task_queue = DeadlineQueue()
+
+# node_address -> deque of (dispatch time, cpu_cores) for tasks this scheduler sent there recently
+recent_dispatches = {}
+recent_dispatches_lock = threading.Lock()
+
+# node_address -> time until which the node asked us (429/503 Retry-After) to place work elsewhere
+node_backoff = {}
+node_backoff_lock = threading.Lock()
+
+# task_id -> {'task', 'eligible' (ranked offers), 'copies'} for dispatched tasks that may be re-executed
+speculation_candidates = {}
+speculation_lock = threading.Lock()
+
 scheduler_bp = Blueprint('scheduler', __name__)
 
 @scheduler_bp.route('/submit_task', methods=['POST'])
 def submit_task():
+    """
+    Queue a task in deadline order and wait (up to SUBMIT_WAIT_S) for it to be dispatched.
+    Tasks whose deadline cannot be met are rejected with 422; a task still queued after the wait gets 202.
+    A full queue answers 429 with a Retry-After based on how fast the queue is draining.
+    With redundant_k > 1, that many replicas are dispatched concurrently and must agree on the output.
+    """
     data = request.json
     try:
         task = TaskDescriptor.from_dict(data)
     except Exception as e:
         return jsonify({'error': f'Invalid task descriptor: {e}'}), 400
-    result = schedule_task(task)
+    forecast_horizon_s = data.get('forecast_horizon_s')
+    if forecast_horizon_s is not None and (isinstance(forecast_horizon_s, bool) or
+                                           not isinstance(forecast_horizon_s, (int, float)) or
+                                           not 0 <= forecast_horizon_s < float('inf')):
+        return jsonify({'error': 'forecast_horizon_s must be a non-negative number of seconds'}), 400
+    weights_error = scoring_weights_error(data.get('scoring_weights'))
+    if weights_error:
+        return jsonify({'error': weights_error}), 400
+    redundant_k = data.get('redundant_k', 1)
+    if isinstance(redundant_k, bool) or not isinstance(redundant_k, int) or redundant_k < 1:
+        return jsonify({'error': 'redundant_k must be a positive integer'}), 400
+    if data.get('placement', 'score') not in PLACEMENT_MODES:
+        return jsonify({'error': f"placement must be one of {', '.join(PLACEMENT_MODES)}"}), 400
+    p2c_choices = data.get('p2c_choices', P2C_CHOICES)
+    if isinstance(p2c_choices, bool) or not isinstance(p2c_choices, int) or p2c_choices < 1:
+        return jsonify({'error': 'p2c_choices must be a positive integer'}), 400
+    age_error = max_offer_age_error(data.get('max_offer_age_s'))
+    if age_error:
+        return jsonify({'error': age_error}), 400
+    rejection = check_deadline_feasible(task, forecast_horizon_s)
+    if rejection:
+        return jsonify({'task_id': task.task_id, 'error': rejection}), 422
+    # Tracked before it is queued, so a worker that dispatches or finishes it first is never overwritten
+    result_tracker.register(task, redundant_k, status='queued')
+    future = task_queue.push(task, {
+        'redundant_k': redundant_k,
+        'forecast_horizon_s': forecast_horizon_s,
+        'early_exit': bool(data.get('discovery_early_exit', False)),
+        'max_offer_age_s': data.get('max_offer_age_s'),
+        'scoring_weights': data.get('scoring_weights'),
+        'placement': data.get('placement', 'score'),
+        'p2c_choices': p2c_choices,
+    })
+    if future is None:
+        result_tracker.unregister(task.task_id)
+        retry_after = task_queue.drained.retry_after(len(task_queue))
+        return jsonify({'task_id': task.task_id, 'error': 'Scheduler queue is full'}), 429, {'Retry-After': str(retry_after)}
+    remaining = task.seconds_until_deadline()
+    try:
+        result = future.result(timeout=SUBMIT_WAIT_S if remaining is None else max(0.0, min(SUBMIT_WAIT_S, remaining)))
+    except FuturesTimeoutError:
+        return jsonify({'task_id': task.task_id, 'status': 'queued', 'status_url': f"/tasks/{task.task_id}"}), 202
     return jsonify(result)
 
-def schedule_task(task_descriptor, redundant_k=1):
+@scheduler_bp.route('/queue', methods=['GET'])
+def queue_status():
+    return jsonify(task_queue.stats())
+
+@scheduler_bp.route('/submit_tasks', methods=['POST'])
+def submit_tasks():
+    """Batch submission: {"tasks": [TaskDescriptor, ...], "max_offer_age_s": ..., "scoring_weights": {...}}."""
+    data = request.json
+    if not isinstance(data, dict) or not isinstance(data.get('tasks'), list) or not data['tasks']:
+        return jsonify({'error': 'Expected {"tasks": [...]} with at least one task'}), 400
+    try:
+        tasks = [TaskDescriptor.from_dict(item) for item in data['tasks']]
+    except Exception as e:
+        return jsonify({'error': f'Invalid task descriptor: {e}'}), 400
+    weights_error = scoring_weights_error(data.get('scoring_weights'))
+    if weights_error:
+        return jsonify({'error': weights_error}), 400
+    age_error = max_offer_age_error(data.get('max_offer_age_s'))
+    if age_error:
+        return jsonify({'error': age_error}), 400
+    result = schedule_batch(tasks, max_offer_age_s=data.get('max_offer_age_s'),
+                            scoring_weights=data.get('scoring_weights'))
+    return jsonify(result)
+
+def max_offer_age_error(max_offer_age_s):
+    """Why a max_offer_age_s override is unusable, or None if it is absent or a non-negative number of seconds."""
+    if max_offer_age_s is None:
+        return None
+    if isinstance(max_offer_age_s, bool) or not isinstance(max_offer_age_s, (int, float)) or \
+            not 0 <= max_offer_age_s < float('inf'):
+        return 'max_offer_age_s must be a non-negative number of seconds'
+    return None
+
+def is_offer_fresh(offer, now=None, max_age_s=OFFER_MAX_AGE_S):
+    offer_ts = parse_utc_timestamp(offer.get('offer_timestamp_utc'))
+    if offer_ts is None:
+        return True
+    return (time.time() if now is None else now) - offer_ts <= max_age_s
+
+def evaluate_offer(offer, reqs, max_price, forecast_horizon_s=None):
     """
-    Basic scheduling: discover resource offers, filter by requirements, select best-fit, dispatch task.
+    Check an offer against a task's requirements.
+    Returns (eligible, total_price); total_price is None unless max_price is set and the offer has pricing.
     """
-    offers = []
-    now = time.time()
-    # 1. Resource Discovery: iterate known peers, query their DHT offer
-    for peer_id, peer in known_peers.items():
-        chord_id = peer.get('chord_id')
-        if not chord_id:
-            continue
-        peer_offers = discover_offers_by_chord_id(chord_id)
-        # Only keep offers from the last 5 minutes
-        for offer in peer_offers:
-            offer_time = offer.get('offer_timestamp_utc')
-            if offer_time:
-                try:
-                    offer_ts = time.mktime(time.strptime(offer_time[:19], "%Y-%m-%dT%H:%M:%S"))
-                    if now - offer_ts > 300:
-                        continue
-                except Exception:
-                    pass
-            offers.append(offer)
-    # 2. Node Filtering: check resource requirements
+    stats = offer.get('system_stats', {})
+    pricing = offer.get('pricing_parameters', {})
+    price_ok = True
+    total_price = None
+    if max_price is not None and 'cpu_per_hour_usd' in pricing and 'ram_gb_per_hour_usd' in pricing:
+        # Estimate total price for this task's requirements
+        cpu_price = pricing['cpu_per_hour_usd'] * reqs.get('cpu_cores', 0)
+        ram_price = pricing['ram_gb_per_hour_usd'] * reqs.get('ram_gb', 0)
+        total_price = cpu_price + ram_price
+        price_ok = total_price <= max_price
+    cpu_cores = stats.get('cpu_cores_effective', stats.get('cpu_cores_logical', 0))
+    forecast_ok = True
+    if forecast_horizon_s is not None:
+        # Offers without a forecast fall back to the snapshot check below
+        predicted = forecast_for_horizon(stats, forecast_horizon_s)
+        if predicted is not None:
+            forecast_ok = predicted['cpu_headroom_cores'] >= reqs.get('cpu_cores', 0) and \
+                predicted['memory_headroom_gb'] >= reqs.get('ram_gb', 0)
+    eligible = cpu_cores >= reqs.get('cpu_cores', 0) and \
+        stats.get('memory_available_gb', 0) >= reqs.get('ram_gb', 0) and price_ok and forecast_ok
+    return eligible, total_price
+
+def discovery_budget(task_descriptor):
+    """Seconds we may spend on discovery: a share of the time left before the task's deadline, capped."""
+    remaining = task_descriptor.seconds_until_deadline()
+    if remaining is None:
+        return DISCOVERY_TIMEOUT_S
+    return max(0.0, min(DISCOVERY_TIMEOUT_S, remaining * DISCOVERY_DEADLINE_FRACTION))
+
+def discover_offers(budget, evaluate=None, enough=None, label='batch'):
+    """
+    Query every known peer's DHT offers concurrently on the bounded discovery pool, within budget seconds.
+    evaluate(offer) -> (eligible, total_price) filters offers (all fresh offers pass if None); with enough,
+    stop as soon as that many eligible offers have arrived. Returns a list of (offer, total_price).
+    """
+    started = time.time()
+    chord_ids = [peer.get('chord_id') for peer in list(known_peers.values()) if peer.get('chord_id')]
+    futures = [discovery_pool.submit(discover_offers_by_chord_id, chord_id, max(budget, 0.1))
+               for chord_id in chord_ids]
     eligible = []
+    try:
+        for future in as_completed(futures, timeout=budget):
+            try:
+                peer_offers = future.result()
+            except Exception as e:
+                print(f"[SCHEDULER] Offer discovery failed: {e}")
+                continue
+            now = time.time()
+            for offer in peer_offers:
+                if not is_offer_fresh(offer, now):
+                    continue
+                ok, total_price = evaluate(offer) if evaluate else (True, None)
+                if ok:
+                    eligible.append((offer, total_price))
+            if enough and len(eligible) >= enough:
+                break
+    except FuturesTimeoutError:
+        print(f"[SCHEDULER] Discovery deadline of {budget:.2f}s reached with {len(eligible)} eligible offers")
+    finally:
+        for future in futures:
+            future.cancel()
+    print(f"[SCHEDULER] Discovery for {label}: {len(eligible)} eligible offers from "
+          f"{len(chord_ids)} peers in {time.time() - started:.3f}s (budget {budget:.2f}s)")
+    return eligible
+
+def discover_eligible_offers(task_descriptor, redundant_k=1, forecast_horizon_s=None, early_exit=False):
+    """
+    DHT discovery for one task within its discovery budget.
+    With early_exit, stop as soon as redundant_k eligible offers have arrived.
+    """
     reqs = task_descriptor.resource_requirements
     max_price = task_descriptor.max_price_usd
-    for offer in offers:
-        stats = offer.get('system_stats', {})
-        pricing = offer.get('pricing_parameters', {})
-        price_ok = True
-        if max_price is not None and 'cpu_per_hour_usd' in pricing and 'ram_gb_per_hour_usd' in pricing:
-            # Estimate total price for this task's requirements
-            cpu_price = pricing['cpu_per_hour_usd'] * reqs.get('cpu_cores', 0)
-            ram_price = pricing['ram_gb_per_hour_usd'] * reqs.get('ram_gb', 0)
-            total_price = cpu_price + ram_price
-            price_ok = total_price <= max_price
-        if stats.get('cpu_cores_logical', 0) >= reqs.get('cpu_cores', 0) and \
-           stats.get('memory_available_gb', 0) >= reqs.get('ram_gb', 0) and price_ok:
-            eligible.append((offer, total_price if price_ok and max_price is not None else None))
-    # 3. Node Selection & 4. Task Dispatch: Auction - pick lowest price
-    if max_price is not None and eligible:
-        eligible.sort(key=lambda x: x[1] if x[1] is not None else float('inf'))
-    # Redundant execution: send to multiple nodes if redundant_k > 1
-    results = []
-    for idx, offer_tuple in enumerate(eligible):
-        if redundant_k > 0 and idx >= redundant_k:
-            break
-        offer = offer_tuple[0]
-        try:
-            url = f"http://{offer['node_address']}/execute_task"
+    return discover_offers(
+        discovery_budget(task_descriptor),
+        evaluate=lambda offer: evaluate_offer(offer, reqs, max_price, forecast_horizon_s),
+        enough=max(1, redundant_k) if early_exit else None,
+        label=task_descriptor.task_id,
+    )
+
+def check_deadline_feasible(task_descriptor, forecast_horizon_s=None):
+    """
+    Admission check: None if the task can still meet its deadline, else the reason it cannot.
+    The time left must cover the estimated runtime plus dispatch overhead, and (once the offer view is warm)
+    some offer must pass the same checks placement will apply, including forecast headroom at
+    forecast_horizon_s only when the client asked for it.
+    """
+    remaining = task_descriptor.seconds_until_deadline()
+    if remaining is None:
+        return None
+    if remaining <= 0:
+        return 'Deadline has already passed'
+    runtime = estimated_runtime(task_descriptor)
+    if remaining < runtime + DISPATCH_OVERHEAD_S:
+        return f'Deadline infeasible: {remaining:.1f}s left for an estimated {runtime:.1f}s runtime'
+    if len(offer_view):
+        feasible = rank_offers(
+            query_offer_view(task_descriptor),
+            task_descriptor.resource_requirements,
+            max_price=task_descriptor.max_price_usd,
+            forecast_horizon_s=forecast_horizon_s,
+            top_k=1,
+        )
+        if not feasible:
+            return 'Deadline infeasible: no current offer can take the task'
+    return None
+
+def query_offer_view(task_descriptor, max_offer_age_s=None):
+    """Candidate offers from the local offer view that meet the core/RAM minimums; no network round trips."""
+    reqs = task_descriptor.resource_requirements
+    return offer_view.query(
+        min_cores=reqs.get('cpu_cores', 0),
+        min_ram_gb=reqs.get('ram_gb', 0),
+        max_age_s=OFFER_MAX_AGE_S if max_offer_age_s is None else max_offer_age_s,
+    )
+
+def reserve_on_node(node_address, tasks, timeout=DISPATCH_TIMEOUT_S):
+    """
+    Phase one of placement: lease each task's resource_requirements on the node for RESERVATION_TTL_S.
+    Returns ({task_id: lease_id}, error): refused tasks are missing from the leases, and a refusal (503) also
+    backs the node off. Leases are None for a node without /reserve. Raises if the node cannot be reached.
+    """
+    from auth import session_post
+    resp = session_post(get_node_url(node_address) + "/reserve", {
+        'reservations': [{'task_id': task.task_id, 'resource_requirements': task.resource_requirements} for task in tasks],
+        'ttl_s': RESERVATION_TTL_S,
+    }, timeout=timeout, verify=False)
+    if resp.status_code == 404:
+        return None, None
+    if resp.status_code not in (200, 503):
+        return None, f'Reservation on {node_address} returned status {resp.status_code}'
+    if resp.status_code == 503:
+        note_backpressure(node_address, retry_after_seconds(resp))
+    leases = {lease['task_id']: lease['lease_id'] for lease in resp.json().get('leases', [])}
+    return leases, None
+
+def dispatch_batch(node_address, node_tasks):
+    """Reserve for every task placed on one node, then commit the leased ones in a single /execute_tasks request."""
+    url = get_node_url(node_address) + "/execute_tasks"
+    try:
+        tasks = [task for task, _ in node_tasks]
+        leases, error = reserve_on_node(node_address, tasks, BATCH_DISPATCH_TIMEOUT_S)
+        if error:
+            return {'error': error}
+        leases = {task.task_id: None for task in tasks} if leases is None else leases
+        refused = [{'task_id': task.task_id, 'error': 'Reservation refused'} for task in tasks if task.task_id not in leases]
+        tasks = [task for task in tasks if task.task_id in leases]
+        if not tasks:
+            return {'accepted': [], 'rejected': refused}
+        body = [dict(task.to_dict(), lease_id=leases[task.task_id]) for task in tasks]
+        if any(item['lease_id'] for item in body):
+            # A commit must come from the session that holds the leases
+            from auth import session_post
+            resp = session_post(url, {'tasks': body}, timeout=BATCH_DISPATCH_TIMEOUT_S, verify=False)
+        else:
+            resp = requests.post(url, json={'tasks': body}, timeout=BATCH_DISPATCH_TIMEOUT_S, verify=False)
+        if resp.status_code == 200:
+            result = resp.json()
+            result['rejected'] = result.get('rejected', []) + refused
+            return result
+        if resp.status_code in (429, 503):
+            note_backpressure(node_address, retry_after_seconds(resp))
+        return {'error': f'Executor {node_address} returned status {resp.status_code}', 'details': resp.text}
+    except Exception as e:
+        return {'error': f'Failed to dispatch batch to {node_address}: {e}'}
+
+def schedule_batch(tasks, max_offer_age_s=None, scoring_weights=None):
+    """
+    Place a batch of tasks with one discovery pass and first-fit-decreasing bin packing,
+    then send each chosen node a single batched dispatch.
+    """
+    expired = [task for task in tasks if (task.seconds_until_deadline() or 0) < 0]
+    tasks = [task for task in tasks if task not in expired]
+    for task in expired:
+        drop_expired_task(task)
+    if not tasks:
+        return {'placements': [], 'unplaced': [], 'expired': [task.task_id for task in expired], 'dispatch': {}}
+    # 1. Resource Discovery, once for the whole batch (budget set by the most urgent task)
+    if len(offer_view):
+        offers = offer_view.query(max_age_s=OFFER_MAX_AGE_S if max_offer_age_s is None else max_offer_age_s)
+    else:
+        budget = min(discovery_budget(task) for task in tasks)
+        offers = [offer for offer, _ in discover_offers(budget, label=f"batch of {len(tasks)}")]
+    # Leave out nodes that recently pushed back, unless nothing else is available
+    ready = [offer for offer in offers if not is_backed_off(offer['node_address'])]
+    offers = ready or offers
+    # 2. Bin packing over resource_requirements
+    placements, unplaced = first_fit_decreasing(tasks, offers, weights=scoring_weights, rtt_ms=dict(peer_rtt_ms))
+    for node_address, node_bin in placements.items():
+        for task, price in node_bin['tasks']:
+            task.callback_url = result_callback_url()
+            result_tracker.register(task)
+            result_tracker.expect_replica(task.task_id, node_address)
             append_log_entry(
                 event_type="TASK_SCHEDULED_TO_NODE_X",
+                task_id=task.task_id,
+                node_id=node_bin['offer']['node_id'],
+                details={'executor': node_address, 'agreed_price': price, 'batch_size': len(node_bin['tasks'])}
+            )
+    # 3. One dispatch per node, concurrently
+    dispatch = {}
+    if placements:
+        with ThreadPoolExecutor(max_workers=min(len(placements), BATCH_DISPATCH_WORKERS)) as pool:
+            futures = {node_address: pool.submit(dispatch_batch, node_address, node_bin['tasks'])
+                       for node_address, node_bin in placements.items()}
+            dispatch = {node_address: future.result() for node_address, future in futures.items()}
+    for node_address, node_bin in placements.items():
+        accepted_ids = {accepted.get('task_id') for accepted in dispatch[node_address].get('accepted', [])}
+        retry_afters = [r['retry_after'] for r in dispatch[node_address].get('rejected', []) if 'retry_after' in r]
+        if retry_afters:
+            note_backpressure(node_address, max(retry_afters))
+        for task, price in node_bin['tasks']:
+            if task.task_id in accepted_ids:
+                result_tracker.add_replica(task.task_id, node_address, price)
+                record_dispatch(node_address, task.resource_requirements)
+            else:
+                result_tracker.drop_replica(task.task_id, node_address)
+            result_tracker.mark_dispatched(task.task_id)
+    return {
+        'placements': [
+            {'task_id': task.task_id, 'executor': node_address, 'agreed_price': price}
+            for node_address, node_bin in placements.items() for task, price in node_bin['tasks']
+        ],
+        'unplaced': [task.task_id for task in unplaced],
+        'expired': [task.task_id for task in expired],
+        'dispatch': dispatch,
+    }
+
+def record_dispatch(node_address, reqs, now=None):
+    now = time.time() if now is None else now
+    with recent_dispatches_lock:
+        entries = recent_dispatches.setdefault(node_address, deque())
+        entries.append((now, reqs.get('cpu_cores', 0)))
+        while entries and now - entries[0][0] > RECENT_DISPATCH_WINDOW_S:
+            entries.popleft()
+
+def offer_load(offer, now=None):
+    """
+    Estimated load of an offer's node as a fraction of its cores: the CPU use the offer reported, plus the
+    cores of tasks we dispatched there after the offer was issued (which its stats cannot reflect yet).
+    """
+    now = time.time() if now is None else now
+    stats = offer.get('system_stats') or {}
+    cores = stats.get('cpu_cores_effective', stats.get('cpu_cores_logical', 0)) or 1
+    offer_ts = parse_utc_timestamp(offer.get('offer_timestamp_utc')) or now - RECENT_DISPATCH_WINDOW_S
+    since = max(offer_ts, now - RECENT_DISPATCH_WINDOW_S)
+    with recent_dispatches_lock:
+        dispatched = sum(c for t, c in recent_dispatches.get(offer['node_address'], ()) if t >= since)
+    return (stats.get('cpu_percent', 0) or 0) / 100.0 + dispatched / cores
+
+def power_of_d_order(eligible, d=P2C_CHOICES, count=1, rng=random):
+    """
+    Reorder ranked offers for power-of-d-choices placement: each of the first count positions goes to the
+    least loaded of d offers sampled uniformly from those not yet placed. The rest keep their ranked order
+    and serve as substitutes.
+    """
+    remaining = list(eligible)
+    now = time.time()
+    ordered = []
+    for _ in range(min(count, len(remaining))):
+        sample = rng.sample(range(len(remaining)), min(max(1, d), len(remaining)))
+        best = min(sample, key=lambda i: offer_load(remaining[i][0], now))
+        ordered.append(remaining.pop(best))
+    return ordered + remaining
+
+def retry_after_seconds(resp, default=RETRY_AFTER_DEFAULT_S):
+    try:
+        return max(0, int(resp.headers.get('Retry-After', default)))
+    except (TypeError, ValueError):
+        return default
+
+def note_backpressure(node_address, retry_after):
+    with node_backoff_lock:
+        node_backoff[node_address] = max(node_backoff.get(node_address, 0), time.time() + retry_after)
+    print(f"[SCHEDULER] {node_address} is saturated; placing elsewhere for {retry_after}s")
+
+def is_backed_off(node_address, now=None):
+    with node_backoff_lock:
+        until = node_backoff.get(node_address)
+        if until is not None and until <= (time.time() if now is None else now):
+            del node_backoff[node_address]
+            until = None
+    return until is not None
+
+def deprioritize_backed_off(eligible):
+    """Move offers from nodes that recently pushed back to the end; they remain last-resort substitutes."""
+    now = time.time()
+    ready = [o for o in eligible if not is_backed_off(o[0]['node_address'], now)]
+    return ready + [o for o in eligible if is_backed_off(o[0]['node_address'], now)]
+
+def result_callback_url():
+    """Where executors report results for tasks this node schedules."""
+    return get_peer_url(node_info['ip'], node_info['port']) + "/task_result"
+
+def dispatch_to_offer(task_descriptor, offer, agreed_price, timeout=DISPATCH_TIMEOUT_S):
+    """
+    Place one replica of a task on an offer's node in two phases: reserve its resources under a lease,
+    then commit by sending the task with the lease_id. Returns a result entry, or an entry with 'error'.
+    """
+    try:
+        started = time.time()
+        leases, error = reserve_on_node(offer['node_address'], [task_descriptor], timeout)
+        if error:
+            return {'error': error}
+        if leases is not None and task_descriptor.task_id not in leases:
+            return {'error': f'Executor {offer["node_address"]} refused the reservation'}
+        lease_id = leases.get(task_descriptor.task_id) if leases else None
+        url = get_node_url(offer['node_address']) + "/execute_task"
+        append_log_entry(
+            event_type="TASK_SCHEDULED_TO_NODE_X",
+            task_id=task_descriptor.task_id,
+            node_id=offer['node_id'],
+            details={'executor': offer['node_address'], 'agreed_price': agreed_price, 'lease_id': lease_id}
+        )
+        body = dict(task_descriptor.to_dict(), lease_id=lease_id)
+        remaining = max(0.1, timeout - (time.time() - started))
+        # Expected before it is sent: a fast executor may report its result before the commit returns
+        result_tracker.expect_replica(task_descriptor.task_id, offer['node_address'])
+        try:
+            if lease_id is not None:
+                # A commit must come from the session that holds the lease
+                from auth import session_post
+                resp = session_post(url, body, timeout=remaining, verify=False)
+            else:
+                resp = requests.post(url, json=body, timeout=remaining, verify=False)
+        except Exception:
+            result_tracker.drop_replica(task_descriptor.task_id, offer['node_address'])
+            raise
+        if resp.status_code == 200:
+            result = resp.json()
+            # The executor runs the task in the background; its result arrives later through /task_result
+            result_tracker.add_replica(task_descriptor.task_id, offer['node_address'], agreed_price)
+            record_dispatch(offer['node_address'], task_descriptor.resource_requirements)
+            append_log_entry(
+                event_type="TASK_ACCEPTED_BY_NODE_X",
                 task_id=task_descriptor.task_id,
                 node_id=offer['node_id'],
-                details={'executor': offer['node_address'], 'agreed_price': offer_tuple[1]}
+                details={'executor': offer['node_address'], 'agreed_price': agreed_price}
             )
-            resp = requests.post(url, json=task_descriptor.to_dict(), timeout=10)
-            if resp.status_code == 200:
-                result = resp.json()
-                expected_checksum = task_descriptor.payload.get('expected_output_checksum')
-                actual_checksum = result.get('output_checksum')
-                checksum_valid = None
-                if expected_checksum:
-                    checksum_valid = (expected_checksum == actual_checksum)
-                    append_log_entry(
-                        event_type="TASK_RESULT_CHECKSUM_VERIFIED",
-                        task_id=task_descriptor.task_id,
-                        node_id=offer['node_id'],
-                        details={
-                            'expected_checksum': expected_checksum,
-                            'actual_checksum': actual_checksum,
-                            'checksum_valid': checksum_valid
-                        }
-                    )
-                append_log_entry(
-                    event_type="TASK_ACCEPTED_BY_NODE_X",
-                    task_id=task_descriptor.task_id,
-                    node_id=offer['node_id'],
-                    details={'executor': offer['node_address'], 'agreed_price': offer_tuple[1], 'checksum_valid': checksum_valid}
-                )
-                results.append({'task_id': task_descriptor.task_id, 'executor': offer['node_address'], 'agreed_price': offer_tuple[1], 'result': result, 'checksum_valid': checksum_valid})
-            else:
-                results.append({'error': f'Executor {offer["node_address"]} returned status {resp.status_code}', 'details': resp.text})
-        except Exception as e:
-            results.append({'error': f'Failed to dispatch task to {offer["node_address"]}: {e}'})
-    # Majority/consensus validation for redundant execution
+            return {'task_id': task_descriptor.task_id, 'executor': offer['node_address'], 'agreed_price': agreed_price, 'result': result}
+        result_tracker.drop_replica(task_descriptor.task_id, offer['node_address'])
+        if resp.status_code in (429, 503):
+            retry_after = retry_after_seconds(resp)
+            note_backpressure(offer['node_address'], retry_after)
+            return {'error': f'Executor {offer["node_address"]} is saturated', 'retry_after': retry_after, 'details': resp.text}
+        return {'error': f'Executor {offer["node_address"]} returned status {resp.status_code}', 'details': resp.text}
+    except Exception as e:
+        return {'error': f'Failed to dispatch task to {offer["node_address"]}: {e}'}
+
+def dispatch_replicas(task_descriptor, eligible, redundant_k=1, timeout=DISPATCH_TIMEOUT_S):
+    """
+    Dispatch redundant_k replicas (every eligible offer if redundant_k <= 0) concurrently under one shared
+    deadline. eligible is ranked best first; when a node rejects or fails, the next unused offer takes its
+    place while time remains. Returns one entry per attempt, in completion order.
+    """
+    target = redundant_k if redundant_k > 0 else len(eligible)
+    deadline = time.time() + timeout
+    spare = iter(eligible)
+    pending = {}
+    results = []
+    succeeded = 0
+
+    def launch_next():
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            return False
+        offer_tuple = next(spare, None)
+        if offer_tuple is None:
+            return False
+        offer, agreed_price = offer_tuple[0], offer_tuple[1]
+        pending[dispatch_pool.submit(dispatch_to_offer, task_descriptor, offer, agreed_price, remaining)] = offer
+        return True
+
+    for _ in range(target):
+        if not launch_next():
+            break
+    while pending:
+        done, _ = wait(pending, timeout=max(0.0, deadline - time.time()), return_when=FIRST_COMPLETED)
+        if not done:
+            for future, offer in pending.items():
+                future.cancel()
+                results.append({'error': f'Dispatch to {offer["node_address"]} missed the {timeout}s deadline'})
+            break
+        for future in done:
+            pending.pop(future)
+            entry = future.result()
+            results.append(entry)
+            if 'result' in entry:
+                succeeded += 1
+            elif succeeded + len(pending) < target and not launch_next():
+                print(f"[SCHEDULER] No substitute node for task {task_descriptor.task_id} "
+                      f"({succeeded + len(pending)}/{target} replicas)")
+    return results
+
+def schedule_task(task_descriptor, redundant_k=1, forecast_horizon_s=None, early_exit=False, max_offer_age_s=None,
+                  scoring_weights=None, placement='score', p2c_choices=P2C_CHOICES):
+    """
+    Basic scheduling: discover resource offers, filter by requirements, select best-fit, dispatch task.
+    Returns once the replicas are dispatched; results and consensus are tracked by result_tracker.
+    With forecast_horizon_s, nodes must also have predicted headroom for the task that far ahead.
+    max_offer_age_s tightens the freshness requirement on offers from the local view.
+    scoring_weights overrides scoring.DEFAULT_SCORING_WEIGHTS for this task.
+    placement='p2c' picks each replica as the least loaded of p2c_choices random feasible offers instead of
+    the best scored one, so independent schedulers working from the same offers do not herd onto one node.
+    """
+    # 1. Resource Discovery: local offer view, or the DHT while the view is still cold
+    if len(offer_view):
+        candidates = query_offer_view(task_descriptor, max_offer_age_s)
+    else:
+        candidates = [offer for offer, _ in discover_eligible_offers(task_descriptor, redundant_k, forecast_horizon_s, early_exit)]
+    # 2. Node Filtering & 3. Node Selection: vectorized feasibility and multi-criteria score, best first
+    eligible = rank_offers(
+        candidates,
+        task_descriptor.resource_requirements,
+        max_price=task_descriptor.max_price_usd,
+        weights=scoring_weights,
+        forecast_horizon_s=forecast_horizon_s,
+        rtt_ms=dict(peer_rtt_ms),
+        payload=task_descriptor.payload,
+    )
+    if placement == 'p2c':
+        eligible = power_of_d_order(eligible, p2c_choices, redundant_k if redundant_k > 0 else len(eligible))
+    eligible = deprioritize_backed_off(eligible)
+    # Redundant execution: send to multiple nodes if redundant_k > 1, concurrently
+    task_descriptor.callback_url = result_callback_url()
+    result_tracker.register(task_descriptor, redundant_k if redundant_k > 0 else len(eligible))
+    results = dispatch_replicas(task_descriptor, eligible, redundant_k)
+    result_tracker.mark_dispatched(task_descriptor.task_id)
+    if any('result' in r for r in results):
+        with speculation_lock:
+            speculation_candidates[task_descriptor.task_id] = {'task': task_descriptor, 'eligible': eligible, 'copies': 0}
+    # Consensus is evaluated by the result tracker as replicas report; see /tasks/<task_id>
+    status = result_tracker.snapshot(task_descriptor.task_id)
+    status_url = f"/tasks/{task_descriptor.task_id}"
     if redundant_k > 1:
-        # Count matching checksums
-        checksum_counts = {}
-        for r in results:
-            if 'result' in r and 'output_checksum' in r['result']:
-                cksum = r['result']['output_checksum']
-                checksum_counts[cksum] = checksum_counts.get(cksum, 0) + 1
-        # Find the most common checksum
-        if checksum_counts:
-            best_cksum = max(checksum_counts, key=checksum_counts.get)
-            majority_count = checksum_counts[best_cksum]
-            consensus = majority_count >= ((redundant_k // 2) + 1)
-            return {'redundant_results': results, 'consensus_checksum': best_cksum, 'consensus_count': majority_count, 'consensus_valid': consensus}
-        else:
-            return {'redundant_results': results, 'consensus_valid': False}
+        return {'task_id': task_descriptor.task_id, 'status': status['status'], 'status_url': status_url,
+                'redundant_results': results}
     # Non-redundant: return first successful or last error
     for r in results:
         if 'result' in r:
-            return r
+            return dict(r, status=status['status'], status_url=status_url)
     return results[-1] if results else {'error': 'No eligible nodes found for task requirements.'}
+
+def drop_expired_task(task_descriptor):
+    append_log_entry(
+        event_type="TASK_EXPIRED_BEFORE_DISPATCH",
+        task_id=task_descriptor.task_id,
+        node_id=os.getenv('NODE_ID', 'scheduler'),
+        details={'deadline_utc': task_descriptor.deadline_utc}
+    )
+    result_tracker.expire(task_descriptor.task_id, 'Deadline passed before dispatch')
+    print(f"[SCHEDULER] Dropped task {task_descriptor.task_id}: deadline passed before dispatch")
+
+def queue_worker():
+    """Serve the deadline queue: drop tasks whose deadline has passed, schedule the rest."""
+    while True:
+        entry = task_queue.pop()
+        task = entry['task']
+        remaining = task.seconds_until_deadline()
+        if remaining is not None and remaining <= 0:
+            drop_expired_task(task)
+            entry['future'].set_result({'task_id': task.task_id, 'error': 'Deadline passed before dispatch'})
+            continue
+        try:
+            result = schedule_task(task, **entry['options'])
+        except Exception as e:
+            print(f"[SCHEDULER] Scheduling task {task.task_id} failed: {e}")
+            result = {'task_id': task.task_id, 'error': f'Scheduling failed: {e}'}
+            result_tracker.fail(task.task_id, result['error'])
+        entry['future'].set_result(result)
+
+def start_scheduler_queue(workers=SCHEDULER_QUEUE_WORKERS):
+    threads = [threading.Thread(target=queue_worker, daemon=True) for _ in range(workers)]
+    for t in threads:
+        t.start()
+    return threads
+
+def cancel_replica(executor, task_id):
+    from auth import session_post
+    try:
+        resp = session_post(get_node_url(executor) + "/cancel_task", {'task_id': task_id}, timeout=CANCEL_TIMEOUT_S,
+                            verify=False)
+        print(f"[SCHEDULER] Cancel of task {task_id} on {executor}: {resp.status_code}")
+    except Exception as e:
+        print(f"[SCHEDULER] Could not cancel task {task_id} on {executor}: {e}")
+
+def cancel_outstanding_replicas(task_id):
+    """Once a task has its result, cancel the replicas still running it (slower copies and stragglers)."""
+    with speculation_lock:
+        speculation_candidates.pop(task_id, None)
+    for executor in result_tracker.outstanding_replicas(task_id):
+        dispatch_pool.submit(cancel_replica, executor, task_id)
+
+def launch_speculative_copies(now=None):
+    """
+    Re-execute stragglers: a running task that has taken longer than the p95 completion time of its workload
+    (its image) gets a copy on the unused eligible node expected to finish it soonest. The first result is kept.
+    """
+    now = time.time() if now is None else now
+    with speculation_lock:
+        for task_id in list(speculation_candidates):
+            if result_tracker.status(task_id) in TERMINAL_STATES + (None,):
+                del speculation_candidates[task_id]
+    completion_times = result_tracker.completion_times
+    launched = 0
+    for task_id, workload, first_dispatch, executors in result_tracker.running_tasks():
+        with speculation_lock:
+            candidate = speculation_candidates.get(task_id)
+            if candidate is None or candidate['copies'] >= MAX_SPECULATIVE_COPIES:
+                continue
+            threshold = completion_times.p95(workload)
+            if threshold is None or now - first_dispatch <= threshold:
+                continue
+            spare = [o for o in candidate['eligible'] if o[0]['node_address'] not in executors]
+            if not spare:
+                continue
+            offer_tuple = min(spare, key=lambda o: completion_times.expected(o[0]['node_address'], workload) or threshold)
+            candidate['copies'] += 1
+        append_log_entry(
+            event_type="TASK_SPECULATIVE_COPY_DISPATCHED",
+            task_id=task_id,
+            node_id=os.getenv('NODE_ID', 'scheduler'),
+            details={'executor': offer_tuple[0]['node_address'], 'elapsed_s': round(now - first_dispatch, 3),
+                     'p95_s': round(threshold, 3)}
+        )
+        dispatch_pool.submit(dispatch_to_offer, candidate['task'], offer_tuple[0], offer_tuple[1])
+        launched += 1
+    return launched
+
+def start_speculation_monitor(interval=SPECULATION_CHECK_INTERVAL_S):
+    def monitor():
+        while True:
+            try:
+                launch_speculative_copies()
+            except Exception as e:
+                print(f"[SCHEDULER] Speculation monitor error: {e}")
+            time.sleep(interval)
+    t = threading.Thread(target=monitor, daemon=True)
+    t.start()
+    return t
@@ -0,0 +1,153 @@
+import numpy as np
+from locality import locality_score
+
+# Weight per criterion; benefit criteria score higher when larger, cost criteria when smaller.
+# Requests may override any subset of these via scoring_weights.
+DEFAULT_SCORING_WEIGHTS = {
+    'cores': 1.0,
+    'free_ram': 1.0,
+    'cpu_percent': 1.0,
+    'price': 2.0,
+    'rtt': 0.5,
+    'headroom': 1.0,
+    'locality': 1.5,
+}
+BENEFIT_CRITERIA = ('cores', 'free_ram', 'headroom', 'locality')
+COST_CRITERIA = ('cpu_percent', 'price', 'rtt')
+DEFAULT_RTT_MS = 50.0  # assumed for peers we have not measured yet
+
+
+def scoring_weights_error(weights):
+    """Why a request's scoring_weights override is invalid, or None if it is usable (None means defaults)."""
+    if weights is None:
+        return None
+    if not isinstance(weights, dict):
+        return 'scoring_weights must be an object'
+    for name, weight in weights.items():
+        if name not in DEFAULT_SCORING_WEIGHTS:
+            return f"Unknown scoring criterion {name!r}; expected one of {', '.join(DEFAULT_SCORING_WEIGHTS)}"
+        if isinstance(weight, bool) or not isinstance(weight, (int, float)) or not np.isfinite(weight) or weight < 0:
+            return f"scoring_weights[{name!r}] must be a non-negative number"
+    return None
+
+
+def forecast_for_horizon(stats, horizon_s):
+    """
+    Forecast entry from an offer's stats covering horizon_s: the shortest advertised horizon that is at least
+    horizon_s, else the longest one. None if the offer carries no forecast.
+    """
+    forecast = stats.get('forecast') or {}
+    horizons = sorted((int(k.rstrip('s')), v) for k, v in forecast.items())
+    if not horizons:
+        return None
+    for horizon, entry in horizons:
+        if horizon >= horizon_s:
+            return entry
+    return horizons[-1][1]
+
+
+def pack_offers(offers, reqs, forecast_horizon_s=None, rtt_ms=None, payload=None):
+    """
+    Pack offers into column arrays, one row per offer.
+    Missing prices are NaN; headroom is the forecast CPU headroom in cores at forecast_horizon_s
+    (the shortest advertised horizon if None), falling back to the snapshot when an offer has no forecast.
+    locality is the share of the task payload's input and image the offer says its node already holds.
+    """
+    rtt_ms = rtt_ms or {}
+    n = len(offers)
+    cols = {name: np.empty(n) for name in ('cores', 'free_ram', 'cpu_percent', 'price', 'rtt', 'headroom', 'headroom_ram', 'locality')}
+    cpu_req = reqs.get('cpu_cores', 0)
+    ram_req = reqs.get('ram_gb', 0)
+    for i, offer in enumerate(offers):
+        stats = offer.get('system_stats') or {}
+        pricing = offer.get('pricing_parameters') or {}
+        cores = stats.get('cpu_cores_effective', stats.get('cpu_cores_logical', 0)) or 0
+        free_ram = stats.get('memory_available_gb', 0) or 0
+        cpu_percent = stats.get('cpu_percent', 0) or 0
+        cols['cores'][i] = cores
+        cols['free_ram'][i] = free_ram
+        cols['cpu_percent'][i] = cpu_percent
+        if 'cpu_per_hour_usd' in pricing and 'ram_gb_per_hour_usd' in pricing:
+            cols['price'][i] = pricing['cpu_per_hour_usd'] * cpu_req + pricing['ram_gb_per_hour_usd'] * ram_req
+        else:
+            cols['price'][i] = np.nan
+        cols['rtt'][i] = rtt_ms.get(offer.get('node_address'), DEFAULT_RTT_MS)
+        cols['locality'][i] = locality_score(offer.get('locality'), payload) if payload else 0.0
+        predicted = forecast_for_horizon(stats, forecast_horizon_s if forecast_horizon_s is not None else 0)
+        if predicted is not None:
+            cols['headroom'][i] = predicted['cpu_headroom_cores']
+            cols['headroom_ram'][i] = predicted['memory_headroom_gb']
+        else:
+            cols['headroom'][i] = cores * max(0.0, 100.0 - cpu_percent) / 100.0
+            cols['headroom_ram'][i] = free_ram
+    return cols
+
+
+def feasibility_mask(cols, reqs, max_price=None, forecast_horizon_s=None):
+    cpu_req = reqs.get('cpu_cores', 0)
+    ram_req = reqs.get('ram_gb', 0)
+    mask = (cols['cores'] >= cpu_req) & (cols['free_ram'] >= ram_req)
+    if max_price is not None:
+        # Offers without pricing are not excluded by price
+        mask &= np.isnan(cols['price']) | (cols['price'] <= max_price)
+    if forecast_horizon_s is not None:
+        mask &= (cols['headroom'] >= cpu_req) & (cols['headroom_ram'] >= ram_req)
+    return mask
+
+
+def _normalize(values):
+    """Min-max scale to [0, 1]; a constant column scales to zeros."""
+    lo, hi = np.nanmin(values), np.nanmax(values)
+    if not np.isfinite(lo) or hi - lo <= 0:
+        return np.zeros_like(values)
+    return (values - lo) / (hi - lo)
+
+
+def score_offers(cols, mask, weights=None):
+    """Weighted sum of normalized criteria over the feasible rows; infeasible rows score -inf."""
+    merged = dict(DEFAULT_SCORING_WEIGHTS)
+    merged.update(weights or {})
+    scores = np.full(mask.shape, -np.inf)
+    if not mask.any():
+        return scores
+    total = np.zeros(int(mask.sum()))
+    for name in BENEFIT_CRITERIA + COST_CRITERIA:
+        weight = float(merged.get(name, 0) or 0)
+        if weight == 0:
+            continue
+        values = cols[name][mask]
+        if name == 'price':
+            # Unpriced offers rank as the most expensive feasible offer
+            values = np.where(np.isnan(values), np.nanmax(values) if not np.isnan(values).all() else 0.0, values)
+        normalized = _normalize(values)
+        total += weight * (normalized if name in BENEFIT_CRITERIA else 1.0 - normalized)
+    scores[mask] = total
+    return scores
+
+
+def rank_offers(offers, reqs, max_price=None, weights=None, forecast_horizon_s=None, rtt_ms=None, top_k=None,
+                payload=None):
+    """
+    Score offers in one vectorized pass and return the best feasible ones as (offer, total_price, score),
+    best first. total_price is None for offers without pricing; top_k limits the result length.
+    With the task's payload, nodes already holding its input or image score higher.
+    """
+    if not offers:
+        return []
+    cols = pack_offers(offers, reqs, forecast_horizon_s, rtt_ms, payload)
+    mask = feasibility_mask(cols, reqs, max_price, forecast_horizon_s)
+    scores = score_offers(cols, mask, weights)
+    feasible = int(mask.sum())
+    if feasible == 0:
+        return []
+    k = feasible if top_k is None else min(top_k, feasible)
+    if k < len(scores):
+        top = np.argpartition(-scores, k - 1)[:k]
+    else:
+        top = np.arange(len(scores))
+    top = top[np.argsort(-scores[top], kind='stable')]
+    ranked = []
+    for i in top:
+        price = cols['price'][i]
+        ranked.append((offers[i], None if np.isnan(price) else float(price), float(scores[i])))
+    return ranked
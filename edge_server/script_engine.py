@@ -0,0 +1,377 @@
+import json
+import os
+import secrets
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import traceback
+from output_store import OUTPUT_DIR
+from metering import usage_summary
+
+try:
+    import resource  # POSIX only; elsewhere scripts run with the timeout alone
+except ImportError:
+    resource = None
+
+SCRIPT_POOL_SIZE = 4  # idle interpreters kept started and ready
+SCRIPT_MAX_JOBS_PER_WORKER = 50  # a reused worker is replaced after this many scripts
+SCRIPT_DEFAULT_TIMEOUT_S = 300
+SCRIPT_MAX_OPEN_FILES = 256
+SCRIPT_READ_CHUNK_BYTES = 64 * 1024
+SCRIPT_WORKER_FLAG = '--script-worker'  # frozen builds re-enter main.py with this to become a worker
+
+# As for warm containers: after a script its worker is retired ('per-task'), reused only for the same
+# requester ('per-requester'), or reused for anyone ('shared')
+ISOLATION_MODES = ('per-task', 'per-requester', 'shared')
+SCRIPT_POOL_ISOLATION = os.getenv('DSEF_SCRIPT_ISOLATION', 'per-task')
+
+# A python_script is arbitrary code run on the host, so the node accepts them only when its operator opts in.
+# A node running as root runs each script as SCRIPT_USER, away from the node's keys and files; otherwise
+# scripts run as the node's own user.
+SCRIPT_TASKS_ENABLED = os.getenv('DSEF_SCRIPT_TASKS', '0') == '1'
+SCRIPT_USER = os.getenv('DSEF_SCRIPT_USER', 'nobody')
+
+
+def _set_hard_limit(kind, value):
+    """Cap a limit for good: soft and hard both, so the script cannot raise it back."""
+    _, hard = resource.getrlimit(kind)
+    if hard != resource.RLIM_INFINITY:
+        value = min(value, hard)
+    resource.setrlimit(kind, (value, value))
+
+
+def _exit_code(e):
+    return e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+
+
+def _exec_script(job):
+    """Run the script in this process with its output already on fds 1 and 2; returns its exit code."""
+    sys.argv = ['script'] + [str(a) for a in job['args']]
+    try:
+        exec(compile(job['script'], '<task script>', 'exec'),
+             {'__name__': '__main__', 'INPUT_PATH': job['input_path']})
+        code = 0
+    except SystemExit as e:
+        code = _exit_code(e)
+    except BaseException:
+        # The script's own frames only, not this runner's
+        etype, value, tb = sys.exc_info()
+        traceback.print_exception(etype, value, tb.tb_next)
+        code = 1
+    sys.stdout.flush()
+    sys.stderr.flush()
+    return code
+
+
+def _enter_job(job):
+    """Point fds 1 and 2 at the job's output file and switch to its scratch directory and environment."""
+    out = os.open(job['output_path'], os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    os.dup2(out, 1)
+    os.dup2(out, 2)
+    os.close(out)
+    os.chdir(job['cwd'])
+    os.environ.clear()
+    os.environ.update(job['env'])
+
+
+def _drop_privileges(job):
+    """As root, become the unprivileged script user for good, owning only the job's scratch directory."""
+    if os.geteuid() != 0:
+        return
+    import pwd
+    user = pwd.getpwnam(job['user'])
+    os.chown(job['cwd'], user.pw_uid, user.pw_gid)
+    os.setgroups([])
+    os.setgid(user.pw_gid)
+    os.setuid(user.pw_uid)
+
+
+def _run_forked(job):
+    """
+    Run one script in a child forked from this clean worker, under hard limits set in the child and, on a
+    node running as root, as the unprivileged script user. The worker itself never runs task code, so
+    nothing a script does outlives it; usage is the child's own rusage.
+    """
+    started = time.time()
+    pid = os.fork()
+    if pid == 0:
+        code = 1
+        try:
+            os.closerange(3, os.sysconf('SC_OPEN_MAX'))  # the worker's job channel
+            _enter_job(job)
+            # Memory cap on top of what the forked interpreter already maps (Linux); CPU time backs up the timeout
+            if os.path.exists('/proc/self/statm'):
+                with open('/proc/self/statm') as f:
+                    mapped = int(f.read().split()[0]) * resource.getpagesize()
+                _set_hard_limit(resource.RLIMIT_AS, mapped + job['memory_bytes'])
+            _set_hard_limit(resource.RLIMIT_CPU, job['cpu_seconds'])
+            _set_hard_limit(resource.RLIMIT_NOFILE, SCRIPT_MAX_OPEN_FILES)
+            _drop_privileges(job)
+            code = _exec_script(job)
+        except BaseException:
+            traceback.print_exc()  # into the task's output
+        finally:
+            os._exit(code if 0 <= code <= 255 else 1)
+    _, status, usage = os.wait4(pid, 0)
+    code = -os.WTERMSIG(status) if os.WIFSIGNALED(status) else os.WEXITSTATUS(status)
+    # ru_inblock/ru_oublock count 512-byte blocks of storage I/O
+    return {'exit_code': code, 'usage': usage_summary(
+        (usage.ru_utime + usage.ru_stime) * 1e9, usage.ru_maxrss * 1024,
+        usage.ru_inblock * 512, usage.ru_oublock * 512, 0, 0, time.time() - started, 1)}
+
+
+def _run_inline(job):
+    """
+    Where fork is unavailable: run the script in the worker itself, which is then never reused. No memory
+    peak is reported, since the worker's own footprint cannot be told apart from the script's.
+    """
+    saved_fds = os.dup(1), os.dup(2)
+    saved_cwd = os.getcwd()
+    saved_env = dict(os.environ)
+    saved_argv = sys.argv
+    started = time.time()
+    try:
+        _enter_job(job)
+        code = _exec_script(job)
+        return {'exit_code': code, 'reusable': False,
+                'usage': usage_summary(0, None, 0, 0, 0, 0, time.time() - started, 1)}
+    finally:
+        sys.argv = saved_argv
+        os.environ.clear()
+        os.environ.update(saved_env)
+        os.chdir(saved_cwd)
+        os.dup2(saved_fds[0], 1)
+        os.dup2(saved_fds[1], 2)
+        for fd in saved_fds:
+            os.close(fd)
+
+
+def worker_main():
+    """
+    Worker process loop: one JSON job per line on stdin, one JSON reply per line back. The channel moves
+    off fds 0 and 1 first, since scripts write their output through fds 1 and 2.
+    """
+    requests_in = os.fdopen(os.dup(0), 'rb')
+    replies_out = os.fdopen(os.dup(1), 'wb')
+    devnull = os.open(os.devnull, os.O_RDWR)
+    os.dup2(devnull, 0)
+    os.dup2(devnull, 1)
+    run_job = _run_forked if hasattr(os, 'fork') and resource is not None else _run_inline
+    try:
+        replies_out.write(b'{"ready": true}\n')
+        replies_out.flush()
+        for line in requests_in:
+            replies_out.write(json.dumps(run_job(json.loads(line))).encode() + b'\n')
+            replies_out.flush()
+    except BrokenPipeError:
+        pass  # the executor went away
+
+
+def worker_command():
+    """
+    How to start a worker: this file under the same interpreter, or, in a PyInstaller build (where
+    sys.executable is the node itself), the node executable with SCRIPT_WORKER_FLAG.
+    """
+    if getattr(sys, 'frozen', False):
+        return [sys.executable, SCRIPT_WORKER_FLAG]
+    return [sys.executable, os.path.abspath(__file__)]
+
+
+class ScriptWorker:
+    """A warm interpreter running worker_main, started clean rather than forked from the executor."""
+    def __init__(self):
+        # Its own process group, so killing the worker also kills the script child it forked
+        self.process = subprocess.Popen(worker_command(), stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                        start_new_session=os.name == 'posix')
+        self.process.stdout.readline()  # ready: the interpreter has finished starting
+        self.jobs = 0
+        self.requester = None
+
+    def alive(self):
+        return self.process.poll() is None
+
+    def submit(self, job):
+        """Run a job; returns the worker's reply, or None if it died (killed on timeout or cancellation)."""
+        try:
+            self.process.stdin.write(json.dumps(job).encode() + b'\n')
+            self.process.stdin.flush()
+        except OSError:
+            return None
+        line = self.process.stdout.readline()
+        return json.loads(line) if line else None
+
+    def kill(self):
+        """Stop the worker and its script mid-run (timeout or cancellation); it is replaced, never reused."""
+        if os.name == 'posix':
+            try:
+                os.killpg(self.process.pid, signal.SIGKILL)
+            except (ProcessLookupError, PermissionError):
+                pass
+        elif self.alive():
+            self.process.kill()
+
+    def close(self):
+        self.kill()
+        self.process.wait(timeout=1)
+        self.process.stdin.close()
+        self.process.stdout.close()
+
+
+class ScriptPool:
+    """
+    Pre-started Python interpreters for python_script tasks. Workers are separate clean processes rather than
+    forks of the multi-threaded executor. Each script runs in a child forked from a warm worker, with hard
+    setrlimit caps (address space from ram_gb, CPU time, open files), a wall-clock timeout, a scratch
+    working directory and a minimal environment; its output goes to a file that the caller streams into the
+    task's spool. Whether a worker serves more than one task follows isolation, as for warm containers.
+    Workers that time out, are cancelled or fail are replaced.
+    """
+    def __init__(self, size=SCRIPT_POOL_SIZE, isolation=SCRIPT_POOL_ISOLATION):
+        if isolation not in ISOLATION_MODES:
+            raise ValueError(f"Unknown script pool isolation {isolation}")
+        self.size = size
+        self.isolation = isolation
+        self.idle = []
+        self.busy = 0
+        self.lock = threading.Lock()
+
+    def fill(self):
+        """Bring the idle pool up to size (in the background after each use)."""
+        while True:
+            with self.lock:
+                if len(self.idle) >= self.size:
+                    return
+            worker = ScriptWorker()
+            with self.lock:
+                self.idle.append(worker)
+
+    def acquire(self, requester_id):
+        with self.lock:
+            for worker in list(self.idle):
+                if not worker.alive():
+                    self.idle.remove(worker)
+                    worker.close()
+                elif self.isolation != 'per-requester' or worker.requester in (None, requester_id):
+                    self.idle.remove(worker)
+                    self.busy += 1
+                    worker.requester = requester_id
+                    return worker
+            self.busy += 1
+        # Pool exhausted: start one on demand
+        worker = ScriptWorker()
+        worker.requester = requester_id
+        return worker
+
+    def release(self, worker, reusable):
+        with self.lock:
+            self.busy -= 1
+            if reusable and self.isolation != 'per-task' and worker.jobs < SCRIPT_MAX_JOBS_PER_WORKER and \
+                    len(self.idle) < self.size:
+                self.idle.append(worker)
+                return
+        worker.close()
+        threading.Thread(target=self.fill, daemon=True).start()
+
+    @staticmethod
+    def _stage(scratch, input_path):
+        """The task's input inside its scratch directory, like /input/input.data in a warm container."""
+        staged = os.path.join(scratch, 'input.data')
+        try:
+            os.link(input_path, staged)
+        except OSError:
+            shutil.copyfile(input_path, staged)
+        return staged
+
+    def run(self, task_id, requester_id, payload, reqs, input_path, spool, on_start=None):
+        """
+        Run a python_script payload ({'script', 'args', 'environment_vars', 'max_duration_seconds'}).
+        on_start receives the worker so the caller can kill it on cancellation. Streams the script's output
+        into spool and returns a result shaped like container.wait(), plus the script's 'usage' when it finished.
+        """
+        timeout = payload.get('max_duration_seconds', SCRIPT_DEFAULT_TIMEOUT_S)
+        os.makedirs(OUTPUT_DIR, exist_ok=True)
+        output_path = os.path.join(OUTPUT_DIR, f".script-{secrets.token_hex(8)}")
+        scratch = tempfile.mkdtemp(prefix='dsef-script-')
+        staged = self._stage(scratch, input_path) if input_path else None
+        env = {'PATH': os.defpath, 'HOME': scratch, 'TMPDIR': scratch, 'LANG': 'C.UTF-8'}
+        if os.environ.get('SYSTEMROOT'):
+            env['SYSTEMROOT'] = os.environ['SYSTEMROOT']  # Windows needs it to start anything
+        env.update({str(k): str(v) for k, v in payload.get('environment_vars', {}).items()})
+        if staged:
+            env['INPUT_PATH'] = staged
+        job = {
+            'script': payload['script'],
+            'args': payload.get('args', []),
+            'env': env,
+            'cwd': scratch,
+            'user': SCRIPT_USER,
+            'input_path': staged,
+            'output_path': output_path,
+            'memory_bytes': int(reqs.get('ram_gb', 1) * 1024 ** 3),
+            'cpu_seconds': int(timeout * max(1, reqs.get('cpu_cores', 1))) + 1,
+        }
+        worker = self.acquire(requester_id)
+        worker.jobs += 1
+        reusable = False
+        try:
+            if on_start:
+                on_start(worker)
+            started = time.time()
+            timer = threading.Timer(timeout, worker.kill)
+            timer.start()
+            try:
+                reply = worker.submit(job)
+            finally:
+                timer.cancel()
+            if reply is not None and reply['exit_code'] >= 0:
+                reusable = reply['exit_code'] == 0 and reply.get('reusable', True)
+                result = {'StatusCode': reply['exit_code'], 'Error': None, 'usage': reply['usage']}
+            elif time.time() - started >= timeout:
+                result = {'StatusCode': -1, 'Error': f'timed out after {timeout}s'}
+            elif reply is not None:
+                # The script was killed by a signal: over its CPU or memory limit
+                result = {'StatusCode': -1, 'Error': f"script killed by signal {-reply['exit_code']}",
+                          'usage': reply['usage']}
+            else:
+                result = {'StatusCode': -1, 'Error': 'script worker terminated'}
+            print(f"[SCRIPT] Task {task_id} ran in {time.time() - started:.3f}s")
+            if os.path.exists(output_path):
+                with open(output_path, 'rb') as f:
+                    spool.consume(iter(lambda: f.read(SCRIPT_READ_CHUNK_BYTES), b''))
+            return result
+        finally:
+            self.release(worker, reusable)
+            if os.path.exists(output_path):
+                os.remove(output_path)
+            shutil.rmtree(scratch, ignore_errors=True)
+
+    def snapshot(self):
+        with self.lock:
+            return {'isolation': self.isolation, 'idle': len(self.idle), 'busy': self.busy, 'size': self.size}
+
+
+script_pool = ScriptPool()
+
+
+def start_script_pool():
+    """
+    Start the python_script interpreters ahead of time so the first tasks do not pay for start-up
+    (only on nodes that accept python_script tasks, with DSEF_SCRIPT_TASKS=1).
+    """
+    if not SCRIPT_TASKS_ENABLED:
+        print("[SCRIPT] python_script tasks are disabled (set DSEF_SCRIPT_TASKS=1 to accept them)")
+        return None
+    if not hasattr(os, 'geteuid') or os.geteuid() != 0:
+        print("[SCRIPT] Warning: not running as root, so python_script tasks run as the node's own user "
+              "and can read its files and keys")
+    t = threading.Thread(target=script_pool.fill, daemon=True)
+    t.start()
+    return t
+
+
+if __name__ == '__main__':
+    worker_main()
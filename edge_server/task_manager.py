@@ -1,8 +1,21 @@
 import uuid
+import time
 from datetime import datetime, timezone
 
+def parse_utc_timestamp(value):
+    """Parse an ISO 8601 timestamp (naive values are taken as UTC) into epoch seconds; None if unparseable."""
+    if not value:
+        return None
+    try:
+        ts = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    return ts.timestamp()
+
 class TaskDescriptor:
-    def __init__(self, requester_id, task_type, payload, resource_requirements, max_price_usd, deadline_utc, submission_url, signature=None):
+    def __init__(self, requester_id, task_type, payload, resource_requirements, max_price_usd, deadline_utc, submission_url, signature=None, callback_url=None):
         self.task_id = str(uuid.uuid4())
         self.requester_id = requester_id
         self.task_type = task_type  # e.g., 'docker_image', 'python_script'
@@ -13,6 +26,14 @@ class TaskDescriptor:
         self.submission_url = submission_url
         self.timestamp_utc = datetime.utcnow().replace(tzinfo=timezone.utc).isoformat()
         self.signature = signature  # Optional, for future use
+        self.callback_url = callback_url  # scheduler's /task_result, set at dispatch
+
+    def seconds_until_deadline(self, now=None):
+        """Seconds left before deadline_utc (negative once passed), or None if the task has no usable deadline."""
+        deadline = parse_utc_timestamp(self.deadline_utc)
+        if deadline is None:
+            return None
+        return deadline - (time.time() if now is None else now)
 
     def to_dict(self):
         return {
@@ -26,11 +47,16 @@ class TaskDescriptor:
             "submission_url": self.submission_url,
             "timestamp_utc": self.timestamp_utc,
             "signature": self.signature,
+            "callback_url": self.callback_url,
         }
 
     @staticmethod
-    def from_dict(d):
-        return TaskDescriptor(
+    def from_dict(d, keep_identity=False):
+        """
+        Build a descriptor from a request body. A new submission always gets a fresh task_id and timestamp;
+        keep_identity is for descriptors dispatched by a scheduler, which already assigned them.
+        """
+        task = TaskDescriptor(
             requester_id=d["requester_id"],
             task_type=d["task_type"],
             payload=d["payload"],
@@ -38,5 +64,14 @@ class TaskDescriptor:
             max_price_usd=d["max_price_usd"],
             deadline_utc=d["deadline_utc"],
             submission_url=d["submission_url"],
-            signature=d.get("signature")
+            signature=d.get("signature"),
+            callback_url=d.get("callback_url")
         )
+        if not keep_identity:
+            return task
+        # Keep the identity assigned upstream so scheduler and executor agree on task_id
+        if d.get("task_id"):
+            task.task_id = d["task_id"]
+        if d.get("timestamp_utc"):
+            task.timestamp_utc = d["timestamp_utc"]
+        return task
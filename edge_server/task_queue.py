@@ -0,0 +1,136 @@
+from concurrent.futures import Future
+from collections import deque
+from task_manager import parse_utc_timestamp
+import heapq
+import itertools
+import math
+import threading
+import time
+
+SLACK_BOOST_S = 5.0  # tasks with less slack than this jump ahead of earlier deadlines
+MAX_QUEUED_TASKS = 1000
+DRAIN_WINDOW_S = 60  # drain rate is measured over this window
+RETRY_AFTER_DEFAULT_S = 5  # Retry-After when nothing has drained recently
+RETRY_AFTER_MAX_S = 120
+
+
+def estimated_runtime(task_descriptor):
+    """Requester's runtime estimate for a task in seconds (payload estimated_duration_seconds), 0 if unknown."""
+    try:
+        return max(0.0, float(task_descriptor.payload.get('estimated_duration_seconds') or 0))
+    except (TypeError, ValueError):
+        return 0.0
+
+
+class DrainRateMeter:
+    """Rate at which a queue drains, from recent completion times; turns a backlog into a Retry-After."""
+    def __init__(self, window_s=DRAIN_WINDOW_S):
+        self.window_s = window_s
+        self.events = deque()
+        self.lock = threading.Lock()
+
+    def mark(self, now=None):
+        now = time.time() if now is None else now
+        with self.lock:
+            self.events.append(now)
+            self._trim(now)
+
+    def _trim(self, now):
+        while self.events and now - self.events[0] > self.window_s:
+            self.events.popleft()
+
+    def rate(self, now=None):
+        """Items drained per second over the window."""
+        now = time.time() if now is None else now
+        with self.lock:
+            self._trim(now)
+            return len(self.events) / self.window_s
+
+    def retry_after(self, backlog):
+        """Whole seconds until a backlog of this many items has drained at the current rate."""
+        rate = self.rate()
+        if rate <= 0:
+            return RETRY_AFTER_DEFAULT_S
+        return int(min(RETRY_AFTER_MAX_S, max(1, math.ceil(backlog / rate))))
+
+
+class DeadlineQueue:
+    """
+    Scheduler queue in earliest-deadline-first order with slack boosting.
+    A second heap orders tasks by latest start time (deadline minus estimated runtime); when the head of that
+    heap has less than boost_slack_s of slack left it is served first, otherwise the earliest deadline is.
+    Tasks without a deadline run after all deadline tasks, in arrival order.
+    """
+    def __init__(self, boost_slack_s=SLACK_BOOST_S, max_size=MAX_QUEUED_TASKS):
+        self.boost_slack_s = boost_slack_s
+        self.max_size = max_size
+        self.drained = DrainRateMeter()
+        self.entries = {}  # task_id -> entry
+        self.by_deadline = []  # heap of (deadline, seq, task_id)
+        self.by_latest_start = []  # heap of (latest_start, seq, task_id)
+        self.seq = itertools.count()
+        self.cond = threading.Condition()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def push(self, task_descriptor, options=None):
+        """
+        Queue a task; options are passed to schedule_task. Returns a Future for the scheduling result,
+        or None if the queue is full.
+        """
+        deadline = parse_utc_timestamp(task_descriptor.deadline_utc)
+        deadline = math.inf if deadline is None else deadline
+        latest_start = deadline - estimated_runtime(task_descriptor)
+        seq = next(self.seq)
+        entry = {
+            'task': task_descriptor,
+            'options': options or {},
+            'future': Future(),
+            'deadline': deadline,
+            'latest_start': latest_start,
+            'enqueued_at': time.time(),
+        }
+        with self.cond:
+            if len(self.entries) >= self.max_size:
+                return None
+            self.entries[task_descriptor.task_id] = entry
+            heapq.heappush(self.by_deadline, (deadline, seq, task_descriptor.task_id))
+            heapq.heappush(self.by_latest_start, (latest_start, seq, task_descriptor.task_id))
+            self.cond.notify()
+        return entry['future']
+
+    def _head(self, heap):
+        # Entries leave through either heap; skip ids already served through the other one
+        while heap and heap[0][2] not in self.entries:
+            heapq.heappop(heap)
+        return heap[0] if heap else None
+
+    def pop(self, timeout=None):
+        """Next entry to schedule, or None if nothing arrives within timeout."""
+        with self.cond:
+            if not self.cond.wait_for(lambda: self.entries, timeout):
+                return None
+            urgent = self._head(self.by_latest_start)
+            if urgent is not None and urgent[0] - time.time() < self.boost_slack_s:
+                heapq.heappop(self.by_latest_start)
+                task_id = urgent[2]
+            else:
+                self._head(self.by_deadline)
+                task_id = heapq.heappop(self.by_deadline)[2]
+            self.drained.mark()
+            return self.entries.pop(task_id)
+
+    def stats(self):
+        now = time.time()
+        with self.cond:
+            entries = list(self.entries.values())
+        deadlines = [e['deadline'] for e in entries if e['deadline'] != math.inf]
+        return {
+            'queued': len(entries),
+            'max_size': self.max_size,
+            'drain_rate_per_s': round(self.drained.rate(now), 3),
+            'with_deadline': len(deadlines),
+            'earliest_deadline_in_s': round(min(deadlines) - now, 3) if deadlines else None,
+            'oldest_wait_s': round(now - min(e['enqueued_at'] for e in entries), 3) if entries else None,
+        }
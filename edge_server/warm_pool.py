@@ -0,0 +1,284 @@
+import math
+import os
+import shutil
+import threading
+import time
+import uuid
+from collections import deque
+import docker
+from image_cache import get_docker_client, image_index
+from task_queue import DrainRateMeter
+
+WARM_POOL_ENABLED = os.getenv('DSEF_WARM_POOL', '1') == '1'
+WARM_POOL_DIR = os.path.join(os.path.dirname(__file__), 'warm_pool')
+WARM_POOL_LABEL = 'dsef.warm_pool'
+WARM_POOL_INTERVAL_S = 2.0
+WARM_DEMAND_WINDOW_S = 300  # task starts per image are counted over this window
+WARM_HOT_MIN_STARTS = 5  # an image is hot, and kept warm, after this many starts within the window
+WARM_MAX_PER_IMAGE = 4
+WARM_MAX_CONTAINERS = 16
+WARM_IDLE_TTL_S = 600  # idle warm containers of images no longer hot are destroyed after this long
+WARM_MAX_REUSES = 20
+RUNTIME_HISTORY = 50
+WARM_CREATE_BACKOFF_S = 10  # after a failed pre-create, wait this long (doubling per failure) before retrying
+WARM_CREATE_BACKOFF_MAX_S = 600
+
+# After a task, a warm container is destroyed ('per-task'), reused only for the same requester
+# ('per-requester'), or reused for anyone ('shared'); reuse never exceeds WARM_MAX_REUSES.
+ISOLATION_MODES = ('per-task', 'per-requester', 'shared')
+WARM_POOL_ISOLATION = os.getenv('DSEF_WARM_ISOLATION', 'per-task')
+
+
+class NotWarmable(Exception):
+    """The image can never be kept warm: it has no command to exec, or no sleep to idle on."""
+
+
+class WarmPool:
+    """
+    Pre-created containers for hot task images. A warm container runs a placeholder process and sits paused;
+    a task is handed over by staging its input into the container's mounted /input directory, raising its
+    limits to the task's resource_requirements, and running the image's own command with docker exec.
+    Pool size per image follows recent demand: start rate times typical runtime (Little's law), plus one.
+    """
+    def __init__(self, root=WARM_POOL_DIR, isolation=WARM_POOL_ISOLATION):
+        if isolation not in ISOLATION_MODES:
+            raise ValueError(f"Unknown warm pool isolation {isolation}")
+        self.root = root
+        self.isolation = isolation
+        self.idle = {}  # image -> list of warm containers ready for a task
+        self.creating = {}  # image -> containers being created
+        self.demand = {}  # image -> DrainRateMeter of task starts
+        self.runtimes = {}  # image -> recent run durations in seconds
+        self.commands = {}  # image -> (command, workdir, user), or None if the image cannot be run by exec
+        self.backoff = {}  # image -> (consecutive pre-create failures, time of the next attempt)
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def note_start(self, image_name):
+        with self.lock:
+            meter = self.demand.setdefault(image_name, DrainRateMeter(WARM_DEMAND_WINDOW_S))
+        meter.mark()
+
+    def note_runtime(self, image_name, duration_s):
+        with self.lock:
+            self.runtimes.setdefault(image_name, deque(maxlen=RUNTIME_HISTORY)).append(duration_s)
+
+    def target(self, image_name):
+        """Warm containers to keep for an image: zero unless it is hot."""
+        with self.lock:
+            meter = self.demand.get(image_name)
+            runtimes = sorted(self.runtimes.get(image_name, ()))
+        if meter is None or self.commands.get(image_name, ()) is None:
+            return 0
+        rate = meter.rate()
+        if rate * WARM_DEMAND_WINDOW_S < WARM_HOT_MIN_STARTS:
+            return 0
+        typical = runtimes[len(runtimes) // 2] if runtimes else 1.0
+        return min(WARM_MAX_PER_IMAGE, math.ceil(rate * typical) + 1)
+
+    def _command(self, client, image_name):
+        """The image's entrypoint and command, run by exec in place of the container's own process."""
+        if image_name not in self.commands:
+            config = client.images.get(image_name).attrs.get('Config') or {}
+            command = (config.get('Entrypoint') or []) + (config.get('Cmd') or [])
+            self.commands[image_name] = (command, config.get('WorkingDir') or None, config.get('User') or '') \
+                if command else None
+        return self.commands[image_name]
+
+    def _create(self, image_name):
+        client = get_docker_client()
+        image_index.acquire(image_name, 'never')
+        input_dir = os.path.join(self.root, uuid.uuid4().hex)
+        try:
+            os.makedirs(input_dir)
+            command = self._command(client, image_name)
+            if command is None:
+                raise NotWarmable('image has no entrypoint or command to exec')
+            try:
+                container = client.containers.run(
+                    image_name,
+                    entrypoint=['sleep', 'infinity'],
+                    command=[],
+                    volumes={input_dir: {'bind': '/input', 'mode': 'ro'}},
+                    labels={WARM_POOL_LABEL: '1'},
+                    detach=True,
+                )
+            except docker.errors.APIError as e:
+                # The runtime cannot start the placeholder: the image has no sleep binary on its PATH
+                if 'executable file not found' in str(e) or 'no such file or directory' in str(e):
+                    raise NotWarmable(f"image cannot run the placeholder process: {e}") from e
+                raise
+            try:
+                container.pause()
+            except Exception:
+                container.remove(force=True)
+                raise
+        except Exception:
+            shutil.rmtree(input_dir, ignore_errors=True)
+            image_index.release(image_name)
+            raise
+        return {'container': container, 'image': image_name, 'command': command, 'input_dir': input_dir,
+                'created_at': time.time(), 'idle_since': time.time(), 'uses': 0, 'requester': None}
+
+    def _destroy(self, warm):
+        try:
+            warm['container'].remove(force=True)
+        except Exception as e:
+            print(f"[WARM POOL] Error removing container for {warm['image']}: {e}")
+        shutil.rmtree(warm['input_dir'], ignore_errors=True)
+        image_index.release(warm['image'])
+
+    def take(self, image_name, requester_id):
+        """A warm container for the task, unpaused, or None (the task starts cold)."""
+        with self.lock:
+            idle = self.idle.get(image_name, [])
+            for i, warm in enumerate(idle):
+                if self.isolation != 'per-requester' or warm['requester'] in (None, requester_id):
+                    del idle[i]
+                    self.hits += 1
+                    break
+            else:
+                self.misses += 1
+                return None
+        try:
+            warm['container'].unpause()
+        except Exception as e:
+            print(f"[WARM POOL] Warm container for {image_name} unusable: {e}")
+            self._destroy(warm)
+            return None
+        warm['requester'] = requester_id
+        return warm
+
+    def run(self, warm, input_file_path, env_vars, reqs, timeout, spool):
+        """
+        Run the image's command in a warm container with the task's input and limits, streaming its output
+        into spool. Returns a result shaped like container.wait().
+        """
+        client = get_docker_client()
+        container = warm['container']
+        if input_file_path:
+            staged = os.path.join(warm['input_dir'], 'input.data')
+            try:
+                os.link(input_file_path, staged)
+            except OSError:
+                shutil.copyfile(input_file_path, staged)
+        ram_gb = reqs.get('ram_gb', 1)
+        container.update(mem_limit=f"{ram_gb}g", memswap_limit=f"{2 * ram_gb}g",
+                         cpu_period=100000, cpu_quota=int(reqs.get('cpu_cores', 1) * 100000))
+        command, workdir, user = warm['command']
+        exec_id = client.api.exec_create(container.id, command, environment=env_vars, workdir=workdir, user=user)
+        warm['uses'] += 1
+
+        def expire():
+            warm['timed_out'] = True
+            container.kill()
+        timer = threading.Timer(timeout, expire)
+        timer.start()
+        try:
+            spool.consume(client.api.exec_start(exec_id, stream=True))
+        finally:
+            timer.cancel()
+        if warm.get('timed_out'):
+            return {'StatusCode': -1, 'Error': f'timed out after {timeout}s'}
+        return {'StatusCode': client.api.exec_inspect(exec_id).get('ExitCode'), 'Error': None}
+
+    def give_back(self, warm, reusable=True):
+        """After a task: recycle the container if isolation allows and it is intact, else destroy it."""
+        staged = os.path.join(warm['input_dir'], 'input.data')
+        if os.path.exists(staged):
+            os.remove(staged)
+        if reusable and not warm.get('timed_out') and self.isolation != 'per-task' and warm['uses'] < WARM_MAX_REUSES:
+            try:
+                warm['container'].pause()
+                warm['idle_since'] = time.time()
+                with self.lock:
+                    self.idle.setdefault(warm['image'], []).append(warm)
+                return
+            except Exception as e:
+                print(f"[WARM POOL] Could not recycle container for {warm['image']}: {e}")
+        self._destroy(warm)
+
+    def maintain(self):
+        """Top up each hot image to its target and destroy idle containers nobody needs."""
+        with self.lock:
+            images = set(self.demand) | set(self.idle)
+            total = sum(len(c) for c in self.idle.values()) + sum(self.creating.values())
+        now = time.time()
+        for image_name in images:
+            target = self.target(image_name)
+            backing_off = self.backoff.get(image_name, (0, 0.0))[1] > now
+            with self.lock:
+                idle = self.idle.setdefault(image_name, [])
+                if target == 0:
+                    surplus = [w for w in idle if now - w['idle_since'] > WARM_IDLE_TTL_S]
+                else:
+                    surplus = idle[target:]
+                for warm in surplus:
+                    idle.remove(warm)
+                missing = 0 if backing_off else \
+                    max(0, min(target - len(idle) - self.creating.get(image_name, 0), WARM_MAX_CONTAINERS - total))
+                self.creating[image_name] = self.creating.get(image_name, 0) + missing
+                total += missing - len(surplus)
+            for warm in surplus:
+                self._destroy(warm)
+            for _ in range(missing):
+                warm = None
+                failures, retry_at = self.backoff.get(image_name, (0, 0.0))
+                if retry_at <= time.time() and self.commands.get(image_name, ()) is not None:
+                    try:
+                        warm = self._create(image_name)
+                        self.backoff.pop(image_name, None)
+                    except NotWarmable as e:
+                        print(f"[WARM POOL] {image_name} cannot be kept warm: {e}")
+                        self.commands[image_name] = None
+                    except Exception as e:
+                        # Possibly transient (daemon busy, out of resources): retry later, backing off
+                        delay = min(WARM_CREATE_BACKOFF_MAX_S, WARM_CREATE_BACKOFF_S * 2 ** failures)
+                        self.backoff[image_name] = (failures + 1, time.time() + delay)
+                        print(f"[WARM POOL] Could not pre-create a container for {image_name}: {e}; retrying in {delay}s")
+                with self.lock:
+                    self.creating[image_name] -= 1
+                    if warm is not None:
+                        self.idle[image_name].append(warm)
+
+    def remove_stale(self):
+        """Remove warm containers left behind by an earlier run of this node."""
+        try:
+            for container in get_docker_client().containers.list(all=True, filters={'label': WARM_POOL_LABEL}):
+                container.remove(force=True)
+        except Exception as e:
+            print(f"[WARM POOL] Could not remove stale containers: {e}")
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def snapshot(self):
+        with self.lock:
+            images = set(self.demand) | set(self.idle)
+            snapshot = {'isolation': self.isolation, 'hits': self.hits, 'misses': self.misses, 'images': {}}
+        for image_name in images:
+            with self.lock:
+                idle = len(self.idle.get(image_name, []))
+                creating = self.creating.get(image_name, 0)
+            snapshot['images'][image_name] = {'idle': idle, 'creating': creating, 'target': self.target(image_name)}
+        return snapshot
+
+
+warm_pool = WarmPool()
+
+
+def start_warm_pool(interval=WARM_POOL_INTERVAL_S):
+    """Keep warm containers for hot images in the background (disabled with DSEF_WARM_POOL=0)."""
+    if not WARM_POOL_ENABLED:
+        return None
+    warm_pool.remove_stale()
+
+    def maintainer():
+        while True:
+            try:
+                warm_pool.maintain()
+            except Exception as e:
+                print(f"[WARM POOL] Maintenance error: {e}")
+            time.sleep(interval)
+    t = threading.Thread(target=maintainer, daemon=True)
+    t.start()
+    return t
@@ -13,7 +13,7 @@ a = Analysis([
         ('key.pem', '.'),
     ],
     hiddenimports=[
-        'flask', 'requests', 'pycryptodome', 'psutil', 'docker', 'flask_limiter'
+        'flask', 'requests', 'pycryptodome', 'psutil', 'docker', 'msgpack', 'numpy', 'flask_limiter'
     ],
     hookspath=[],
     runtime_hooks=[],
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The edge server is a flat set of modules run from edge_server/, not an installed package
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'edge_server'))
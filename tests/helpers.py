@@ -0,0 +1,23 @@
+from datetime import datetime, timedelta, timezone
+from task_manager import TaskDescriptor
+
+
+def make_task(cpu_cores=1, ram_gb=1, deadline_in_s=None, max_price_usd=None, payload=None, requester_id='requester'):
+    deadline = None
+    if deadline_in_s is not None:
+        deadline = (datetime.now(timezone.utc) + timedelta(seconds=deadline_in_s)).isoformat()
+    return TaskDescriptor(requester_id, 'docker_image', payload or {'image_name': 'alpine'},
+                          {'cpu_cores': cpu_cores, 'ram_gb': ram_gb}, max_price_usd, deadline, None)
+
+
+def make_offer(address, cores=4, free_ram=8, cpu_percent=10, pricing=None, forecast=None):
+    stats = {'cpu_cores_logical': cores, 'memory_available_gb': free_ram, 'cpu_percent': cpu_percent}
+    if forecast is not None:
+        stats['forecast'] = forecast
+    return {
+        'node_address': address,
+        'system_stats': stats,
+        'pricing_parameters': pricing if pricing is not None else {'cpu_per_hour_usd': 0.01, 'ram_gb_per_hour_usd': 0.005},
+        'offer_timestamp_utc': datetime.utcnow().isoformat(),
+        'offer_id': address,
+    }
@@ -0,0 +1,104 @@
+import os
+import time
+import pytest
+from Crypto.Hash import SHA256
+from Crypto.PublicKey import ECC
+from Crypto.Signature import DSS
+from flask import Flask
+import auth
+
+PEER = '10.0.0.2:5000'
+
+
+@pytest.fixture
+def app():
+    app = Flask(__name__)
+    auth.register_routes(app)
+    yield app
+    auth.sessions.clear()
+    auth.seen_nonces.clear()
+    auth.pinned_keys.clear()
+    auth.known_peers.pop(PEER, None)
+
+
+def open_session(peer_key, identifier=PEER):
+    """Server-side session for identifier, plus the key the peer derives for it."""
+    session_id, eph_pem = auth.create_session(identifier, peer_key.public_key())
+    key = auth._derive_session_key(session_id, static_priv=peer_key, eph_pub=ECC.import_key(eph_pem))
+    return session_id, key
+
+
+def mac_headers(session_id, key, path, body, timestamp=None, nonce=None):
+    timestamp = timestamp or f"{time.time():.3f}"
+    nonce = nonce or os.urandom(8).hex()
+    return {auth.SESSION_HEADER: session_id, auth.TIMESTAMP_HEADER: timestamp, auth.NONCE_HEADER: nonce,
+            auth.MAC_HEADER: auth.compute_mac(key, timestamp, nonce, 'POST', path, body)}
+
+
+def verify(app, path, body, headers, **kwargs):
+    with app.test_request_context(path, method='POST', data=body, headers=headers):
+        return auth.verify_session_request(**kwargs)
+
+
+def test_both_sides_derive_the_same_session_key(app):
+    session_id, key = open_session(ECC.generate(curve='P-256'))
+    assert auth.sessions[session_id]['key'] == key
+    body = b'{"x": 1}'
+    assert verify(app, '/update_peer', body, mac_headers(session_id, key, '/update_peer', body)) == PEER
+    assert verify(app, '/update_peer', body, mac_headers(session_id, key, '/update_peer', body),
+                  expected_peer='10.0.0.3:5000') is None
+
+
+def test_tampered_or_foreign_requests_are_rejected(app):
+    session_id, key = open_session(ECC.generate(curve='P-256'))
+    body = b'{"x": 1}'
+    headers = mac_headers(session_id, key, '/update_peer', body)
+    assert verify(app, '/update_peer', b'{"x": 2}', headers) is None
+    assert verify(app, '/cancel_task', body, headers) is None
+    assert verify(app, '/update_peer', body, mac_headers(session_id, b'\x00' * 32, '/update_peer', body)) is None
+    assert verify(app, '/update_peer', body, {}) is None
+
+
+def test_stale_timestamps_and_expired_sessions_are_rejected(app):
+    session_id, key = open_session(ECC.generate(curve='P-256'))
+    body = b'{}'
+    stale = f"{time.time() - 2 * auth.MAC_CLOCK_SKEW:.3f}"
+    assert verify(app, '/update_peer', body, mac_headers(session_id, key, '/update_peer', body, stale)) is None
+    auth.sessions[session_id]['expires_at'] = time.time() - 1
+    assert verify(app, '/update_peer', body, mac_headers(session_id, key, '/update_peer', body)) is None
+
+
+def test_a_request_is_accepted_once(app):
+    session_id, key = open_session(ECC.generate(curve='P-256'))
+    body = b'{"task_id": "t"}'
+    headers = mac_headers(session_id, key, '/cancel_task', body)
+    assert verify(app, '/cancel_task', body, headers) == PEER
+    assert verify(app, '/cancel_task', body, headers) is None
+    assert verify(app, '/cancel_task', body, mac_headers(session_id, key, '/cancel_task', body)) == PEER
+
+
+def test_the_query_string_is_covered(app):
+    session_id, key = open_session(ECC.generate(curve='P-256'))
+    headers = mac_headers(session_id, key, '/chord/lookup_metadata?key=1', b'')
+    assert verify(app, '/chord/lookup_metadata?key=2', b'', headers) is None
+    assert verify(app, '/chord/lookup_metadata?key=1', b'', headers) == PEER
+
+
+def register_and_authenticate(client, peer_key):
+    ip, port = PEER.split(':')
+    identity = {'ip': ip, 'port': int(port), 'promised_capacity': 1}
+    response = client.post('/register', json=dict(identity, public_key=peer_key.public_key().export_key(format='PEM')))
+    if response.status_code != 200:
+        return response
+    challenge = response.get_json()['challenge']
+    signature = DSS.new(peer_key, 'fips-186-3').sign(SHA256.new(challenge.encode('utf-8')))
+    return client.post('/authenticate', json=dict(identity, signature=signature.hex()))
+
+
+def test_a_pinned_key_cannot_be_replaced(app):
+    client = app.test_client()
+    first, second = ECC.generate(curve='P-256'), ECC.generate(curve='P-256')
+    assert register_and_authenticate(client, first).status_code == 200
+    assert register_and_authenticate(client, first).status_code == 200
+    assert register_and_authenticate(client, second).status_code == 409
+    assert auth.peer_public_key(PEER) == first.public_key()
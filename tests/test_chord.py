@@ -0,0 +1,57 @@
+import time
+import pytest
+from Crypto.PublicKey import ECC
+from flask import Flask
+import auth
+import chord
+from offer_manager import create_signed_resource_offer
+
+NODE = {'ip': '10.0.0.4', 'port': 5000, 'chord_id': 42, 'current_load': 0}
+PEER = '10.0.0.4:5000'
+
+
+@pytest.fixture
+def app(monkeypatch):
+    monkeypatch.setattr(chord, 'is_successor_for_key', lambda key: True)
+    app = Flask(__name__)
+    chord.register_routes(app)
+    yield app
+    chord.self_dht_data_store.clear()
+    auth.sessions.clear()
+    auth.seen_nonces.clear()
+    auth.pinned_keys.clear()
+
+
+def store(client, body, session=None):
+    headers = {'Content-Type': chord.MSGPACK_MIMETYPE}
+    if session is not None:
+        session_id, key = session
+        timestamp, nonce = f"{time.time():.3f}", 'n' + str(time.time())
+        headers.update({auth.SESSION_HEADER: session_id, auth.TIMESTAMP_HEADER: timestamp, auth.NONCE_HEADER: nonce,
+                        auth.MAC_HEADER: auth.compute_mac(key, timestamp, nonce, 'POST', '/chord/store_metadata', body)})
+    return client.post('/chord/store_metadata', data=body, headers=headers)
+
+
+def authenticated(node_key):
+    assert auth.pin_peer_key(PEER, node_key.public_key())
+    session_id, eph_pem = auth.create_session(PEER, node_key.public_key())
+    return session_id, auth._derive_session_key(session_id, static_priv=node_key, eph_pub=ECC.import_key(eph_pem))
+
+
+def test_offer_is_stored_only_from_its_own_node(app):
+    node_key = ECC.generate(curve='P-256')
+    offer = create_signed_resource_offer(NODE, {'cpu_cores_logical': 4}, {}, node_key)
+    body = chord.encode_dht_update(42, offer)
+    client = app.test_client()
+    assert store(client, body).status_code == 401
+    assert chord.self_dht_data_store == {}
+    assert store(client, body, authenticated(node_key)).status_code == 200
+    assert [o['offer_id'] for o in chord.self_dht_data_store[42]] == [offer['offer_id']]
+
+
+def test_offer_signed_with_another_key_is_rejected(app):
+    node_key = ECC.generate(curve='P-256')
+    offer = create_signed_resource_offer(NODE, {}, {}, ECC.generate(curve='P-256'))
+    response = store(app.test_client(), chord.encode_dht_update(42, offer), authenticated(node_key))
+    assert response.status_code == 400
+    assert chord.self_dht_data_store == {}
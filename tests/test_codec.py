@@ -0,0 +1,19 @@
+from codec import pack, unpack
+
+
+def test_round_trip_keeps_bytes_and_strings_apart():
+    value = {'name': 'node', 'blob': b'\x00\x01', 'n': 3, 'ratio': 0.5, 'items': [1, 'two', None]}
+    assert unpack(pack(value)) == value
+
+
+def test_key_order_does_not_change_encoding():
+    assert pack({'a': 1, 'b': {'y': 2, 'x': 1}}) == pack({'b': {'x': 1, 'y': 2}, 'a': 1})
+
+
+def test_tuples_encode_as_lists():
+    assert pack((1, 2)) == pack([1, 2])
+    assert unpack(pack((1, 2))) == [1, 2]
+
+
+def test_floats_are_float64():
+    assert unpack(pack(0.1)) == 0.1
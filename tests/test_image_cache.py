@@ -0,0 +1,64 @@
+import pytest
+from image_cache import ImageIndex, LocalImageBackend
+
+
+def make_index(catalog, budget, **backend_args):
+    backend = LocalImageBackend(catalog, **backend_args)
+    return backend, ImageIndex(backend, disk_budget_bytes=budget, state_path=None)
+
+
+def test_pull_policies():
+    backend, index = make_index({'a': 10}, 100)
+    with pytest.raises(LookupError):
+        index.acquire('a', 'never')
+    index.acquire('a')
+    index.acquire('a')
+    assert backend.pulls == 1
+    index.acquire('a', 'always')
+    assert backend.pulls == 2
+    with pytest.raises(ValueError):
+        index.acquire('a', 'sometimes')
+
+
+def test_least_recently_used_unpinned_image_is_evicted():
+    evicted = []
+    backend, index = make_index({'a': 60, 'b': 60}, 100)
+    index.on_evict = evicted.append
+    index.acquire('a')
+    index.release('a')
+    index.acquire('b')
+    assert evicted == ['a']
+    assert 'a' not in backend.present and 'b' in backend.present
+
+
+def test_pinned_images_are_not_evicted():
+    backend, index = make_index({'a': 60, 'b': 60}, 100)
+    index.acquire('a')
+    index.acquire('b')
+    assert set(backend.present) == {'a', 'b'}
+    index.release('a')
+    assert set(backend.present) == {'b'}
+
+
+def test_host_images_are_used_but_never_evicted():
+    backend, index = make_index({'mine': 60}, 50)
+    backend.present['host'] = ('sha256:host', 500)
+    backend.present['host:latest'] = ('sha256:host', 500)
+    index.acquire('host')
+    index.release('host')
+    index.acquire('mine')
+    index.release('mine')
+    assert 'host' in backend.present and 'host:latest' in backend.present
+    assert 'mine' not in backend.present
+
+
+def test_labelled_images_are_managed_and_counted_once_per_digest():
+    backend, index = make_index({}, 1000, labelled={'tool', 'tool:v1'})
+    backend.present['tool'] = ('sha256:tool', 600)
+    backend.present['tool:v1'] = ('sha256:tool', 600)
+    index.acquire('tool')
+    index.release('tool')
+    assert index.managed_bytes() == 600
+    index.disk_budget_bytes = 100
+    index.release('tool')
+    assert backend.present == {}
@@ -0,0 +1,61 @@
+import hashlib
+import pytest
+from locality import BloomFilter, BLOOM_MIN_BITS, InputCache, locality_score
+
+
+def test_every_added_key_is_found():
+    keys = [f"url:http://example/{i}" for i in range(500)]
+    bloom = BloomFilter.for_keys(keys)
+    assert all(key in bloom for key in keys)
+
+
+def test_false_positive_rate_is_low():
+    bloom = BloomFilter.for_keys(f"key-{i}" for i in range(1000))
+    false_positives = sum(f"other-{i}" in bloom for i in range(10000))
+    assert false_positives / 10000 < 0.03
+
+
+def test_size_is_a_power_of_two_with_a_floor():
+    assert BloomFilter.for_keys([]).bits == BLOOM_MIN_BITS
+    bits = BloomFilter.for_keys(str(i) for i in range(1000)).bits
+    assert bits >= 10000 and bits & (bits - 1) == 0
+
+
+def test_summary_round_trip():
+    bloom = BloomFilter.for_keys(['image:alpine'])
+    restored = BloomFilter.from_summary(bloom.to_summary())
+    assert 'image:alpine' in restored
+    assert BloomFilter.from_summary(None) is None
+
+
+def test_locality_score_counts_input_and_image():
+    payload = {'input_data_url': 'http://example/in', 'image_name': 'alpine'}
+    locality = {
+        'inputs': BloomFilter.for_keys(['url:http://example/in']).to_summary(),
+        'images': BloomFilter.for_keys(['image:busybox']).to_summary(),
+    }
+    assert locality_score(locality, payload) == 0.5
+    assert locality_score(None, payload) == 0.0
+    assert locality_score(locality, {}) == 0.0
+
+
+@pytest.mark.parametrize('sha256', ['../../../secret.txt', 'A' * 64, 'a' * 63, '', 7])
+def test_malformed_input_hashes_are_rejected_before_lookup(tmp_path, sha256):
+    secret = tmp_path / 'secret.txt'
+    secret.write_bytes(b'secret')
+    cache = InputCache(root=str(tmp_path / 'cache' / 'inputs'))
+    with pytest.raises(ValueError):
+        cache.fetch('http://example/in', sha256)
+    assert cache.fetch_locks == {}
+
+
+def test_cached_input_is_found_by_hash(tmp_path):
+    cache = InputCache(root=str(tmp_path))
+    sha256 = hashlib.sha256(b'data').hexdigest()
+    cache._load_index()
+    with open(cache.object_path(sha256), 'wb') as f:
+        f.write(b'data')
+    path = cache.fetch('http://example/in', sha256)
+    assert path == cache.object_path(sha256) and cache.in_use == {sha256: 1}
+    cache.release(path)
+    assert cache.in_use == {}
@@ -0,0 +1,46 @@
+from Crypto.PublicKey import ECC
+from offer_manager import SignedOfferCache, offer_from_wire, verify_resource_offer
+
+NODE = {'ip': '10.0.0.1', 'port': 5000, 'chord_id': 7, 'promised_capacity': 10, 'current_load': 0}
+PRICING = {'cpu_per_hour_usd': 0.01, 'ram_gb_per_hour_usd': 0.005}
+KEY = ECC.generate(curve='P-256')
+
+
+def stats(cpu_percent=10.0, cpu_headroom=2.0):
+    return {'cpu_percent': cpu_percent, 'cpu_cores_logical': 4, 'memory_available_gb': 8.0, 'disk_free_gb': 50.0,
+            'forecast': {'60': {'cpu_headroom_cores': cpu_headroom, 'memory_headroom_gb': 6.0, 'cpu_percent': 5}}}
+
+
+def test_wire_form_verifies():
+    cache = SignedOfferCache()
+    offer = cache.get(NODE, stats(), PRICING, KEY)
+    received = offer_from_wire(cache.wire)
+    assert received['node_address'] == '10.0.0.1:5000' and received['node_id'] == 7
+    assert verify_resource_offer(received, KEY.public_key())
+    assert offer['system_stats']['forecast'] == {'60': {'cpu_headroom_cores': 2.0, 'memory_headroom_gb': 6.0}}
+
+
+def test_small_changes_reuse_the_signed_offer():
+    cache = SignedOfferCache()
+    offer = cache.get(NODE, stats(), PRICING, KEY)
+    assert cache.get(NODE, stats(cpu_percent=15, cpu_headroom=2.3), PRICING, KEY) is offer
+    assert cache.get(dict(NODE, current_load=0.5), stats(), PRICING, KEY) is offer
+    assert cache.signatures_issued == 1
+
+
+def test_material_changes_are_re_signed():
+    cache = SignedOfferCache()
+    offer = cache.get(NODE, stats(), PRICING, KEY)
+    for node, current in ((NODE, stats(cpu_percent=30)), (NODE, stats(cpu_headroom=0.5)),
+                          (dict(NODE, current_load=2), stats(cpu_headroom=0.5))):
+        resigned = cache.get(node, current, PRICING, KEY)
+        assert resigned is not offer
+        offer = resigned
+    assert cache.signatures_issued == 4
+
+
+def test_an_offer_near_its_ttl_is_re_signed():
+    cache = SignedOfferCache(ttl=100, refresh_margin=10)
+    offer = cache.get(NODE, stats(), PRICING, KEY)
+    cache.signed_at -= 95
+    assert cache.get(NODE, stats(), PRICING, KEY) is not offer
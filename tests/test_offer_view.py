@@ -0,0 +1,45 @@
+from datetime import datetime, timedelta
+from helpers import make_offer
+from offer_view import OfferView
+
+
+def signed_ago(offer, seconds):
+    offer['offer_timestamp_utc'] = (datetime.utcnow() - timedelta(seconds=seconds)).isoformat()
+    return offer
+
+
+def test_query_filters_on_resources_and_price():
+    view = OfferView()
+    view.upsert(make_offer('small:1', cores=1, free_ram=1))
+    view.upsert(make_offer('big:1', cores=8, free_ram=16))
+    view.upsert(make_offer('dear:1', cores=8, free_ram=16, pricing={'cpu_per_hour_usd': 5, 'ram_gb_per_hour_usd': 5}))
+    found = view.query(min_cores=4, min_ram_gb=8, max_unit_price=1)
+    assert [o['node_address'] for o in found] == ['big:1']
+
+
+def test_newer_offer_replaces_and_reindexes():
+    view = OfferView()
+    view.upsert(signed_ago(make_offer('a:1', cores=8), 60))
+    newer = make_offer('a:1', cores=1)
+    newer['offer_id'] = 'newer'
+    assert view.upsert(newer)
+    assert view.query(min_cores=4) == [] and len(view) == 1
+
+
+def test_freshness_follows_arrival_not_signing_time():
+    view = OfferView()
+    idle = signed_ago(make_offer('idle:1'), 200)
+    view.upsert(idle)
+    assert [o['node_address'] for o in view.query(max_age_s=30)] == ['idle:1']
+    view.received_at['idle:1'] -= 60
+    assert view.query(max_age_s=30) == []
+    view.upsert(dict(idle))  # the same signed offer, received again
+    assert len(view.query(max_age_s=30)) == 1
+
+
+def test_offers_past_their_signed_ttl_expire():
+    view = OfferView()
+    view.upsert(signed_ago(make_offer('dead:1'), 400))
+    view.upsert(make_offer('live:1'))
+    assert [o['node_address'] for o in view.query()] == ['live:1']
+    assert view.expire() == 1 and len(view) == 1
@@ -0,0 +1,51 @@
+import os
+from output_store import OutputSpool, OutputStore
+
+
+def test_small_output_stays_in_memory(tmp_path):
+    spool = OutputSpool('task', memory_bytes=16, root=str(tmp_path))
+    spool.consume([b'hello ', b'world'])
+    assert spool.file is None
+    assert spool.preview() == b'hello world'
+    assert spool.size == 11
+    assert os.listdir(tmp_path) == []
+
+
+def test_large_output_spills_with_full_checksum(tmp_path):
+    import hashlib
+    spool = OutputSpool('task', memory_bytes=4, root=str(tmp_path))
+    spool.consume([b'abc', b'defgh'])
+    spool.finish()
+    assert spool.file is not None
+    assert open(spool.path, 'rb').read() == b'abcdefgh'
+    assert spool.checksum == hashlib.sha256(b'abcdefgh').hexdigest()
+    spool.discard()
+    assert os.listdir(tmp_path) == []
+
+
+def test_output_beyond_max_bytes_is_truncated(tmp_path):
+    spool = OutputSpool('task', max_bytes=5, root=str(tmp_path))
+    spool.write(b'0123456789')
+    assert spool.truncated and spool.size == 5 and spool.preview() == b'01234'
+
+
+def test_store_keeps_outputs_under_generated_names(tmp_path):
+    store = OutputStore(root=str(tmp_path))
+    spool = OutputSpool('../escape', memory_bytes=1, root=str(tmp_path))
+    spool.write(b'output')
+    token = store.keep(spool)
+    path = store.lookup('../escape', token)
+    assert path is not None and os.path.dirname(path) == str(tmp_path)
+    assert '../escape' not in os.listdir(tmp_path)
+    assert store.lookup('../escape', 'wrong') is None
+
+
+def test_store_expires_oldest_beyond_max_bytes(tmp_path):
+    store = OutputStore(root=str(tmp_path), max_bytes=10)
+    tokens = {}
+    for task_id in ('first', 'second'):
+        spool = OutputSpool(task_id, memory_bytes=1, root=str(tmp_path))
+        spool.write(b'x' * 8)
+        tokens[task_id] = store.keep(spool)
+    assert store.lookup('first', tokens['first']) is None
+    assert store.lookup('second', tokens['second']) is not None
@@ -0,0 +1,22 @@
+from helpers import make_offer, make_task
+from packing import first_fit_decreasing
+
+
+def test_first_fit_decreasing_packs_and_reports_leftovers():
+    offers = [make_offer('a:1', cores=4, free_ram=4, cpu_percent=0),
+              make_offer('b:1', cores=2, free_ram=2, cpu_percent=0)]
+    tasks = [make_task(cpu_cores=3, ram_gb=1), make_task(cpu_cores=2, ram_gb=1),
+             make_task(cpu_cores=1, ram_gb=1), make_task(cpu_cores=8, ram_gb=1)]
+    placements, unplaced = first_fit_decreasing(tasks, offers)
+    placed = {address: sorted(t.resource_requirements['cpu_cores'] for t, _ in node['tasks'])
+              for address, node in placements.items()}
+    assert unplaced == [tasks[3]]
+    assert sorted(sum(placed.values(), [])) == [1, 2, 3]
+    for address, cores in placed.items():
+        assert sum(cores) <= (4 if address == 'a:1' else 2)
+
+
+def test_first_fit_decreasing_respects_max_price():
+    offers = [make_offer('a:1', pricing={'cpu_per_hour_usd': 1, 'ram_gb_per_hour_usd': 1})]
+    placements, unplaced = first_fit_decreasing([make_task(max_price_usd=0.5)], offers)
+    assert placements == {} and len(unplaced) == 1
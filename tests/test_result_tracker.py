@@ -0,0 +1,135 @@
+import pytest
+from helpers import make_task
+from metering import usage_summary
+from result_tracker import ResourceProfiles, ResultTracker
+
+
+def usage(cores, memory_gb, wall_s=10):
+    memory = None if memory_gb is None else memory_gb * 1024 ** 3
+    return usage_summary(cores * wall_s * 1e9, memory, 0, 0, 0, 0, wall_s, 3)
+
+
+def test_profile_needs_min_samples():
+    profiles = ResourceProfiles(min_samples=3)
+    for _ in range(2):
+        profiles.add('img', usage(1, 1), {'cpu_cores': 2, 'ram_gb': 4})
+    assert profiles.profile('img') is None
+    profiles.add('img', usage(1, 1), {'cpu_cores': 2, 'ram_gb': 4})
+    profile = profiles.profile('img')
+    assert profile['runs'] == 3
+    assert profile['cpu_cores_p50'] == 1.0
+    assert profile['ram_gb_p95'] == 1.0
+    assert profile['requested_ram_gb_p50'] == 4
+
+
+def test_profile_percentiles():
+    profiles = ResourceProfiles(min_samples=1)
+    for cores in range(1, 21):
+        profiles.add('img', usage(cores, cores), {})
+    profile = profiles.profile('img')
+    assert profile['cpu_cores_p50'] == 10.0
+    assert profile['cpu_cores_p95'] == 19.0
+
+
+def test_unattributed_memory_peaks_are_skipped():
+    profiles = ResourceProfiles(min_samples=2)
+    profiles.add('img', usage(1, None), {})
+    profiles.add('img', usage(1, 2), {})
+    profile = profiles.profile('img')
+    assert profile['runs'] == 2 and profile['ram_gb_p50'] == 2.0
+
+
+def test_unmeasured_runs_are_ignored():
+    profiles = ResourceProfiles(min_samples=1)
+    profiles.add('img', {'samples': 0, 'wall_s': 1.0}, {})
+    profiles.add('img', None, {})
+    assert profiles.profiles() == {}
+
+
+def test_register_never_moves_a_task_back():
+    tracker = ResultTracker()
+    task = make_task()
+    tracker.register(task, status='queued')
+    tracker.register(task)
+    tracker.add_replica(task.task_id, 'node:1')
+    tracker.register(task, status='queued')
+    assert tracker.status(task.task_id) == 'running'
+    tracker.expire(task.task_id, 'test')
+    tracker.register(task)
+    assert tracker.status(task.task_id) == 'expired'
+
+
+def test_unregister_drops_only_queued_tasks():
+    tracker = ResultTracker()
+    queued, running = make_task(), make_task()
+    tracker.register(queued, status='queued')
+    tracker.register(running)
+    tracker.unregister(queued.task_id)
+    tracker.unregister(running.task_id)
+    assert queued.task_id not in tracker.tasks
+    assert running.task_id in tracker.tasks
+
+
+def test_only_dispatched_executors_may_report():
+    tracker = ResultTracker()
+    task = make_task()
+    tracker.register(task)
+    with pytest.raises(PermissionError):
+        tracker.record_completion(task.task_id, 'intruder:1', {'status': 'completed', 'output_checksum': 'x'})
+    assert tracker.status(task.task_id) == 'dispatching'
+    tracker.expect_replica(task.task_id, 'node:1')
+    record = tracker.record_completion(task.task_id, 'node:1', {'status': 'completed', 'output_checksum': 'x'})
+    assert record['status'] == 'completed'
+
+
+def test_refused_replica_no_longer_holds_the_task_open():
+    tracker = ResultTracker()
+    task = make_task()
+    tracker.register(task, redundant_k=2)
+    tracker.expect_replica(task.task_id, 'node:1')
+    tracker.expect_replica(task.task_id, 'node:2')
+    tracker.add_replica(task.task_id, 'node:1')
+    tracker.mark_dispatched(task.task_id)
+    tracker.record_completion(task.task_id, 'node:1', {'status': 'completed', 'output_checksum': 'x'})
+    assert tracker.status(task.task_id) == 'running'
+    tracker.drop_replica(task.task_id, 'node:2')
+    assert tracker.status(task.task_id) == 'no_consensus'
+
+
+def test_only_finished_tasks_are_evicted():
+    tracker = ResultTracker(max_tasks=2)
+    running, finished, newest = make_task(), make_task(), make_task()
+    tracker.register(running)
+    tracker.register(finished)
+    tracker.expire(finished.task_id, 'test')
+    tracker.register(newest)
+    assert list(tracker.tasks) == [running.task_id, newest.task_id]
+    tracker.register(make_task())
+    assert len(tracker.tasks) == 3 and running.task_id in tracker.tasks
+
+
+def test_failed_scheduling_ends_the_task_unless_it_is_running():
+    tracker = ResultTracker()
+    queued, running = make_task(), make_task()
+    tracker.register(queued, status='queued')
+    tracker.register(running)
+    tracker.add_replica(running.task_id, 'node:1')
+    tracker.fail(queued.task_id, 'Scheduling failed: boom')
+    tracker.fail(running.task_id, 'Scheduling failed: boom')
+    assert tracker.snapshot(queued.task_id)['error'] == 'Scheduling failed: boom'
+    assert tracker.wait_for_change(queued.task_id, 10 ** 6, 5)['status'] == 'failed'
+    assert tracker.status(running.task_id) == 'running'
+
+
+def test_completion_times_are_kept_per_image():
+    tracker = ResultTracker()
+    tracker.completion_times.min_samples = 2
+    for image, seconds in (('fast', 1), ('fast', 1), ('slow', 100), ('slow', 100)):
+        task = make_task(payload={'image_name': image})
+        tracker.register(task)
+        tracker.expect_replica(task.task_id, 'node:1')
+        tracker.tasks[task.task_id]['replicas']['node:1']['dispatched_at'] -= seconds
+        tracker.record_completion(task.task_id, 'node:1', {'status': 'completed', 'output_checksum': 'x'})
+    assert tracker.completion_times.p95('fast') == pytest.approx(1, abs=0.5)
+    assert tracker.completion_times.p95('slow') == pytest.approx(100, abs=0.5)
+    assert tracker.completion_times.p95('docker_image') is None
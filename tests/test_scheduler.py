@@ -0,0 +1,64 @@
+from concurrent.futures import Future
+import pytest
+from flask import Flask
+import scheduler
+
+SUBMISSION = {
+    'requester_id': 'requester',
+    'task_type': 'docker_image',
+    'payload': {'image_name': 'alpine'},
+    'resource_requirements': {'cpu_cores': 1, 'ram_gb': 1},
+    'max_price_usd': None,
+    'deadline_utc': None,
+    'submission_url': None,
+}
+
+
+@pytest.fixture
+def queued(monkeypatch):
+    """Captures the queue options of accepted submissions instead of scheduling them."""
+    options = []
+
+    def push(task, task_options=None):
+        options.append(task_options)
+        future = Future()
+        future.set_result({'task_id': task.task_id, 'status': 'running'})
+        return future
+    monkeypatch.setattr(scheduler, 'check_deadline_feasible', lambda task, horizon: None)
+    monkeypatch.setattr(scheduler.task_queue, 'push', push)
+    return options
+
+
+@pytest.fixture
+def client():
+    app = Flask(__name__)
+    app.register_blueprint(scheduler.scheduler_bp)
+    return app.test_client()
+
+
+@pytest.mark.parametrize('redundant_k', [0, -1, 1.5, '3', True])
+def test_invalid_redundant_k_is_rejected(client, queued, redundant_k):
+    response = client.post('/submit_task', json=dict(SUBMISSION, redundant_k=redundant_k))
+    assert response.status_code == 400
+    assert queued == []
+
+
+def test_redundant_k_reaches_the_scheduler(client, queued):
+    assert client.post('/submit_task', json=dict(SUBMISSION, redundant_k=3)).status_code == 200
+    assert client.post('/submit_task', json=SUBMISSION).status_code == 200
+    assert [o['redundant_k'] for o in queued] == [3, 1]
+
+
+@pytest.mark.parametrize('field, value', [
+    ('p2c_choices', 0), ('p2c_choices', 'two'), ('p2c_choices', 2.5),
+    ('max_offer_age_s', -1), ('max_offer_age_s', 'old'), ('max_offer_age_s', float('inf')),
+])
+def test_invalid_placement_options_are_rejected(client, queued, field, value):
+    response = client.post('/submit_task', json=dict(SUBMISSION, placement='p2c', **{field: value}))
+    assert response.status_code == 400
+    assert queued == []
+
+
+def test_batch_rejects_negative_offer_age(client):
+    response = client.post('/submit_tasks', json={'tasks': [SUBMISSION], 'max_offer_age_s': -5})
+    assert response.status_code == 400
@@ -0,0 +1,39 @@
+from helpers import make_offer
+from scoring import rank_offers, scoring_weights_error
+
+
+def test_infeasible_offers_are_excluded():
+    offers = [make_offer('a:1', cores=1), make_offer('b:1', cores=8)]
+    ranked = rank_offers(offers, {'cpu_cores': 2, 'ram_gb': 1})
+    assert [offer['node_address'] for offer, _, _ in ranked] == ['b:1']
+
+
+def test_price_limit_keeps_unpriced_offers():
+    offers = [make_offer('a:1', pricing={'cpu_per_hour_usd': 10, 'ram_gb_per_hour_usd': 10}),
+              make_offer('b:1', pricing={})]
+    ranked = rank_offers(offers, {'cpu_cores': 1, 'ram_gb': 1}, max_price=1)
+    assert [(offer['node_address'], price) for offer, price, _ in ranked] == [('b:1', None)]
+
+
+def test_cheaper_and_idler_node_ranks_first():
+    offers = [make_offer('busy:1', cpu_percent=90, pricing={'cpu_per_hour_usd': 0.1, 'ram_gb_per_hour_usd': 0.1}),
+              make_offer('idle:1', cpu_percent=5)]
+    ranked = rank_offers(offers, {'cpu_cores': 1, 'ram_gb': 1}, top_k=1)
+    assert ranked[0][0]['node_address'] == 'idle:1'
+
+
+def test_scoring_weights_validation():
+    assert scoring_weights_error(None) is None
+    assert scoring_weights_error({'price': 3, 'rtt': 0}) is None
+    assert scoring_weights_error(['price']) is not None
+    assert scoring_weights_error({'speed': 1}) is not None
+    assert scoring_weights_error({'price': -1}) is not None
+    assert scoring_weights_error({'price': 'high'}) is not None
+
+
+def test_forecast_headroom_applies_only_with_a_horizon():
+    forecast = {'60s': {'cpu_headroom_cores': 0.5, 'memory_headroom_gb': 8}}
+    offers = [make_offer('a:1', forecast=forecast)]
+    reqs = {'cpu_cores': 2, 'ram_gb': 1}
+    assert rank_offers(offers, reqs)
+    assert rank_offers(offers, reqs, forecast_horizon_s=60) == []
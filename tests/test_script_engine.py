@@ -0,0 +1,34 @@
+import os
+import pytest
+from output_store import OutputSpool
+from script_engine import ScriptPool
+
+
+def run_script(tmp_path, script, input_path=None):
+    pool = ScriptPool(size=0)
+    spool = OutputSpool('task', root=str(tmp_path))
+    result = pool.run('task', 'requester', {'script': script, 'max_duration_seconds': 30},
+                      {'cpu_cores': 1, 'ram_gb': 1}, input_path, spool)
+    return result, spool.preview().decode()
+
+
+def test_script_output_and_exit_code(tmp_path):
+    result, output = run_script(tmp_path, "print('hello')\nraise SystemExit(3)")
+    assert result['StatusCode'] == 3 and output == 'hello\n'
+
+
+def test_script_reads_its_staged_input(tmp_path):
+    data = tmp_path / 'input'
+    data.write_bytes(b'payload')
+    result, output = run_script(tmp_path, "print(open(INPUT_PATH).read())", str(data))
+    assert result['StatusCode'] == 0 and output == 'payload\n'
+
+
+@pytest.mark.skipif(not hasattr(os, 'geteuid') or os.geteuid() != 0, reason='drops privileges only as root')
+def test_script_cannot_read_the_nodes_private_files(tmp_path):
+    secret = tmp_path / 'node_key.pem'
+    secret.write_text('secret')
+    secret.chmod(0o600)
+    result, output = run_script(tmp_path, f"import os\nprint(os.getuid())\nprint(open({str(secret)!r}).read())")
+    assert result['StatusCode'] == 1
+    assert output.splitlines()[0] != '0' and 'PermissionError' in output
@@ -0,0 +1,34 @@
+from helpers import make_task
+from task_queue import DeadlineQueue
+
+
+def test_earliest_deadline_first_then_no_deadline():
+    queue = DeadlineQueue(boost_slack_s=0)
+    late, early, none = make_task(deadline_in_s=600), make_task(deadline_in_s=60), make_task()
+    for task in (none, late, early):
+        queue.push(task)
+    assert [queue.pop(0)['task'] for _ in range(3)] == [early, late, none]
+    assert queue.pop(0) is None
+
+
+def test_low_slack_task_is_boosted():
+    queue = DeadlineQueue(boost_slack_s=5)
+    early = make_task(deadline_in_s=60)
+    tight = make_task(deadline_in_s=100, payload={'image_name': 'alpine', 'estimated_duration_seconds': 98})
+    queue.push(early)
+    queue.push(tight)
+    assert queue.pop(0)['task'] is tight
+    assert queue.pop(0)['task'] is early
+
+
+def test_full_queue_refuses():
+    queue = DeadlineQueue(max_size=1)
+    assert queue.push(make_task()) is not None
+    assert queue.push(make_task()) is None
+    assert len(queue) == 1
+
+
+def test_options_travel_with_the_entry():
+    queue = DeadlineQueue()
+    queue.push(make_task(), {'placement': 'p2c'})
+    assert queue.pop(0)['options'] == {'placement': 'p2c'}